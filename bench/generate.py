@@ -0,0 +1,196 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from argparse import ArgumentParser, Namespace
+from collections.abc import Iterator
+from datetime import date, datetime, timedelta
+from logging import INFO, StreamHandler, getLogger
+from pathlib import Path
+from random import Random
+from sys import stdout
+
+from pytz import utc
+
+from k1insights.common.batch import SessionBatch
+from k1insights.common.constants import LOCATIONS, HeatSession, K1Location
+from k1insights.common.db import K1DB
+
+
+KARTS = 40
+# Heats start every ten minutes on each track while the location is open
+SLOT_MINUTES = 10
+FILL_RATE = 0.7
+RACE_TYPES = [0] * 17 + [1, 3, 5]
+BATCH_HEATS = 5000
+
+
+class SyntheticK1:
+    def __init__(self, sessions: int, seed: int = 0) -> None:
+        self.rng = Random(seed)
+        self.sessions = sessions
+        # Regulars come back week after week, so there are far fewer racers
+        # than sessions
+        self.racers = max(sessions // 25, 50)
+        self.skill = [self.rng.expovariate(1 / 1.5) for _ in range(self.racers)]
+        self.kart_pace = {
+            (loc["location"], track, kart): self.rng.gauss(0, 0.25)
+            for loc in LOCATIONS.values()
+            for track in range(1, loc["tracks"] + 1)
+            for kart in range(1, KARTS + 1)
+        }
+
+    def racer(self) -> int:
+        # Skewed so a few racers turn up far more often than the rest
+        return int(self.racers * self.rng.random() ** 2) + 1
+
+    def laps(self, base: float, pace: float, count: int) -> list[float]:
+        # A slow standing start, then laps scattered just above the racer's
+        # best with the odd spin or traffic jam
+        laps = [round(self.rng.gauss(45, 5), 3)]
+
+        for _ in range(count - 1):
+            lap = base + pace + abs(self.rng.gauss(0, 0.4))
+
+            if self.rng.random() < 0.05:
+                lap += self.rng.uniform(1, 6)
+            laps.append(round(lap, 3))
+
+        return laps
+
+    def heat(
+        self, loc: K1Location, track: int
+    ) -> tuple[list[HeatSession], dict[int, int]]:
+        rids = list({self.racer() for _ in range(self.rng.randint(6, 12))})
+        karts = dict(zip(rids, self.rng.sample(range(1, KARTS + 1), len(rids))))
+        base = 22 + 2 * (track - 1)
+        count = self.rng.randint(10, 16)
+        times = {
+            rid: self.laps(
+                base,
+                self.skill[rid - 1]
+                + self.kart_pace[(loc["location"], track, karts[rid])],
+                count,
+            )
+            for rid in rids
+        }
+
+        # Positions are decided by total time at the end of each lap
+        totals = dict.fromkeys(rids, 0.0)
+        positions: dict[int, list[int]] = {rid: [] for rid in rids}
+
+        for lap in range(count):
+            for rid in rids:
+                totals[rid] += times[rid][lap]
+
+            for (pos, rid) in enumerate(sorted(rids, key=totals.__getitem__), 1):
+                positions[rid].append(pos)
+
+        sessions: list[HeatSession] = [
+            {
+                "name": f"Racer {rid}",
+                "rid": rid,
+                "pos": positions[rid][-1],
+                "score": 1200 + self.rng.randint(0, 800),
+                "lap_data": list(zip(times[rid], positions[rid])),
+            }
+            for rid in rids
+        ]
+
+        return (sessions, karts)
+
+    def batches(self, end: date) -> Iterator[SessionBatch]:
+        batch = SessionBatch()
+        heat_no = dict.fromkeys(LOCATIONS, 100000)
+        made = 0
+        day = end
+
+        # Works backwards from the end date until enough sessions exist
+        while made < self.sessions:
+            day -= timedelta(days=1)
+
+            for (key, loc) in LOCATIONS.items():
+                (open_hour, close_hour) = loc["hours"]
+                opening = loc["tz"].localize(
+                    datetime(day.year, day.month, day.day, open_hour)
+                )
+
+                for slot in range((close_hour - open_hour) * 60 // SLOT_MINUTES):
+                    for track in range(1, loc["tracks"] + 1):
+                        if made >= self.sessions or self.rng.random() > FILL_RATE:
+                            continue
+
+                        (sessions, karts) = self.heat(loc, track)
+                        heat_no[key] -= 1
+                        made += batch.add_heat(
+                            {
+                                "location": loc["location"],
+                                "heat_no": heat_no[key],
+                                "track": track,
+                                "time": (
+                                    opening + timedelta(minutes=SLOT_MINUTES * slot)
+                                ).astimezone(utc),
+                                "race_type": self.rng.choice(RACE_TYPES),
+                                "win_cond": 0,
+                            },
+                            sessions,
+                            karts,
+                        )
+
+                        if len(batch.heats) >= BATCH_HEATS:
+                            yield batch
+                            batch = SessionBatch()
+
+        if batch.heats:
+            yield batch
+
+
+def generate(dest: Path, sessions: int, seed: int = 0, end: date | None = None) -> None:
+    data = SyntheticK1(sessions, seed)
+
+    K1DB.create_db(dest)
+    db = K1DB.connect(getLogger(__name__), dest)
+    assert db is not None
+
+    K1DB.add_racers(db, [(rid, f"Racer {rid}") for rid in range(1, data.racers + 1)])
+
+    for batch in data.batches(end or datetime.now(utc).date()):
+        K1DB.add_heats(db, batch.heats)
+        K1DB.add_session_batch(db, batch)
+
+    K1DB.close(db)
+
+
+def main(args: list[str] | None = None) -> None:
+    parser = ArgumentParser(
+        description="Fill a new K1 database with deterministic synthetic races",
+    )
+    parser.add_argument("dest", type=Path, help="Database file to create")
+    parser.add_argument("-n", "--sessions", type=int, default=100000)
+    parser.add_argument("-s", "--seed", type=int, default=0)
+    parser.add_argument(
+        "-e",
+        "--end",
+        type=date.fromisoformat,
+        default=None,
+        help="Day after the last generated race, defaults to today",
+    )
+    parsed: Namespace = parser.parse_args(args)
+    logger = getLogger(__name__)
+    logger.addHandler(StreamHandler(stdout))
+    logger.setLevel(INFO)
+
+    if parsed.dest.exists():
+        parser.error(f"{parsed.dest} already exists")
+
+    generate(parsed.dest, parsed.sessions, parsed.seed, parsed.end)
+    logger.info("Generated %s session(s) in %s", parsed.sessions, parsed.dest)
+
+
+if __name__ == "__main__":
+    main()
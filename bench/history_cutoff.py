@@ -0,0 +1,108 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from argparse import ArgumentParser, Namespace
+from datetime import datetime, timedelta
+from pathlib import Path
+from timeit import repeat
+
+from pytz import utc
+
+from k1insights.backend.clubspeed import HistoryParser
+from k1insights.common.constants import HISTORY_CHUNK_SIZE, LOCATIONS
+
+
+SAMPLE = Path(__file__).parents[1].joinpath("test", "data", "history.html")
+
+ROW = """\t</tr><tr class="Normal" style="background-color:White;height:24px;">
+\t\t<td align="left" style="width:20%;"><a href="HeatDetails.aspx?HeatNo={heat}">\
+.STANDARD Race. - Kart {kart}</a></td><td align="center">
+                                {time}
+                            </td><td align="center" style="width:10%;">1500 (8)</td>\
+<td align="center" style="width:10%;">23.456</td><td align="center">
+                                1st
+                            </td>
+"""
+
+
+def synthetic_page(rows: int, newest: datetime) -> str:
+    sample = SAMPLE.read_text()
+    head = sample[: sample.index('\t</tr><tr class="Normal"')]
+    tail = sample[sample.rindex("\t</tr>\n</table>") :]
+    body = []
+
+    # A few heats a day, every day, newest first like the real thing
+    for idx in range(rows):
+        when = newest - timedelta(hours=8 * idx)
+        body.append(
+            ROW.format(
+                heat=10**6 - idx,
+                kart=idx % 40 + 1,
+                time=f"{when:%m/%d/%Y %I:%M %p}",
+            )
+        )
+
+    return head + "".join(body) + tail
+
+
+def parse_full(page: str, after: datetime) -> int:
+    parser = HistoryParser(LOCATIONS["atlanta"])
+    parser.feed(page)
+    return len([s for s in parser.data["sessions"]["Atlanta"] if s["time"] > after])
+
+
+def parse_cutoff(page: str, after: datetime, chunk: int) -> tuple[int, int]:
+    parser = HistoryParser(LOCATIONS["atlanta"])
+    parser.stop_at(after)
+    read = 0
+
+    for idx in range(0, len(page), chunk):
+        read += chunk
+        parser.feed(page[idx : idx + chunk])
+
+        if parser.done:
+            break
+
+    return (len(parser.data["sessions"]["Atlanta"]), min(read, len(page)))
+
+
+def main(args: list[str] | None = None) -> None:
+    parser = ArgumentParser(
+        description="Time racer history parsing with and without a cutoff",
+    )
+    parser.add_argument("-r", "--rows", type=int, default=10000)
+    parser.add_argument("-k", "--keep", type=int, default=30)
+    parser.add_argument("-n", "--number", type=int, default=5)
+    parsed: Namespace = parser.parse_args(args)
+
+    newest = datetime(2022, 4, 28, 1, 30, tzinfo=utc)
+    after = newest - timedelta(hours=8 * parsed.keep) + timedelta(minutes=1)
+    page = synthetic_page(parsed.rows, newest.astimezone(LOCATIONS["atlanta"]["tz"]))
+
+    full = min(repeat(lambda: parse_full(page, after), number=1, repeat=parsed.number))
+    cut = min(
+        repeat(
+            lambda: parse_cutoff(page, after, HISTORY_CHUNK_SIZE),
+            number=1,
+            repeat=parsed.number,
+        )
+    )
+    kept = parse_full(page, after)
+    (cut_kept, read) = parse_cutoff(page, after, HISTORY_CHUNK_SIZE)
+
+    assert kept == cut_kept == parsed.keep
+
+    print(f"{parsed.rows} rows, {len(page) / 1024:.0f}KiB, keeping {kept}")
+    print(f"full parse:   {full * 1000:8.2f}ms, read {len(page) / 1024:.0f}KiB")
+    print(f"cutoff parse: {cut * 1000:8.2f}ms, read {read / 1024:.0f}KiB")
+    print(f"speedup:      {full / cut:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
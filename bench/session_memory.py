@@ -0,0 +1,121 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from argparse import ArgumentParser, Namespace
+from collections.abc import Callable, Iterator
+from datetime import datetime, timedelta
+from random import Random
+from tracemalloc import get_traced_memory, start, stop
+from typing import Any
+
+from pytz import utc
+
+from k1insights.common.batch import SessionBatch
+from k1insights.common.constants import FullSession, HeatData
+
+
+def synthetic_heats(heats: int, racers: int, laps: int) -> Iterator[HeatData]:
+    rng = Random(0)
+    start_time = datetime(2022, 1, 1, tzinfo=utc)
+
+    # Generated lazily, so only what a build keeps hold of gets measured
+    for idx in range(heats):
+        yield {
+            "heat_id": idx,
+            "race_type": 0,
+            "win_cond": 0,
+            "time": start_time + timedelta(minutes=10 * idx),
+            "track": 1,
+            "sessions": [
+                {
+                    "name": f"Racer {rid}",
+                    "rid": idx * racers + rid,
+                    "pos": rid + 1,
+                    "score": 1200 + rid,
+                    "lap_data": [
+                        (round(rng.uniform(22, 28), 3), rng.randint(1, racers))
+                        for _ in range(laps)
+                    ],
+                }
+                for rid in range(racers)
+            ],
+        }
+
+
+def as_dicts(heats: Iterator[HeatData]) -> list[FullSession]:
+    return [
+        {
+            "rid": s["rid"],
+            "location": "Atlanta",
+            "track": h["track"],
+            "time": h["time"],
+            "kart": 1,
+            "score": s["score"],
+            "pos": s["pos"],
+            "times": s["lap_data"],
+        }
+        for h in heats
+        for s in h["sessions"]
+    ]
+
+
+def as_batch(heats: Iterator[HeatData]) -> SessionBatch:
+    batch = SessionBatch()
+
+    for h in heats:
+        batch.add_heat(
+            {
+                "location": "Atlanta",
+                "heat_no": h["heat_id"],
+                "track": h["track"],
+                "time": h["time"],
+                "race_type": h["race_type"],
+                "win_cond": h["win_cond"],
+            },
+            h["sessions"],
+            {s["rid"]: 1 for s in h["sessions"]},
+        )
+
+    return batch
+
+
+def measure(
+    build: Callable[[Iterator[HeatData]], Any], heats: Iterator[HeatData]
+) -> int:
+    start()
+    result = build(heats)
+    (used, _) = get_traced_memory()
+    stop()
+    del result
+
+    return used
+
+
+def main(args: list[str] | None = None) -> None:
+    parser = ArgumentParser(
+        description="Compare memory held per session by dicts and batches",
+    )
+    parser.add_argument("-H", "--heats", type=int, default=20000)
+    parser.add_argument("-r", "--racers", type=int, default=10)
+    parser.add_argument("-l", "--laps", type=int, default=14)
+    parsed: Namespace = parser.parse_args(args)
+
+    size = (parsed.heats, parsed.racers, parsed.laps)
+    sessions = parsed.heats * parsed.racers
+    dicts = measure(as_dicts, synthetic_heats(*size))
+    batch = measure(as_batch, synthetic_heats(*size))
+
+    print(f"{sessions} sessions of {parsed.laps} laps")
+    print(f"dicts: {dicts / sessions:8.0f} bytes/session")
+    print(f"batch: {batch / sessions:8.0f} bytes/session")
+    print(f"saved: {1 - batch / dicts:8.1%}")
+
+
+if __name__ == "__main__":
+    main()
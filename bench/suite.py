@@ -0,0 +1,317 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from argparse import ArgumentParser, Namespace
+from collections.abc import Callable
+from datetime import datetime, timedelta
+from itertools import count
+from json import dumps, loads
+from logging import getLogger
+from os import environ
+from pathlib import Path
+from platform import python_version
+from shutil import copyfile
+from sqlite3 import Connection, connect, sqlite_version
+from sys import exit
+from timeit import repeat
+from typing import Any
+
+from generate import SyntheticK1, generate
+from pytz import utc
+
+from k1insights.common.constants import (
+    KART_LOOKBACK_DAYS,
+    LOCATION_LOOKBACK_DAYS,
+    LOCATIONS,
+    FullSession,
+    HeatSession,
+)
+from k1insights.common.batch import SessionBatch
+from k1insights.common.db import K1DB
+
+
+BENCH_DIR = Path(__file__).parent
+DEFAULT_SIZES = [10000, 100000, 1000000]
+# Differences smaller than this are scheduling noise, whatever the ratio
+NOISE_FLOOR = 0.0005
+
+Bench = Callable[[], Any]
+
+
+def db_benches(db: Connection, scratch: Connection) -> dict[str, Bench]:
+    loc = next(iter(LOCATIONS.values()))["location"]
+    today = datetime.now(utc).date()
+    week = today - timedelta(days=LOCATION_LOOKBACK_DAYS)
+    fortnight = today - timedelta(days=KART_LOOKBACK_DAYS)
+    year = today - timedelta(days=365)
+    rid = db.execute("SELECT rid FROM sessions LIMIT 1").fetchone()[0]
+    newest = db.execute("SELECT MAX(heat_no) FROM heats").fetchone()[0]
+    heats = list(range(newest - 500, newest + 1))
+
+    mark = K1DB.watermark(db)
+    missed = list(range(newest + 1000000, newest + 1000050))
+    all_locations = [loc_data["location"] for loc_data in LOCATIONS.values()]
+
+    synthetic = SyntheticK1(1, seed=1)
+    future = count(1)
+
+    def next_heat() -> tuple[FullSession, list[HeatSession], dict[int, int]]:
+        # Each call makes a heat no one has seen, further in the future
+        loc_data = next(iter(LOCATIONS.values()))
+        (sessions, karts) = synthetic.heat(loc_data, 1)
+        offset = next(future)
+        heat: FullSession = {
+            "location": loc_data["location"],
+            "heat_no": newest + offset,
+            "track": 1,
+            "time": datetime.now(utc) + timedelta(days=1, minutes=offset),
+            "race_type": 0,
+            "win_cond": 0,
+        }
+
+        return (heat, sessions, karts)
+
+    def write_heat() -> None:
+        (heat, sessions, karts) = next_heat()
+        full: list[FullSession] = [
+            {
+                "rid": s["rid"],
+                "location": heat["location"],
+                "track": heat["track"],
+                "time": heat["time"],
+                "kart": karts[s["rid"]],
+                "score": s["score"],
+                "pos": s["pos"],
+                "times": s["lap_data"],
+            }
+            for s in sessions
+        ]
+
+        K1DB.add_racers(scratch, [(s["rid"], s["name"]) for s in sessions])
+        K1DB.add_heats(scratch, [heat])
+        K1DB.add_sessions(scratch, full)
+
+    def write_batch() -> None:
+        # A backfill's worth of heats, stored the way k1-add-racer stores them
+        batch = SessionBatch()
+
+        for _ in range(10):
+            batch.add_heat(*next_heat())
+
+        K1DB.add_heats(scratch, batch.heats)
+        K1DB.add_session_batch(scratch, batch)
+
+    def repair_pass() -> None:
+        K1DB.queue_repairs(scratch, loc, missed)
+        K1DB.finish_repairs(scratch, loc, missed, set(missed[::2]), 3)
+
+    return {
+        "location_ftd.week": lambda: K1DB.location_ftd(db, loc, week),
+        "location_ftd.year": lambda: K1DB.location_ftd(db, loc, year),
+        "location_ftd.kart": lambda: K1DB.location_ftd(db, loc, fortnight, 1, 1),
+        "location_top_karts": lambda: K1DB.location_top_karts(db, loc, week, 1, 5),
+        "location_karts": lambda: K1DB.location_karts(db, loc, week, 1),
+        "heat_gaps": lambda: K1DB.heat_gaps(db, loc, 500),
+        "repair_stats": lambda: K1DB.repair_stats(db, loc, 500),
+        "pending_repairs": lambda: K1DB.pending_repairs(db, loc, 500),
+        "get_cursor": lambda: K1DB.get_cursor(db, loc),
+        "racer_locations": lambda: K1DB.racer_locations(db, rid),
+        "followed_racers": lambda: K1DB.followed_racers(db),
+        "stored_heats": lambda: K1DB.stored_heats(db, loc, heats),
+        "neighbour_days": lambda: K1DB.neighbour_days(db, loc, 1, week, today),
+        "watermark": lambda: K1DB.watermark(db),
+        "changed_karts": lambda: K1DB.changed_karts(db, mark - 1000),
+        "add_heat": write_heat,
+        "add_session_batch": write_batch,
+        "repair_pass": repair_pass,
+        "save_cursor": lambda: K1DB.save_cursor(
+            scratch,
+            loc,
+            {"client_id": "bench", "message_id": "1", "last_heat": newest},
+        ),
+        "add_racer_locations": lambda: K1DB.add_racer_locations(
+            scratch, rid, all_locations, datetime.now(utc)
+        ),
+    }
+
+
+def view_benches(db_path: Path, cache_path: Path) -> dict[str, Bench]:
+    # The frontend finds its database when first imported
+    environ.setdefault("K1_DATA_DB", str(db_path))
+
+    import k1insights.frontend as frontend
+
+    frontend.DB_PATH = db_path
+    frontend.CACHE_PATH = cache_path
+    client = frontend.app.test_client()
+    key = next(iter(LOCATIONS))
+    year_ago = datetime.now(utc).date() - timedelta(days=365)
+    cache = connect(cache_path)
+
+    def cold(url: str) -> Bench:
+        # Emptied first, so every run works the page out from scratch
+        def get() -> Any:
+            with cache:
+                cache.execute("DELETE FROM results")
+            return client.get(url)
+
+        return get
+
+    client.get("/")
+
+    return {
+        "view.index": lambda: client.get("/"),
+        "view.location": cold(f"/locations/{key}"),
+        "view.location.older": cold(f"/locations/{key}?until={year_ago.isoformat()}"),
+        "view.location.cached": lambda: client.get(f"/locations/{key}"),
+        "view.kart": cold(f"/locations/{key}/karts/1"),
+    }
+
+
+def run_size(size: int, data_dir: Path, runs: int) -> dict[str, float]:
+    db_path = data_dir / f"k1-{size}.db"
+    scratch_path = data_dir / f"k1-{size}-scratch.db"
+
+    if not db_path.is_file():
+        print(f"Generating {size} sessions into {db_path}")
+        generate(db_path, size)
+
+    # Writes go to a throwaway copy, so every run reads the same data
+    copyfile(db_path, scratch_path)
+    logger = getLogger(__name__)
+    results: dict[str, float] = {}
+
+    def connect() -> None:
+        conn = K1DB.connect(logger, db_path)
+        assert conn is not None
+        K1DB.close(conn)
+
+    results["connect"] = min(repeat(connect, number=1, repeat=runs))
+
+    db = K1DB.connect(logger, db_path)
+    scratch = K1DB.connect(logger, scratch_path)
+    assert db is not None and scratch is not None
+
+    benches = db_benches(db, scratch)
+    benches.update(view_benches(db_path, data_dir / f"k1-{size}.cache"))
+
+    for (name, bench) in benches.items():
+        results[name] = min(repeat(bench, number=1, repeat=runs))
+
+    K1DB.close(db)
+    K1DB.close(scratch)
+    scratch_path.unlink()
+
+    return results
+
+
+def compare(
+    current: dict[str, dict[str, float]],
+    baseline: dict[str, dict[str, float]],
+    threshold: float,
+) -> list[str]:
+    regressions = []
+
+    for (size, results) in current.items():
+        for (name, took) in results.items():
+            before = baseline.get(size, {}).get(name)
+
+            if (
+                before is not None
+                and took > before * (1 + threshold)
+                and took - before > NOISE_FLOOR
+            ):
+                regressions.append(
+                    f"{name} at {size} sessions: {before * 1000:.2f}ms "
+                    f"-> {took * 1000:.2f}ms (+{took / before - 1:.0%})"
+                )
+
+    return regressions
+
+
+def main(args: list[str] | None = None) -> None:
+    parser = ArgumentParser(
+        description="Time every K1DB method and view against synthetic data",
+    )
+    parser.add_argument(
+        "-s",
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=DEFAULT_SIZES,
+        help="Numbers of sessions to benchmark against",
+    )
+    parser.add_argument("-r", "--runs", type=int, default=5)
+    parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Slowdown over the baseline that counts as a regression",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        type=Path,
+        default=BENCH_DIR / "baseline.json",
+        help="Results to compare against, defaults to the committed baseline",
+    )
+    parser.add_argument("-o", "--output", type=Path, default=None)
+    parser.add_argument(
+        "--save-baseline",
+        action="store_true",
+        help="Store these results as the new baseline",
+    )
+    parser.add_argument("--data-dir", type=Path, default=BENCH_DIR / "data")
+    parsed: Namespace = parser.parse_args(args)
+
+    parsed.data_dir.mkdir(parents=True, exist_ok=True)
+    current = {
+        str(size): run_size(size, parsed.data_dir, parsed.runs) for size in parsed.sizes
+    }
+
+    for (size, results) in current.items():
+        print(f"\n{size} sessions")
+        for (name, took) in results.items():
+            print(f"  {name:<20} {took * 1000:10.2f}ms")
+
+    output = parsed.output or BENCH_DIR / "results" / (
+        datetime.now(utc).strftime("%Y%m%dT%H%M%S") + ".json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    report = {
+        "created": datetime.now(utc).isoformat(),
+        "python": python_version(),
+        "sqlite": sqlite_version,
+        "results": current,
+    }
+    output.write_text(dumps(report, indent=2))
+    print(f"\nResults saved to {output}")
+
+    regressions: list[str] = []
+
+    if parsed.save_baseline:
+        parsed.baseline.write_text(dumps(report, indent=2))
+        print(f"Baseline saved to {parsed.baseline}")
+
+    elif parsed.baseline.is_file():
+        baseline = loads(parsed.baseline.read_text())["results"]
+        regressions = compare(current, baseline, parsed.threshold)
+
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+
+        if not regressions:
+            print(f"No regressions beyond {parsed.threshold:.0%} of the baseline")
+
+    exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
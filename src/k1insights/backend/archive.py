@@ -0,0 +1,129 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from hashlib import sha256
+from pathlib import Path
+from sqlite3 import connect
+from threading import Lock
+from time import time
+from typing import TypedDict
+from zlib import compress
+
+from k1insights.common.constants import ARCHIVE_PATH
+
+
+# Pages are mostly markup, which even the quickest level shrinks several times
+COMPRESS_LEVEL = 1
+# Stored under this instead of a parser, since live scoreboards are JSON
+SCOREBOARD_PAGE = "Scoreboard"
+
+
+class ArchivedPage(TypedDict):
+    id: int
+    parser: str
+    location: str
+    url: str
+    body: bytes
+
+
+class PageArchive:
+    def __init__(self, path: Path) -> None:
+        # Generous timeout since every watcher process may share the archive;
+        # pages are read by a worker pool's feeder thread during a reparse
+        self._db = connect(path, timeout=30, check_same_thread=False)
+        # Stored from worker threads, which mustn't interleave transactions
+        self._lock = Lock()
+
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS blobs (
+                    digest BLOB PRIMARY KEY,
+                    body BLOB NOT NULL
+                ) WITHOUT ROWID
+                """
+            )
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS pages (
+                    id INTEGER PRIMARY KEY,
+                    parser TEXT NOT NULL,
+                    location TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    fetched INTEGER NOT NULL,
+                    digest BLOB NOT NULL REFERENCES blobs(digest),
+                    UNIQUE (url, digest)
+                )
+                """
+            )
+
+    def store(self, parser: str, location: str, url: str, body: str) -> bool:
+        raw = body.encode()
+        digest = sha256(raw).digest()
+
+        with self._lock, self._db:
+            # Pages fetched again unchanged only cost a row, not another body
+            new = (
+                self._db.execute(
+                    "SELECT 1 FROM blobs WHERE digest = ?", (digest,)
+                ).fetchone()
+                is None
+            )
+
+            if new:
+                self._db.execute(
+                    "INSERT INTO blobs VALUES (?, ?)",
+                    (digest, compress(raw, COMPRESS_LEVEL)),
+                )
+
+            self._db.execute(
+                """
+                INSERT OR IGNORE
+                INTO pages (parser, location, url, fetched, digest)
+                VALUES (?, ?, ?, ?, ?)
+                """,
+                (parser, location, url, int(time()), digest),
+            )
+
+        return new
+
+    def pages(self, parser: str | None = None) -> Iterator[ArchivedPage]:
+        # Bodies stay compressed, so whoever parses them does the inflating
+        for (page_id, page_parser, location, url, body) in self._db.execute(
+            """
+            SELECT id, parser, location, url, body
+            FROM pages JOIN blobs USING (digest)
+            WHERE ?1 IS NULL OR parser = ?1
+            ORDER BY id
+            """,
+            (parser,),
+        ):
+            yield {
+                "id": page_id,
+                "parser": page_parser,
+                "location": location,
+                "url": url,
+                "body": body,
+            }
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_ARCHIVE: PageArchive | None = None
+
+
+def get_archive() -> PageArchive | None:
+    global _ARCHIVE
+
+    if _ARCHIVE is None and ARCHIVE_PATH is not None:
+        _ARCHIVE = PageArchive(ARCHIVE_PATH)
+
+    return _ARCHIVE
@@ -0,0 +1,145 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from asyncio import CancelledError
+from asyncio import TimeoutError as Timeout
+from logging import getLogger
+from time import monotonic
+from types import TracebackType
+
+from aiohttp import ClientConnectionError, ClientResponseError
+
+from k1insights.common.constants import (
+    BREAKER_COOLDOWN,
+    BREAKER_FAILURES,
+    BREAKER_MAX_COOLDOWN,
+)
+from k1insights.common.metrics import BREAKER_REJECTED, BREAKER_STATE
+
+
+LOG = getLogger(__name__)
+
+
+class BreakerState:
+    CLOSED = 0
+    OPEN = 1
+    HALF_OPEN = 2
+
+
+def is_outage(exc: BaseException) -> bool:
+    # Refused, reset or dropped mid-response, the server is just as unreachable
+    return isinstance(exc, (ClientConnectionError, Timeout)) or (
+        isinstance(exc, ClientResponseError) and exc.status >= 500
+    )
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        host: str,
+        threshold: int = BREAKER_FAILURES,
+        cooldown: float = BREAKER_COOLDOWN,
+        max_cooldown: float = BREAKER_MAX_COOLDOWN,
+    ) -> None:
+        self.host = host
+        self.threshold = max(threshold, 1)
+        self.base_cooldown = cooldown
+        self.max_cooldown = max(max_cooldown, cooldown)
+
+        self.state = BreakerState.CLOSED
+        self.failures = 0
+        self.cooldown = cooldown
+        self._opened_at = 0.0
+        self._probe_at: float | None = None
+        BREAKER_STATE.set(self.state, host)
+
+    def __enter__(self) -> CircuitBreaker:
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        # Any answer at all, even an error page, means the server is up
+        if exc is not None and is_outage(exc):
+            self.failure()
+        elif not isinstance(exc, CancelledError):
+            self.success()
+
+    def _set_state(self, state: int) -> None:
+        self.state = state
+        BREAKER_STATE.set(state, self.host)
+
+    def allow(self) -> bool:
+        now = monotonic()
+
+        if self.state == BreakerState.OPEN and now - self._opened_at >= self.cooldown:
+            self._set_state(BreakerState.HALF_OPEN)
+            LOG.info(
+                "Probing %s after %.0fs circuit cooldown", self.host, self.cooldown
+            )
+
+        if self.state == BreakerState.CLOSED:
+            result = True
+
+        # One request at a time tests the water; a probe that never reports
+        # back is given up on after a cooldown so the breaker can't wedge
+        elif self.state == BreakerState.HALF_OPEN and (
+            self._probe_at is None or now - self._probe_at >= self.cooldown
+        ):
+            self._probe_at = now
+            result = True
+
+        else:
+            BREAKER_REJECTED.inc(self.host)
+            result = False
+
+        return result
+
+    def success(self) -> None:
+        if self.state != BreakerState.CLOSED:
+            LOG.info("%s is responding again, closing circuit", self.host)
+            self._set_state(BreakerState.CLOSED)
+
+        self.failures = 0
+        self.cooldown = self.base_cooldown
+        self._probe_at = None
+
+    def failure(self) -> None:
+        self.failures += 1
+
+        if self.state == BreakerState.HALF_OPEN:
+            self.cooldown = min(self.cooldown * 2, self.max_cooldown)
+            self._trip()
+
+        elif self.state == BreakerState.CLOSED and self.failures >= self.threshold:
+            self._trip()
+
+    def _trip(self) -> None:
+        LOG.warning(
+            "%s unreachable after %s failure(s), pausing requests for %.0fs",
+            self.host,
+            self.failures,
+            self.cooldown,
+        )
+        self._set_state(BreakerState.OPEN)
+        self._opened_at = monotonic()
+        self._probe_at = None
+
+
+BREAKERS: dict[str, CircuitBreaker] = {}
+
+
+def breaker_for(host: str) -> CircuitBreaker:
+    if host not in BREAKERS:
+        BREAKERS[host] = CircuitBreaker(host)
+
+    return BREAKERS[host]
@@ -0,0 +1,115 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from logging import Logger
+from time import monotonic
+
+from pytz import utc
+
+from k1insights.common.constants import K1Location
+
+
+# Seconds between polls for each state the track can be in
+POLL_FAST = 2
+POLL_IDLE = 10
+POLL_RUNNING = 30
+POLL_CLOSED = 300
+
+# How long to keep polling fast for results after a race ends
+FAST_POLL_WINDOW = 120
+
+REPORT_INTERVAL = 3600
+
+
+class PollCadence:
+    def __init__(self, logger: Logger, loc: K1Location) -> None:
+        self._log = logger
+        self._loc = loc
+        self._race_running = False
+        self._finished_at: float | None = None
+        self._report_at = monotonic() + REPORT_INTERVAL
+
+        self.polls = 0
+        self.heats = 0
+        self.ingest_time = 0.0
+
+    def is_open(self, now: datetime) -> bool:
+        (open_hour, close_hour) = self._loc["hours"]
+        hour = now.astimezone(self._loc["tz"]).hour
+
+        if open_hour <= close_hour:
+            result = open_hour <= hour < close_hour
+        else:
+            result = hour >= open_hour or hour < close_hour
+
+        return result
+
+    def _until_open(self, now: datetime) -> float:
+        local = now.astimezone(self._loc["tz"])
+        opening = local.replace(
+            hour=self._loc["hours"][0], minute=0, second=0, microsecond=0
+        )
+
+        if opening <= local:
+            opening += timedelta(days=1)
+
+        return (opening - local).total_seconds()
+
+    def finished(self) -> None:
+        if self._finished_at is None:
+            self._finished_at = monotonic()
+
+    def observe(self, race_running: bool, heat_pending: bool) -> None:
+        self.polls += 1
+        self._race_running = race_running
+
+        if heat_pending:
+            self.finished()
+        else:
+            self._finished_at = None
+
+    def ingested(self) -> None:
+        if self._finished_at is not None:
+            self.heats += 1
+            self.ingest_time += monotonic() - self._finished_at
+            self._finished_at = None
+
+    def delay(self, now: datetime | None = None) -> float:
+        now = now or datetime.now(utc)
+
+        if (
+            self._finished_at is not None
+            and monotonic() - self._finished_at < FAST_POLL_WINDOW
+        ):
+            result: float = POLL_FAST
+        elif self._race_running:
+            result = POLL_RUNNING
+        elif not self.is_open(now):
+            result = min(POLL_CLOSED, max(self._until_open(now), POLL_IDLE))
+        else:
+            result = POLL_IDLE
+
+        return result
+
+    def report(self) -> None:
+        if monotonic() >= self._report_at:
+            self._log.info(
+                "%s watcher made %s polls and ingested %s heat(s), "
+                "%.1fs average time to ingest",
+                self._loc["location"],
+                self.polls,
+                self.heats,
+                self.ingest_time / self.heats if self.heats else 0.0,
+            )
+
+            self.polls = 0
+            self.heats = 0
+            self.ingest_time = 0.0
+            self._report_at = monotonic() + REPORT_INTERVAL
@@ -7,36 +7,63 @@
 
 from __future__ import annotations
 
+from asyncio import Task
 from asyncio import TimeoutError as Timeout
-from asyncio import sleep
+from asyncio import create_task, shield, sleep
 from base64 import b64decode, b64encode
+from codecs import getincrementaldecoder
 from collections.abc import Coroutine, Iterator, ValuesView
-from datetime import date, datetime
+from datetime import datetime, timedelta
 from html.parser import HTMLParser
+from json import dumps
 from logging import Logger
-from sqlite3 import Connection
+from sqlite3 import Connection, DatabaseError
+from time import perf_counter
 from typing import Any, NoReturn, TypedDict, TypeVar, cast
 from uuid import uuid4
 
 from aiohttp import (
-    ClientConnectorError,
+    ClientConnectionError,
+    ClientResponse,
     ClientResponseError,
     ClientSession,
     TCPConnector,
 )
 from aioitertools.asyncio import gather_iter
+from anyio import to_thread
 from pytz import utc
 
+from k1insights.backend.archive import SCOREBOARD_PAGE, get_archive
+from k1insights.backend.breaker import breaker_for
+from k1insights.backend.cadence import PollCadence
+from k1insights.backend.scheduler import SCHEDULER, FetchPriority
+from k1insights.backend.spool import HeatSink, SpoolRecord
+from k1insights.common.batch import SessionBatch
 from k1insights.common.constants import (
+    HISTORY_CHUNK_SIZE,
+    HISTORY_STALE_ROWS,
     LOCATIONS,
+    MAX_CATCHUP_HEATS,
     MAX_CONCURRENT_TASKS,
     MAX_POOL_SIZE,
+    RACER_SWEEP_DAYS,
+    REPAIR_BATCH_SIZE,
     FullSession,
     HeatData,
     HeatSession,
     K1Location,
 )
 from k1insights.common.db import K1DB
+from k1insights.common.metrics import (
+    FETCH_COALESCED,
+    FETCH_ERRORS,
+    FETCH_NETWORK_SECONDS,
+    FETCH_PARSE_SECONDS,
+    PARSE_FAILURES,
+    POLL_SECONDS,
+    POLLS,
+    RETRIES,
+)
 
 
 class BasicSession(TypedDict):
@@ -49,12 +76,14 @@ class BasicSession(TypedDict):
 class HistoryData(TypedDict, total=False):
     name: str
     sessions: dict[str, list[BasicSession]]
+    locations: list[str]
 
 
 class RacerData(TypedDict, total=False):
     rid: int
     name: str
-    sessions: list[FullSession]
+    batch: SessionBatch
+    locations: list[str]
 
 
 class WinConditions:
@@ -73,6 +102,10 @@ class RaceTypes:
     BALL_CHALLENGE = 7
 
 
+class CutoffReached(Exception):
+    pass
+
+
 class HistoryParser(HTMLParser):
     def __init__(self, loc_data: K1Location):
         super().__init__()
@@ -80,10 +113,15 @@ class HistoryParser(HTMLParser):
         self._location = loc_data["location"]
         self._display_name = ""
         self._sessions: list[BasicSession] = []
+        self._after: datetime | None = None
+        self._stale_rows = 0
+        self._rows = 0
+        self.done = False
 
         self._getting_name = False
         self._getting_heat = False
         self._curr_col = 0
+        self._cell_text = ""
         self._curr_heat: int | None = None
         self._curr_kart: int | None = None
         self._curr_time: datetime | None = None
@@ -101,6 +139,42 @@ class HistoryParser(HTMLParser):
     def display_name(self) -> str:
         return self._display_name
 
+    @property
+    def raced(self) -> bool:
+        return self._rows > 0
+
+    def stop_at(self, after: datetime) -> None:
+        self._after = after
+
+    def feed(self, data: str) -> None:
+        if not self.done:
+            try:
+                super().feed(data)
+            except CutoffReached:
+                self.done = True
+
+    def _add_session(self, heat_id: int, kart: int, time: datetime) -> None:
+        self._rows += 1
+
+        if self._after is None or time > self._after:
+            self._stale_rows = 0
+            self._sessions.append(
+                {
+                    "location": self._location,
+                    "heat_id": heat_id,
+                    "kart": kart,
+                    "time": time,
+                }
+            )
+
+        else:
+            self._stale_rows += 1
+
+            # Rows are newest heat first, but times within a day aren't always
+            # in order, so only give up after a run of them are too old
+            if self._stale_rows >= HISTORY_STALE_ROWS:
+                raise CutoffReached
+
     def handle_starttag(self, tag: str, attrs: list[tuple[str, str | None]]) -> None:
         attr_dict = {k: v for (k, v) in attrs if v is not None}
 
@@ -120,20 +194,20 @@ class HistoryParser(HTMLParser):
         if self._getting_name and tag == "span":
             self._getting_name = False
 
+        # Cell text is only read once the cell closes, since a page fed in
+        # pieces can split it across several calls
+        if self._getting_heat and tag == "td":
+            if self._curr_col == 1:
+                self._curr_kart = int(self._cell_text.split()[-1])
+
+            elif self._curr_col == 2:
+                dt = datetime.strptime(self._cell_text.strip(), "%m/%d/%Y %I:%M %p")
+                self._curr_time = self._tz.localize(dt).astimezone(utc)
+
+            self._cell_text = ""
+
         if self._getting_heat and tag == "tr":
-            if (
-                self._curr_heat is not None
-                and self._curr_kart is not None
-                and self._curr_time is not None
-            ):
-                self._sessions.append(
-                    {
-                        "location": self._location,
-                        "heat_id": self._curr_heat,
-                        "kart": self._curr_kart,
-                        "time": self._curr_time,
-                    }
-                )
+            row = (self._curr_heat, self._curr_kart, self._curr_time)
 
             self._curr_kart = None
             self._curr_heat = None
@@ -141,16 +215,15 @@ class HistoryParser(HTMLParser):
             self._curr_col = 0
             self._getting_heat = False
 
+            if row[0] is not None and row[1] is not None and row[2] is not None:
+                self._add_session(row[0], row[1], row[2])
+
     def handle_data(self, data: str) -> None:
         if self._getting_name:
-            self._display_name = data
-
-        elif self._curr_col == 1:
-            self._curr_kart = int(data.split()[-1])
+            self._display_name += data
 
-        elif self._curr_col == 2:
-            dt = datetime.strptime(data.strip(), "%m/%d/%Y %I:%M %p")
-            self._curr_time = self._tz.localize(dt).astimezone(utc)
+        elif self._curr_col in (1, 2):
+            self._cell_text += data
 
 
 class HeatParser(HTMLParser):
@@ -361,6 +434,10 @@ class HeatParser(HTMLParser):
 
 ParserType = TypeVar("ParserType", HeatParser, HistoryParser)
 
+# Fetches currently on the wire, keyed by parser, url and history cutoff,
+# with their priority
+IN_FLIGHT: dict[tuple[str, str, datetime | None], tuple[int, Task[Any]]] = {}
+
 
 async def fetch_and_parse(
     logger: Logger,
@@ -368,31 +445,157 @@ async def fetch_and_parse(
     parser_class: type[ParserType],
     loc_data: K1Location,
     url: str,
+    priority: int = FetchPriority.BACKFILL,
+    after: datetime | None = None,
+) -> ParserType | None:
+    key = (parser_class.__name__, url, after)
+    flight = IN_FLIGHT.get(key)
+
+    # Only join a fetch queued at least as urgently, so live fetches never
+    # wait on a backfill's place in line
+    if flight is not None and flight[0] <= priority:
+        FETCH_COALESCED.inc(key[0])
+        task = flight[1]
+
+    else:
+        task = create_task(
+            _fetch_and_parse(
+                logger, session, parser_class, loc_data, url, priority, after
+            )
+        )
+        IN_FLIGHT[key] = (priority, task)
+
+        def _land(done: Task[Any]) -> None:
+            if IN_FLIGHT.get(key, (0, None))[1] is done:
+                del IN_FLIGHT[key]
+
+        task.add_done_callback(_land)
+
+    # Shielded so one caller giving up doesn't cancel the fetch for the rest
+    result: ParserType | None = await shield(task)
+    return result
+
+
+async def archive_page(
+    logger: Logger, page: str, location: str, url: str, body: str
+) -> None:
+    archive = get_archive()
+
+    # Kept before parsing, so pages a parser bug chokes on can be recovered;
+    # written from a thread, since the archive may be waiting on another process
+    if archive is not None:
+        try:
+            await to_thread.run_sync(archive.store, page, location, url, body)
+        except DatabaseError as e:
+            logger.warning("Could not archive %s: %s", url, e)
+
+
+async def stream_history(
+    res: ClientResponse, parser: HistoryParser
+) -> tuple[str, float]:
+    # get_encoding() wants the body already read, so guess from the headers only
+    decoder = getincrementaldecoder(res.charset or "utf-8")("replace")
+    body: list[str] = []
+    parsing = 0.0
+
+    # Parsed as it arrives, so the rest of the page is never downloaded once
+    # the parser has passed the cutoff
+    async for chunk in res.content.iter_chunked(HISTORY_CHUNK_SIZE):
+        body.append(decoder.decode(chunk))
+
+        start = perf_counter()
+        parser.feed(body[-1])
+        parsing += perf_counter() - start
+
+        if parser.done:
+            res.close()
+            break
+
+    else:
+        body.append(decoder.decode(b"", final=True))
+
+    FETCH_PARSE_SECONDS.observe(parsing, "HistoryParser")
+
+    return ("".join(body), parsing)
+
+
+async def _fetch_and_parse(
+    logger: Logger,
+    session: ClientSession,
+    parser_class: type[ParserType],
+    loc_data: K1Location,
+    url: str,
+    priority: int,
+    after: datetime | None = None,
 ) -> ParserType | None:
     result = None
     parser = parser_class(loc_data)
+    page = parser_class.__name__
+    # Archived pages are kept whole, so they're read in full and parsed after
+    streamed = (
+        isinstance(parser, HistoryParser)
+        and after is not None
+        and get_archive() is None
+    )
 
     try:
         res_page = None
-        async with session.get(url) as res:
-            res_page = await res.text()
-            if res_page is not None:
-                parser.feed(res_page)
-                result = parser
+        breaker = breaker_for(loc_data["subdomain"])
+
+        async with SCHEDULER.slot(loc_data["subdomain"], priority):
+            if not breaker.allow():
+                FETCH_ERRORS.inc(page, "circuit_open")
+                logger.debug("Skipping URL %s while K1 servers are down", url)
+
+            else:
+                # Feeding a streamed page happens between reads, so its time
+                # comes off the network time rather than being counted twice
+                parsing = 0.0
+                start = perf_counter()
+
+                try:
+                    with breaker:
+                        async with session.get(url) as res:
+                            if isinstance(parser, HistoryParser) and after is not None:
+                                parser.stop_at(after)
+
+                            if streamed and isinstance(parser, HistoryParser):
+                                (res_page, parsing) = await stream_history(res, parser)
+                            else:
+                                res_page = await res.text()
+                finally:
+                    FETCH_NETWORK_SECONDS.observe(
+                        perf_counter() - start - parsing, page
+                    )
+
+        if res_page is not None:
+            await archive_page(logger, page, loc_data["location"], url, res_page)
+
+        if res_page is not None:
+            if not streamed:
+                with FETCH_PARSE_SECONDS.time(page):
+                    parser.feed(res_page)
+            result = parser
 
     except ClientResponseError as e:
+        FETCH_ERRORS.inc(page, "status")
         logger.error("Fetching URL returned bad HTTP code: %s", e.status)
         logger.debug("Source URL: %s", url)
-    except ClientConnectorError:
+    except ClientConnectionError:
+        FETCH_ERRORS.inc(page, "connect")
         logger.error("Error connecting to K1 servers")
     except Timeout:
+        FETCH_ERRORS.inc(page, "timeout")
         logger.error("Timed out connecting to URL %s", url)
     except KeyError:
         if res_page is not None and "Server Error" in res_page:
+            FETCH_ERRORS.inc(page, "server")
             logger.error("K1 could not provide valid response for URL %s", url)
         else:
+            PARSE_FAILURES.inc(page)
             logger.exception("Failed to parse response for URL %s", url)
     except Exception:
+        PARSE_FAILURES.inc(page)
         logger.exception("Failed to parse response for URL %s", url)
 
     return result
@@ -402,8 +605,9 @@ async def get_racer_history(
     logger: Logger,
     session: ClientSession,
     rid: int,
-    after: date,
+    after: datetime,
     locs: str | list[K1Location] | ValuesView[K1Location] = LOCATIONS.values(),
+    priority: int = FetchPriority.BACKFILL,
 ) -> HistoryData:
     result: HistoryData = {}
     b64 = b64encode(str(rid).encode()).decode()
@@ -419,7 +623,7 @@ async def get_racer_history(
         else:
             raise ValueError("Location not recognized")
 
-    elif not isinstance(locs, type(LOCATIONS.values())):
+    elif not isinstance(locs, (list, type(LOCATIONS.values()))):
         raise ValueError("Invalid K1 location")
 
     loc_data_tasks: Iterator[Coroutine[Any, Any, HistoryParser | None]] = (
@@ -429,6 +633,8 @@ async def get_racer_history(
             HistoryParser,
             loc,
             url_base.format(subd=loc["subdomain"], b64_id=b64),
+            priority,
+            after,
         )
         for loc in locs
     )
@@ -445,11 +651,44 @@ async def get_racer_history(
             }
         )
 
+        # Recorded even when nothing is new, since any history at all means
+        # the location is worth checking next time
+        if parser.raced:
+            result.setdefault("locations", []).extend(parser.data["sessions"])
+
+    return result
+
+
+def history_locations(
+    db: Connection, rid: int
+) -> tuple[list[K1Location] | ValuesView[K1Location], bool]:
+    (known, swept) = K1DB.racer_locations(db, rid)
+    locs = [
+        LOCATIONS[key]
+        for key in (loc.replace(" ", "_").lower() for loc in known)
+        if key in LOCATIONS
+    ]
+
+    result: tuple[list[K1Location] | ValuesView[K1Location], bool] = (locs, False)
+
+    # Every location still gets checked now and then, in case the racer has
+    # started turning up somewhere new
+    if (
+        not locs
+        or swept is None
+        or datetime.now(utc) - swept >= timedelta(days=RACER_SWEEP_DAYS)
+    ):
+        result = (LOCATIONS.values(), True)
+
     return result
 
 
 async def get_heat_info(
-    logger: Logger, session: ClientSession, loc: K1Location, heats: int | list[int]
+    logger: Logger,
+    session: ClientSession,
+    loc: K1Location,
+    heats: int | list[int],
+    priority: int = FetchPriority.BACKFILL,
 ) -> dict[str, dict[int, HeatData]]:
     result: dict[str, dict[int, HeatData]] = {loc["location"]: {}}
     url_base = (
@@ -466,6 +705,7 @@ async def get_heat_info(
             HeatParser,
             loc,
             url_base.format(subd=loc["subdomain"], heat=h),
+            priority,
         )
         for h in heats
     )
@@ -481,16 +721,101 @@ async def get_heat_info(
     return result
 
 
-async def get_racer_data(logger: Logger, racer_id: int, after: datetime) -> RacerData:
+async def get_heat_records(
+    logger: Logger,
+    session: ClientSession,
+    loc: K1Location,
+    heats: list[int],
+    priority: int = FetchPriority.REPAIR,
+) -> list[SpoolRecord]:
+    result: list[SpoolRecord] = []
+    heat_info = (await get_heat_info(logger, session, loc, heats, priority))[
+        loc["location"]
+    ]
+
+    for heat_id, heat_data in sorted(heat_info.items()):
+        # Heat pages don't list karts, so they come from each racer's history
+        after = heat_data["time"] - timedelta(minutes=1)
+        history_tasks: Iterator[Coroutine[Any, Any, HistoryData]] = (
+            get_racer_history(
+                logger, session, s["rid"], after, loc["location"], priority
+            )
+            for s in heat_data["sessions"]
+        )
+        histories: list[HistoryData] = await gather_iter(
+            history_tasks, limit=MAX_CONCURRENT_TASKS
+        )
+
+        karts: dict[int, int] = {}
+        for heat_session, history in zip(heat_data["sessions"], histories):
+            for hist_session in history.get("sessions", {}).get(loc["location"], []):
+                if hist_session["heat_id"] == heat_id:
+                    karts[heat_session["rid"]] = hist_session["kart"]
+
+        record = build_heat_record(loc["location"], heat_id, heat_data, karts)
+
+        if record is not None:
+            result.append(record)
+        else:
+            logger.warning(
+                "Could not find karts for %s heat %s", loc["location"], heat_id
+            )
+
+    return result
+
+
+def build_heat_record(
+    location: str, heat_id: int, heat_data: HeatData, karts: dict[int, int]
+) -> SpoolRecord | None:
+    result: SpoolRecord | None = None
+    sessions: list[FullSession] = [
+        {
+            "rid": s["rid"],
+            "location": location,
+            "track": heat_data["track"],
+            "time": heat_data["time"],
+            "kart": karts[s["rid"]],
+            "score": s["score"],
+            "pos": s["pos"],
+            "times": s["lap_data"],
+        }
+        for s in heat_data["sessions"]
+        if s["rid"] in karts
+    ]
+
+    if sessions:
+        result = {
+            "racers": [(s["rid"], s["name"]) for s in heat_data["sessions"]],
+            "heat": {
+                "location": location,
+                "heat_no": heat_id,
+                "track": heat_data["track"],
+                "time": heat_data["time"],
+                "race_type": heat_data["race_type"],
+                "win_cond": heat_data["win_cond"],
+            },
+            "sessions": sessions,
+        }
+
+    return result
+
+
+async def get_racer_data(
+    logger: Logger,
+    racer_id: int,
+    after: datetime,
+    locs: list[K1Location] | ValuesView[K1Location] = LOCATIONS.values(),
+) -> RacerData:
     result: RacerData = {}
     async with ClientSession(
         connector=TCPConnector(limit=MAX_POOL_SIZE), raise_for_status=True
     ) as session:
-        history = await get_racer_history(logger, session, racer_id, after)
+        history = await get_racer_history(logger, session, racer_id, after, locs)
         if history:
             heats_by_location = {}
             result["rid"] = racer_id
             result["name"] = history["name"]
+            result["locations"] = history.get("locations", [])
 
             heat_data_tasks = []
             for location, session_list in history["sessions"].items():
@@ -504,39 +829,63 @@ async def get_racer_data(logger: Logger, racer_id: int, after: datetime) -> Race
             for data in filter(None, heat_data):
                 heats_by_location.update(data)
 
+            # A whole history can run to thousands of sessions, so they're
+            # packed column-wise as each heat is matched up rather than as dicts
+            batch = result["batch"] = SessionBatch()
+
             for location, session_list in history["sessions"].items():
                 for hist_session in session_list:
                     heat = heats_by_location.get(location, {}).get(
-                        hist_session["heat_id"], {}
+                        hist_session["heat_id"]
                     )
-                    try:
-                        heat_session = next(
-                            filter(
-                                lambda s: s["rid"] == racer_id, heat.get("sessions", [])
-                            )
-                        )
-                    except Exception:
-                        pass
-                    else:
-                        result.setdefault("sessions", []).append(
+
+                    if heat is not None:
+                        batch.add_heat(
                             {
-                                "rid": racer_id,
                                 "location": location,
+                                "heat_no": hist_session["heat_id"],
                                 "track": heat["track"],
                                 "time": hist_session["time"],
                                 "race_type": heat["race_type"],
                                 "win_cond": heat["win_cond"],
-                                "kart": hist_session["kart"],
-                                "score": heat_session["score"],
-                                "pos": heat_session["pos"],
-                                "times": heat_session["lap_data"],
-                            }
+                            },
+                            heat["sessions"],
+                            {racer_id: hist_session["kart"]},
                         )
     return result
 
 
-async def watch_location(logger: Logger, loc: K1Location, db: Connection) -> NoReturn:
-    params = {
+async def catch_up(
+    logger: Logger,
+    session: ClientSession,
+    loc: K1Location,
+    spool: HeatSink,
+    missed: list[int],
+) -> None:
+    logger.info(
+        "Catching up on %s %s heat(s) missed while offline",
+        len(missed),
+        loc["location"],
+    )
+
+    # Run alongside the live loop at backfill priority, so the scoreboard is
+    # watched again straight away and live fetches always go first; the live
+    # loop commits whatever has been spooled on its next poll
+    for idx in range(0, len(missed), REPAIR_BATCH_SIZE):
+        for record in await get_heat_records(
+            logger,
+            session,
+            loc,
+            missed[idx : idx + REPAIR_BATCH_SIZE],
+            FetchPriority.BACKFILL,
+        ):
+            spool.append(record)
+
+
+async def watch_location(
+    logger: Logger, loc: K1Location, db: Connection, spool: HeatSink
+) -> NoReturn:
+    params: dict[str, Any] = {
         "clientId": str(uuid4()),
         "groups": "SP_Center.ScoreBoardHub.1",
         "messageId": 1,
@@ -545,96 +894,190 @@ async def watch_location(logger: Logger, loc: K1Location, db: Connection) -> NoR
     url = f"https://{loc['subdomain']}.clubspeedtiming.com/SP_Center/signalr"
     last_heat = -1
 
+    cursor = K1DB.get_cursor(db, loc["location"])
+    if cursor is not None:
+        params["clientId"] = cursor["client_id"]
+        params["messageId"] = cursor["message_id"]
+        last_heat = cursor["last_heat"]
+        logger.info(
+            "Resuming %s live data fetcher after heat %s", loc["location"], last_heat
+        )
+
+    saved_cursor = (params["messageId"], last_heat)
+    caught_up = cursor is None
+    cadence = PollCadence(logger, loc)
+    breaker = breaker_for(loc["subdomain"])
+    race_running = False
+    catching_up: Task[None] | None = None
+
     async with ClientSession(
         connector=TCPConnector(limit=MAX_POOL_SIZE), raise_for_status=True
     ) as session:
         logger.info("Started %s live data fetcher", loc["location"])
 
-        while True:
-            heat: HeatData = {}
-            sessions: list[FullSession] = []
-            all_msgs = []
-            heat_num = last_heat
+        try:
+            while True:
+                heat: HeatData = {}
+                sessions: list[FullSession] = []
+                racers: list[tuple[int, str]] = []
+                all_msgs = []
+                heat_num = last_heat
 
-            try:
-                async with session.post(url, data=params) as res:
-                    res_data = await res.json()
-                    params["messageId"] = res_data["MessageId"]
-                    all_msgs = res_data["Messages"]
-            except ClientResponseError as e:
-                logger.error(
-                    "Got %s HTTP code watching for %s data", e.status, loc["location"]
-                )
-            except ClientConnectorError:
-                logger.error("Error connecting to K1 servers")
-            except Timeout:
-                logger.error("Timed out watching for %s data", loc["location"])
-
-            for msg in all_msgs:
-                data = msg["Args"][0]
-
-                if data["ScoreboardData"]:
-                    heat_num = int(data["ScoreboardData"][0]["HeatNo"])
-
-                if not (data["RaceRunning"] or heat_num == last_heat):
-                    raw_heat = await get_heat_info(logger, session, loc, heat_num)
-                    heat_data = raw_heat[loc["location"]].get(heat_num, {})
-
-                    if heat_data:
-                        last_heat = heat_num
-                        all_sessions = heat_data["sessions"]
-                        heat = {
-                            "location": loc["location"],
-                            "track": heat_data["track"],
-                            "time": heat_data["time"],
-                            "race_type": heat_data["race_type"],
-                            "win_cond": heat_data["win_cond"],
-                        }
+                # While the circuit is open the poll is skipped outright, rather
+                # than waiting out yet another doomed connection attempt
+                if breaker.allow():
+                    POLLS.inc(loc["location"])
 
-                        logger.debug(
-                            "Got data for %s %s heat",
-                            heat["location"],
-                            heat["time"].time(),
+                    try:
+                        with breaker, POLL_SECONDS.time(loc["location"]):
+                            async with session.post(url, data=params) as res:
+                                res_data = await res.json()
+                        params["messageId"] = res_data["MessageId"]
+                        all_msgs = res_data["Messages"]
+                    except ClientResponseError as e:
+                        logger.error(
+                            "Got %s HTTP code watching for %s data",
+                            e.status,
+                            loc["location"],
                         )
+                    except ClientConnectionError:
+                        logger.error("Error connecting to K1 servers")
+                    except Timeout:
+                        logger.error("Timed out watching for %s data", loc["location"])
+
+                for msg in all_msgs:
+                    data = msg["Args"][0]
+                    race_running = data["RaceRunning"]
+
+                    if data["ScoreboardData"]:
+                        heat_num = int(data["ScoreboardData"][0]["HeatNo"])
+
+                        if not caught_up:
+                            # Everything between the saved heat and the one on the
+                            # scoreboard finished while the watcher was down
+                            caught_up = True
+                            missed = list(
+                                range(
+                                    max(last_heat + 1, heat_num - MAX_CATCHUP_HEATS),
+                                    heat_num,
+                                )
+                            )
+
+                            if missed:
+                                catching_up = create_task(
+                                    catch_up(logger, session, loc, spool, missed)
+                                )
 
-                    for racer in data["ScoreboardData"]:
-                        racer_id = int(racer["CustID"])
-                        K1DB.add_racer(db, racer_id, racer["RacerName"])
-
-                        def _get_session(
-                            sessions: list[HeatSession],
-                        ) -> HeatSession | None:
-                            result = None
-                            for session in sessions:
-                                if session["rid"] == racer_id:
-                                    result = session
-                                    break
-                            return result
-
-                        sess = _get_session(all_sessions)
-                        if sess is not None:
-                            sessions.append(
-                                {
-                                    "rid": racer_id,
-                                    "location": loc["location"],
-                                    "track": heat_data["track"],
-                                    "time": heat_data["time"],
-                                    "kart": int(racer["AutoNo"]),
-                                    "score": sess["score"],
-                                    "pos": sess["pos"],
-                                    "times": sess["lap_data"],
-                                }
+                    if not (data["RaceRunning"] or heat_num == last_heat):
+                        cadence.finished()
+                        raw_heat = await get_heat_info(
+                            logger, session, loc, heat_num, FetchPriority.LIVE
+                        )
+                        heat_data = raw_heat[loc["location"]].get(heat_num, {})
+
+                        if not heat_data:
+                            # Results usually lag the scoreboard, try again next poll
+                            RETRIES.inc("heat_not_ready")
+
+                        else:
+                            last_heat = heat_num
+                            all_sessions = heat_data["sessions"]
+                            # Karts only show up on the scoreboard, which can't
+                            # be fetched again, so a reparse needs this copy
+                            await archive_page(
+                                logger,
+                                SCOREBOARD_PAGE,
+                                loc["location"],
+                                url,
+                                dumps(data["ScoreboardData"]),
                             )
+                            heat = {
+                                "location": loc["location"],
+                                "heat_no": heat_num,
+                                "track": heat_data["track"],
+                                "time": heat_data["time"],
+                                "race_type": heat_data["race_type"],
+                                "win_cond": heat_data["win_cond"],
+                            }
 
-                    if heat and sessions:
-                        K1DB.add_heats(db, heat)
-                        K1DB.add_sessions(db, sessions)
+                            logger.debug(
+                                "Got data for %s %s heat",
+                                heat["location"],
+                                heat["time"].time(),
+                            )
+
+                            for racer in data["ScoreboardData"]:
+                                racer_id = int(racer["CustID"])
+                                racers.append((racer_id, racer["RacerName"]))
+
+                                def _get_session(
+                                    sessions: list[HeatSession],
+                                ) -> HeatSession | None:
+                                    result = None
+                                    for session in sessions:
+                                        if session["rid"] == racer_id:
+                                            result = session
+                                            break
+                                    return result
+
+                                sess = _get_session(all_sessions)
+                                if sess is not None:
+                                    sessions.append(
+                                        {
+                                            "rid": racer_id,
+                                            "location": loc["location"],
+                                            "track": heat_data["track"],
+                                            "time": heat_data["time"],
+                                            "kart": int(racer["AutoNo"]),
+                                            "score": sess["score"],
+                                            "pos": sess["pos"],
+                                            "times": sess["lap_data"],
+                                        }
+                                    )
+
+                        if heat and sessions:
+                            # Record the heat durably before touching the database,
+                            # so a locked db or crash can't lose it once last_heat
+                            # has moved on
+                            spool.append(
+                                {"racers": racers, "heat": heat, "sessions": sessions}
+                            )
+                            cadence.ingested()
+                        break
 
-                        logger.info(
-                            "Saved all data for %s race beginning at %s UTC",
-                            heat["location"],
-                            heat["time"].time(),
+                cadence.observe(
+                    race_running, not race_running and heat_num not in (last_heat, -1)
+                )
+
+                spool.commit(db)
+
+                # The spool is synced by now, so the cursor can't outrun the data;
+                # that includes missed heats the catch-up hasn't spooled yet
+                cursor_heat = last_heat
+                if catching_up is not None and (
+                    not catching_up.done() or catching_up.exception() is not None
+                ):
+                    cursor_heat = saved_cursor[1]
+
+                if (params["messageId"], cursor_heat) != saved_cursor:
+                    if spool.save_cursor(
+                        db,
+                        loc["location"],
+                        {
+                            "client_id": params["clientId"],
+                            "message_id": str(params["messageId"]),
+                            "last_heat": cursor_heat,
+                        },
+                    ):
+                        saved_cursor = (params["messageId"], cursor_heat)
+                    else:
+                        logger.debug(
+                            "Could not save %s watcher cursor", loc["location"]
                         )
-                    break
 
-            await sleep(10)
+                cadence.report()
+                await sleep(cadence.delay())
+        finally:
+            # The catch-up shares this session, so it can't outlive it
+            if catching_up is not None:
+                catching_up.cancel()
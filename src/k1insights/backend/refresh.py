@@ -0,0 +1,124 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from asyncio import sleep
+from datetime import datetime, timedelta
+from logging import Logger
+from sqlite3 import Connection, OperationalError
+from typing import NoReturn
+
+from aiohttp import ClientSession, TCPConnector
+from pytz import utc
+
+from k1insights.backend.clubspeed import (
+    get_heat_records,
+    get_racer_history,
+    history_locations,
+)
+from k1insights.backend.scheduler import FetchPriority
+from k1insights.backend.spool import HeatSpool
+from k1insights.common.constants import (
+    FOLLOW_INTERVAL,
+    FOLLOW_LOOKBACK_DAYS,
+    LOCATIONS,
+    MAX_POOL_SIZE,
+    REPAIR_BATCH_SIZE,
+)
+from k1insights.common.db import K1DB
+from k1insights.common.metrics import FOLLOWED_HEATS
+
+
+async def refresh_racer(
+    logger: Logger,
+    session: ClientSession,
+    db: Connection,
+    spool: HeatSpool,
+    rid: int,
+    newest: datetime | None,
+) -> int:
+    added = 0
+    now = datetime.now(utc)
+
+    # Only what's happened since the last stored race is worth asking for
+    if newest is None:
+        after = now - timedelta(days=FOLLOW_LOOKBACK_DAYS)
+    else:
+        after = newest - timedelta(minutes=1)
+
+    (locs, sweep) = history_locations(db, rid)
+    history = await get_racer_history(
+        logger, session, rid, after, locs, FetchPriority.BACKFILL
+    )
+
+    if history:
+        K1DB.add_racer_locations(
+            db, rid, history.get("locations", []), now if sweep else None
+        )
+
+    for (location, sessions) in history.get("sessions", {}).items():
+        loc = LOCATIONS[location.replace(" ", "_").lower()]
+        heats = [s["heat_id"] for s in sessions]
+        missing = sorted(set(heats) - K1DB.stored_heats(db, location, heats))
+
+        # Whole heats are stored, every racer's session included, so a heat
+        # refreshed here is as complete as a live or repaired one
+        for idx in range(0, len(missing), REPAIR_BATCH_SIZE):
+            records = await get_heat_records(
+                logger,
+                session,
+                loc,
+                missing[idx : idx + REPAIR_BATCH_SIZE],
+                FetchPriority.BACKFILL,
+            )
+
+            for record in records:
+                spool.append(record)
+                FOLLOWED_HEATS.inc(location)
+                added += 1
+            spool.commit(db)
+
+    return added
+
+
+async def refresh_followed(
+    logger: Logger, db: Connection, spool: HeatSpool
+) -> NoReturn:
+    async with ClientSession(
+        connector=TCPConnector(limit=MAX_POOL_SIZE), raise_for_status=True
+    ) as session:
+        logger.info("Started followed racer refresh worker")
+
+        while True:
+            try:
+                racers = K1DB.followed_racers(db)
+            except OperationalError as e:
+                logger.warning("Skipping racer refresh, database unavailable: %s", e)
+                racers = []
+
+            # Racers are spread evenly over the interval, so following more of
+            # them slows each one's refresh rather than bunching up requests
+            pause = FOLLOW_INTERVAL / max(len(racers), 1)
+
+            for (rid, newest) in racers:
+                try:
+                    added = await refresh_racer(logger, session, db, spool, rid, newest)
+                except OperationalError as e:
+                    logger.warning(
+                        "Skipping refresh of racer %s, database unavailable: %s",
+                        rid,
+                        e,
+                    )
+                else:
+                    if added:
+                        logger.info("Added %s heat(s) for racer %s", added, rid)
+
+                await sleep(pause)
+
+            if not racers:
+                await sleep(FOLLOW_INTERVAL)
@@ -0,0 +1,100 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from asyncio import sleep
+from logging import Logger
+from sqlite3 import Connection, OperationalError
+from typing import NoReturn
+
+from aiohttp import ClientSession, TCPConnector
+
+from k1insights.backend.clubspeed import get_heat_records
+from k1insights.backend.spool import HeatSpool
+from k1insights.common.constants import (
+    LOCATIONS,
+    MAX_POOL_SIZE,
+    REPAIR_BATCH_SIZE,
+    REPAIR_INTERVAL,
+    REPAIR_MAX_ATTEMPTS,
+    REPAIR_WINDOW,
+    K1Location,
+    RepairStats,
+)
+from k1insights.common.db import K1DB
+from k1insights.common.metrics import HEAT_COMPLETENESS
+
+
+# Breathing room between batches so repairs never crowd out live fetches
+BATCH_PAUSE = 5
+
+
+async def repair_location(
+    logger: Logger,
+    session: ClientSession,
+    db: Connection,
+    spool: HeatSpool,
+    loc: K1Location,
+) -> RepairStats:
+    gaps = K1DB.heat_gaps(db, loc["location"], REPAIR_WINDOW)
+
+    if gaps:
+        K1DB.queue_repairs(db, loc["location"], gaps)
+
+    # Each queued heat gets one attempt per pass, so retries spread out over time
+    pending = K1DB.pending_repairs(db, loc["location"], REPAIR_WINDOW)
+
+    if pending:
+        logger.info("Repairing %s missing %s heat(s)", len(pending), loc["location"])
+
+    for idx in range(0, len(pending), REPAIR_BATCH_SIZE):
+        batch = pending[idx : idx + REPAIR_BATCH_SIZE]
+        records = await get_heat_records(logger, session, loc, batch)
+
+        for record in records:
+            spool.append(record)
+        spool.commit(db)
+
+        repaired = {r["heat"]["heat_no"] for r in records}
+        K1DB.finish_repairs(db, loc["location"], batch, repaired, REPAIR_MAX_ATTEMPTS)
+
+        await sleep(BATCH_PAUSE)
+
+    return K1DB.repair_stats(db, loc["location"], REPAIR_WINDOW)
+
+
+async def repair_gaps(logger: Logger, db: Connection, spool: HeatSpool) -> NoReturn:
+    async with ClientSession(
+        connector=TCPConnector(limit=MAX_POOL_SIZE), raise_for_status=True
+    ) as session:
+        logger.info("Started heat gap repair worker")
+
+        while True:
+            for loc in LOCATIONS.values():
+                try:
+                    stats = await repair_location(logger, session, db, spool, loc)
+                except OperationalError as e:
+                    logger.warning(
+                        "Skipping %s gap repair, database unavailable: %s",
+                        loc["location"],
+                        e,
+                    )
+                else:
+                    HEAT_COMPLETENESS.set(stats["completeness"], loc["location"])
+                    logger.info(
+                        "%s heats %.1f%% complete: %s stored, %s pending, "
+                        "%s repaired, %s abandoned",
+                        loc["location"],
+                        stats["completeness"] * 100,
+                        stats["stored"],
+                        stats["pending"],
+                        stats["repaired"],
+                        stats["abandoned"],
+                    )
+
+            await sleep(REPAIR_INTERVAL)
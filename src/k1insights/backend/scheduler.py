@@ -0,0 +1,137 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from asyncio import CancelledError, Future, get_running_loop
+from bisect import insort
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from itertools import count
+from time import perf_counter
+
+from k1insights.common.constants import (
+    LIVE_RESERVED_HOST_TASKS,
+    LIVE_RESERVED_TASKS,
+    MAX_CONCURRENT_TASKS,
+    MAX_HOST_TASKS,
+)
+from k1insights.common.metrics import FETCH_WAIT_SECONDS
+
+
+class FetchPriority:
+    LIVE = 0
+    REPAIR = 1
+    BACKFILL = 2
+
+
+PRIORITY_NAMES = {
+    FetchPriority.LIVE: "live",
+    FetchPriority.REPAIR: "repair",
+    FetchPriority.BACKFILL: "backfill",
+}
+
+
+class FetchScheduler:
+    def __init__(
+        self, limit: int, host_limit: int, reserved: int = 0, host_reserved: int = 0
+    ) -> None:
+        self.limit = max(limit, 1)
+        self.host_limit = max(host_limit, 1)
+        # Slots only live fetches may take, so they never queue behind bulk work;
+        # kept per host too, or backfilling one location fills its server's cap
+        self.reserved = min(max(reserved, 0), self.limit - 1)
+        self.host_reserved = min(max(host_reserved, 0), self.host_limit - 1)
+
+        self.active = 0
+        self.host_active: dict[str, int] = {}
+        self._waiting: list[tuple[int, int, str, Future[None]]] = []
+        self._order = count()
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiting)
+
+    def _can_start(self, priority: int, host: str) -> bool:
+        if priority == FetchPriority.LIVE:
+            (cap, host_cap) = (self.limit, self.host_limit)
+        else:
+            cap = self.limit - self.reserved
+            host_cap = self.host_limit - self.host_reserved
+
+        return self.active < cap and self.host_active.get(host, 0) < host_cap
+
+    def _start(self, host: str) -> None:
+        self.active += 1
+        self.host_active[host] = self.host_active.get(host, 0) + 1
+
+    def _dispatch(self) -> None:
+        idx = 0
+
+        # Waiters are in priority order, but one held up by its host's cap
+        # mustn't stop fetches to other hosts behind it from starting
+        while idx < len(self._waiting) and self.active < self.limit:
+            (priority, _, host, waiter) = self._waiting[idx]
+
+            if waiter.done():
+                del self._waiting[idx]
+
+            elif self._can_start(priority, host):
+                del self._waiting[idx]
+                self._start(host)
+                waiter.set_result(None)
+
+            else:
+                idx += 1
+
+    def release(self, host: str) -> None:
+        self.active -= 1
+        self.host_active[host] -= 1
+
+        if not self.host_active[host]:
+            del self.host_active[host]
+
+        self._dispatch()
+
+    async def acquire(self, host: str, priority: int) -> None:
+        if not self._waiting and self._can_start(priority, host):
+            self._start(host)
+
+        else:
+            waiter: Future[None] = get_running_loop().create_future()
+            insort(self._waiting, (priority, next(self._order), host, waiter))
+            self._dispatch()
+
+            try:
+                await waiter
+            except CancelledError:
+                # Cancelled after being handed a slot, so give it back
+                if waiter.done() and not waiter.cancelled():
+                    self.release(host)
+                raise
+
+    @asynccontextmanager
+    async def slot(self, host: str, priority: int) -> AsyncIterator[None]:
+        start = perf_counter()
+        await self.acquire(host, priority)
+        FETCH_WAIT_SECONDS.observe(perf_counter() - start, PRIORITY_NAMES[priority])
+
+        try:
+            yield
+        finally:
+            self.release(host)
+
+
+# One per process: with -w/--workers set, the parent's repair and refresh
+# fetches are scheduled apart from the live ones in the worker processes, so a
+# host can see the parent's non-live share on top of whatever its worker runs
+SCHEDULER = FetchScheduler(
+    MAX_CONCURRENT_TASKS,
+    MAX_HOST_TASKS,
+    LIVE_RESERVED_TASKS,
+    LIVE_RESERVED_HOST_TASKS,
+)
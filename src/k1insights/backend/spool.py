@@ -0,0 +1,222 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from datetime import datetime
+from json import JSONDecodeError, dumps, loads
+from logging import Logger
+from multiprocessing.queues import Queue
+from os import fsync
+from pathlib import Path
+from sqlite3 import Connection, OperationalError
+from typing import IO, Any, Protocol, Tuple, TypedDict
+
+from k1insights.common.constants import (
+    SPOOL_FSYNC_BATCH,
+    FullSession,
+    HeatData,
+    WatcherCursor,
+)
+from k1insights.common.db import K1DB
+from k1insights.common.metrics import HEATS_INGESTED, RETRIES
+
+
+class SpoolRecord(TypedDict):
+    racers: list[tuple[int, str]]
+    heat: HeatData
+    sessions: list[FullSession]
+
+
+# Either ("heats", list of records) or ("cursor", (location, cursor))
+ShardMessage = Tuple[str, Any]
+
+
+class HeatSink(Protocol):
+    def append(self, record: SpoolRecord) -> int:
+        ...
+
+    def commit(self, db: Connection) -> int:
+        ...
+
+    def save_cursor(self, db: Connection, loc: str, cursor: WatcherCursor) -> bool:
+        ...
+
+
+class HeatSpool:
+    def __init__(
+        self, logger: Logger, path: Path, fsync_batch: int = SPOOL_FSYNC_BATCH
+    ) -> None:
+        self._log = logger
+        self._path = path
+        self._fsync_batch = max(fsync_batch, 1)
+        self._pending: dict[int, SpoolRecord] = {}
+        self._seq = 0
+        self._unsynced = 0
+        self._fh: IO[str] | None = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    @staticmethod
+    def _encode(obj: Any) -> str:
+        if isinstance(obj, datetime):
+            return obj.isoformat()
+
+        raise TypeError(f"Cannot spool object of type {type(obj).__name__}")
+
+    @staticmethod
+    def _decode(raw: dict[str, Any]) -> SpoolRecord:
+        heat = raw["heat"]
+        heat["time"] = datetime.fromisoformat(heat["time"])
+
+        for session in raw["sessions"]:
+            session["time"] = datetime.fromisoformat(session["time"])
+            session["times"] = [tuple(t) for t in session["times"]]
+
+        return {
+            "racers": [(rid, name) for (rid, name) in raw["racers"]],
+            "heat": heat,
+            "sessions": raw["sessions"],
+        }
+
+    def open(self) -> None:
+        if self._path.is_file():
+            with self._path.open(encoding="utf-8") as spool:
+                for line_no, line in enumerate(spool, 1):
+                    try:
+                        entry = loads(line)
+                    except JSONDecodeError:
+                        # A torn write from a crash can only be the final line
+                        self._log.warning(
+                            "Skipping unreadable spool entry on line %s", line_no
+                        )
+                        continue
+
+                    self._seq = max(self._seq, entry.get("seq", entry.get("ack", 0)))
+
+                    if "ack" in entry:
+                        self._pending.pop(entry["ack"], None)
+                    else:
+                        self._pending[entry["seq"]] = self._decode(entry["record"])
+
+            if self._pending:
+                self._log.info("Found %s uncommitted heat(s) in spool", self.pending)
+
+        self._fh = self._path.open("a", encoding="utf-8")
+
+    def close(self) -> None:
+        if self._fh is not None:
+            self.sync()
+            self._fh.close()
+            self._fh = None
+
+    def _write(self, entry: dict[str, Any]) -> None:
+        if self._fh is None:
+            raise RuntimeError("Spool has not been opened")
+
+        self._fh.write(dumps(entry, default=self._encode, separators=(",", ":")))
+        self._fh.write("\n")
+        self._unsynced += 1
+
+    def sync(self) -> None:
+        if self._fh is not None and self._unsynced:
+            self._fh.flush()
+            fsync(self._fh.fileno())
+            self._unsynced = 0
+
+    def append(self, record: SpoolRecord) -> int:
+        self._seq += 1
+        self._write({"seq": self._seq, "record": record})
+        self._pending[self._seq] = record
+
+        if self._unsynced >= self._fsync_batch:
+            self.sync()
+
+        return self._seq
+
+    def commit(self, db: Connection) -> int:
+        committed = 0
+
+        if self._pending:
+            # Everything about to be applied must be durable first
+            self.sync()
+
+            for seq in sorted(self._pending):
+                record = self._pending[seq]
+
+                try:
+                    for (rid, name) in record["racers"]:
+                        K1DB.add_racer(db, rid, name)
+                    K1DB.add_heats(db, record["heat"])
+                    K1DB.add_sessions(db, record["sessions"])
+                except OperationalError as e:
+                    RETRIES.inc("db_unavailable")
+                    self._log.warning(
+                        "Database unavailable, %s heat(s) left in spool: %s",
+                        self.pending,
+                        e,
+                    )
+                    break
+
+                self._write({"ack": seq})
+                del self._pending[seq]
+                committed += 1
+                HEATS_INGESTED.inc(record["heat"]["location"])
+
+                self._log.info(
+                    "Saved all data for %s race beginning at %s UTC",
+                    record["heat"]["location"],
+                    record["heat"]["time"].time(),
+                )
+
+            if not self._pending and self._fh is not None:
+                self._fh.truncate(0)
+                self._unsynced += 1
+
+            self.sync()
+
+        return committed
+
+    def save_cursor(self, db: Connection, loc: str, cursor: WatcherCursor) -> bool:
+        try:
+            K1DB.save_cursor(db, loc, cursor)
+        except OperationalError:
+            result = False
+        else:
+            result = True
+
+        return result
+
+
+# Stands in for the spool inside watcher processes, handing heats over to
+# the one process that owns the spool and the database
+class ShardSpool:
+    def __init__(self, queue: Queue[ShardMessage]) -> None:
+        self._queue = queue
+        self._batch: list[SpoolRecord] = []
+
+    def append(self, record: SpoolRecord) -> int:
+        self._batch.append(record)
+        return len(self._batch)
+
+    def commit(self, db: Connection) -> int:
+        committed = len(self._batch)
+
+        if self._batch:
+            self._queue.put(("heats", self._batch))
+            self._batch = []
+
+        return committed
+
+    def save_cursor(self, db: Connection, loc: str, cursor: WatcherCursor) -> bool:
+        # The queue is FIFO, so the writer spools this shard's heats before
+        # it ever sees the cursor that follows them
+        self.commit(db)
+        self._queue.put(("cursor", (loc, cursor)))
+        return True
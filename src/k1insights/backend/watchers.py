@@ -10,32 +10,197 @@ from __future__ import annotations
 from argparse import ArgumentParser, Namespace
 from logging import DEBUG, INFO, LogRecord, StreamHandler, getLogger
 from logging.handlers import QueueHandler, QueueListener
-from queue import SimpleQueue
+from multiprocessing import get_context
+from multiprocessing.process import BaseProcess
+from multiprocessing.queues import Queue
+from queue import Empty, SimpleQueue
+from sqlite3 import Connection
 from sys import stdout
+from typing import NoReturn
 
-from anyio import create_task_group, run
+from aiohttp import web
+from anyio import create_task_group, run, sleep_forever, to_thread
 
 from k1insights.backend.clubspeed import watch_location
-from k1insights.common.constants import DB_PATH, LOCATIONS
+from k1insights.backend.refresh import refresh_followed
+from k1insights.backend.repair import repair_gaps
+from k1insights.backend.spool import HeatSpool, ShardMessage, ShardSpool
+from k1insights.common.constants import (
+    DB_PATH,
+    LOCATIONS,
+    METRICS_PORT,
+    SPOOL_PATH,
+    WATCH_WORKERS,
+)
 from k1insights.common.db import K1DB
+from k1insights.common.metrics import render
 
 
 LOG = getLogger(__name__)
 
 
-async def start_watchers() -> None:
-    db = K1DB.connect(LOG, DB_PATH)
+async def metrics_handler(request: web.Request) -> web.Response:
+    return web.Response(
+        body=render().encode(),
+        headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"},
+    )
+
+
+async def serve_metrics(port: int) -> None:
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_handler)
+    runner = web.AppRunner(app)
+    await runner.setup()
+
+    try:
+        await web.TCPSite(runner, "127.0.0.1", port).start()
+        LOG.info("Serving metrics at http://127.0.0.1:%s/metrics", port)
+        await sleep_forever()
+    finally:
+        await runner.cleanup()
+
+
+def shard_locations(keys: list[str], workers: int) -> list[list[str]]:
+    return [shard for shard in (keys[idx::workers] for idx in range(workers)) if shard]
+
+
+async def write_shards(
+    db: Connection, spool: HeatSpool, queue: Queue[ShardMessage]
+) -> NoReturn:
+    def _receive() -> ShardMessage | None:
+        try:
+            return queue.get(timeout=1)
+        except Empty:
+            return None
+
+    while True:
+        msg = await to_thread.run_sync(_receive)
+
+        if msg is None:
+            continue
+
+        (kind, payload) = msg
+
+        if kind == "heats":
+            for record in payload:
+                spool.append(record)
+            spool.commit(db)
+
+        elif not spool.save_cursor(db, *payload):
+            LOG.debug("Could not save %s watcher cursor", payload[0])
+
+
+async def start_shard(idx: int, keys: list[str], queue: Queue[ShardMessage]) -> None:
+    db = K1DB.connect(LOG, DB_PATH, readonly=True)
 
     if db is not None:
+        spool = ShardSpool(queue)
+
         async with create_task_group() as nursery:
-            for loc in LOCATIONS.values():
+            for key in keys:
                 nursery.start_soon(
-                    watch_location, LOG, loc, db, name=f"{loc['location']}"
+                    watch_location, LOG, LOCATIONS[key], db, spool, name=key
+                )
+
+            # Every process keeps its own metrics, so each gets its own port
+            if METRICS_PORT:
+                nursery.start_soon(
+                    serve_metrics, METRICS_PORT + idx + 1, name="metrics"
+                )
+
+        K1DB.close(db)
+
+
+def run_shard(
+    idx: int, keys: list[str], queue: Queue[ShardMessage], debug: bool
+) -> None:
+    lstnr = configure_logging(debug)
+    LOG.info("Watcher process %s started for %s", idx, ", ".join(keys))
+
+    try:
+        run(start_shard, idx, keys, queue)
+    except KeyboardInterrupt:
+        # Shares the parent's process group, which handles shutting down
+        pass
+    finally:
+        lstnr.stop()
+
+
+async def start_watchers(workers: int = 0) -> None:
+    db = K1DB.connect(LOG, DB_PATH)
+
+    if db is not None:
+        spool = HeatSpool(LOG, SPOOL_PATH)
+        spool.open()
+
+        # Replay anything fetched but never committed before the last shutdown
+        if spool.commit(db):
+            LOG.info("Replayed spooled heats from previous run")
+
+        procs: list[BaseProcess] = []
+        queue: Queue[ShardMessage] | None = None
+
+        if workers:
+            ctx = get_context("spawn")
+            queue = ctx.Queue()
+
+            for (idx, keys) in enumerate(shard_locations(list(LOCATIONS), workers)):
+                proc = ctx.Process(
+                    target=run_shard,
+                    args=(idx, keys, queue, LOG.getEffectiveLevel() <= DEBUG),
+                    name=f"k1-watcher-{idx}",
+                    daemon=True,
                 )
+                proc.start()
+                procs.append(proc)
+
+        try:
+            async with create_task_group() as nursery:
+                if queue is None:
+                    for loc in LOCATIONS.values():
+                        nursery.start_soon(
+                            watch_location,
+                            LOG,
+                            loc,
+                            db,
+                            spool,
+                            name=f"{loc['location']}",
+                        )
+
+                else:
+                    # Watcher processes only fetch; this process alone writes
+                    nursery.start_soon(write_shards, db, spool, queue, name="writer")
+
+                nursery.start_soon(repair_gaps, LOG, db, spool, name="repair")
+                nursery.start_soon(refresh_followed, LOG, db, spool, name="refresh")
+
+                if METRICS_PORT:
+                    nursery.start_soon(serve_metrics, METRICS_PORT, name="metrics")
+        finally:
+            for worker in procs:
+                worker.terminate()
+                worker.join()
+
+            spool.close()
 
         K1DB.close(db)
 
 
+def configure_logging(debug: bool) -> QueueListener:
+    log_queue: SimpleQueue[LogRecord] = SimpleQueue()
+    q_hdlr = QueueHandler(log_queue)
+    stdout_hdlr = StreamHandler(stdout)
+
+    service_logger = getLogger(__name__.split(".")[0])
+    service_logger.addHandler(q_hdlr)
+    service_logger.setLevel(DEBUG if debug else INFO)
+
+    lstnr = QueueListener(log_queue, stdout_hdlr)
+    lstnr.start()
+
+    return lstnr
+
+
 def main(args: list[str] | None = None) -> None:
     parser = ArgumentParser(
         prog="k1-start-backend",
@@ -49,17 +214,15 @@ def main(args: list[str] | None = None) -> None:
         action="store_true",
         help="Display debug logs",
     )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=WATCH_WORKERS,
+        help="Spread live watchers across this many processes (0 to run in-process)",
+    )
     parsed: Namespace = parser.parse_args(args)
 
-    log_queue: SimpleQueue[LogRecord] = SimpleQueue()
-    q_hdlr = QueueHandler(log_queue)
-    stdout_hdlr = StreamHandler(stdout)
-
-    service_logger = getLogger(__name__.split(".")[0])
-    service_logger.addHandler(q_hdlr)
-    service_logger.setLevel(DEBUG if parsed.debug else INFO)
-
-    lstnr = QueueListener(log_queue, stdout_hdlr)
-    lstnr.start()
+    configure_logging(parsed.debug)
 
-    run(start_watchers, backend_options={"debug": parsed.debug})
+    run(start_watchers, parsed.workers, backend_options={"debug": parsed.debug})
@@ -0,0 +1,107 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from array import array
+from collections.abc import Iterable, Iterator
+
+from k1insights.common.constants import FullSession, HeatSession
+
+
+class SessionBatch:
+    # Sessions are stored column-wise, so a backfill holding hundreds of
+    # thousands of them pays for numbers rather than dicts and tuples
+    __slots__ = (
+        "heats",
+        "session_ends",
+        "rids",
+        "karts",
+        "positions",
+        "scores",
+        "lap_ends",
+        "laps",
+        "lap_positions",
+    )
+
+    def __init__(self) -> None:
+        self.heats: list[FullSession] = []
+        self.session_ends = array("L")
+        self.rids = array("q")
+        self.karts = array("H")
+        self.positions = array("B")
+        self.scores = array("l")
+        self.lap_ends = array("L")
+        # Single precision is plenty for times only ever kept to the millisecond
+        self.laps = array("f")
+        self.lap_positions = array("B")
+
+    def __len__(self) -> int:
+        return len(self.rids)
+
+    def __iter__(self) -> Iterator[FullSession]:
+        for (idx, heat) in enumerate(self.heats):
+            for session in self.heat_sessions(idx):
+                yield {
+                    "rid": self.rids[session],
+                    "location": heat["location"],
+                    "track": heat["track"],
+                    "time": heat["time"],
+                    "kart": self.karts[session],
+                    "score": self.scores[session],
+                    "pos": self.positions[session],
+                    "times": list(zip(self.lap_times(session), self.lap_pos(session))),
+                }
+
+    def heat_sessions(self, heat: int) -> range:
+        return range(
+            self.session_ends[heat - 1] if heat else 0, self.session_ends[heat]
+        )
+
+    def _session_laps(self, session: int) -> slice:
+        return slice(
+            self.lap_ends[session - 1] if session else 0, self.lap_ends[session]
+        )
+
+    def lap_count(self, session: int) -> int:
+        laps = self._session_laps(session)
+        return int(laps.stop - laps.start)
+
+    def lap_times(self, session: int) -> list[float]:
+        return [round(t, 3) for t in self.laps[self._session_laps(session)]]
+
+    def lap_pos(self, session: int) -> array[int]:
+        return self.lap_positions[self._session_laps(session)]
+
+    def add_heat(
+        self,
+        heat: FullSession,
+        sessions: Iterable[HeatSession],
+        karts: dict[int, int],
+    ) -> int:
+        added = 0
+
+        # Racers without a known kart can't be stored, same as elsewhere
+        for session in sessions:
+            if session["rid"] in karts:
+                self.rids.append(session["rid"])
+                self.karts.append(karts[session["rid"]])
+                self.positions.append(session["pos"])
+                self.scores.append(session["score"])
+
+                for (lap, pos) in session["lap_data"]:
+                    self.laps.append(lap)
+                    self.lap_positions.append(pos)
+                self.lap_ends.append(len(self.laps))
+
+                added += 1
+
+        if added:
+            self.heats.append(heat)
+            self.session_ends.append(len(self.rids))
+
+        return added
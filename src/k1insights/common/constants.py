@@ -8,11 +8,12 @@
 from __future__ import annotations
 
 from datetime import datetime
+from json import JSONDecodeError, loads
 from os import environ
 from pathlib import Path
 from typing import TypedDict
 
-from pytz import timezone
+from pytz import UnknownTimeZoneError, timezone
 from pytz.tzinfo import BaseTzInfo
 
 
@@ -27,24 +28,118 @@ def __getattr__(name: str) -> Path:
         else:
             return Path(environ["K1_DATA_DB"]).absolute()
 
+    elif name == "SPOOL_PATH":
+        if "K1_SPOOL" in environ:
+            return Path(environ["K1_SPOOL"]).absolute()
+
+        else:
+            return __getattr__("DB_PATH").with_suffix(".spool")
+
+    elif name == "CACHE_PATH":
+        if "K1_CACHE" in environ:
+            return Path(environ["K1_CACHE"]).absolute()
+
+        else:
+            return __getattr__("DB_PATH").with_suffix(".cache")
+
     raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
 
 
+def load_locations(path: Path) -> dict[str, K1Location]:
+    try:
+        entries = loads(path.read_text(encoding="utf-8"))
+    except (OSError, JSONDecodeError) as e:
+        raise ValueError(f"Could not read location config {path}: {e}") from e
+
+    result: dict[str, K1Location] = {}
+
+    for entry in entries:
+        try:
+            (open_hour, close_hour) = entry.get("hours", (0, 24))
+            loc: K1Location = {
+                "location": entry["location"],
+                "subdomain": entry["subdomain"],
+                "tracks": int(entry["tracks"]),
+                "tz": timezone(entry["tz"]),
+                "hours": (int(open_hour), int(close_hour)),
+            }
+        except (KeyError, TypeError, ValueError, UnknownTimeZoneError) as e:
+            raise ValueError(f"Invalid location in {path}: {entry!r}") from e
+
+        # Keyed the same way locations are looked up from urls and racer history
+        result[loc["location"].replace(" ", "_").lower()] = loc
+
+    if not result:
+        raise ValueError(f"No locations defined in {path}")
+
+    return result
+
+
 KART_LOOKBACK_DAYS = int(environ.get("K1_KART_LOOKBACK", 14))
 LOCATION_LOOKBACK_DAYS = int(environ.get("K1_LOCATION_LOOKBACK", 7))
 USER_LOOKBACK_DAYS = int(environ.get("K1_USER_LOOKBACK", 30))
+RACER_SWEEP_DAYS = int(environ.get("K1_RACER_SWEEP_DAYS", 30))
 
 MAX_POOL_SIZE = int(environ.get("K1_POOL_SIZE", 100))
 MAX_CONCURRENT_TASKS = int(environ.get("K1_TASK_LIMIT", 10))
-
-LOCATIONS: dict[str, K1Location] = {
-    "atlanta": {
-        "location": "Atlanta",
-        "subdomain": "k1atlanta",
-        "tracks": 1,
-        "tz": timezone("US/Eastern"),
-    },
-}
+MAX_HOST_TASKS = int(environ.get("K1_HOST_TASK_LIMIT", 4))
+LIVE_RESERVED_TASKS = int(environ.get("K1_LIVE_RESERVE", 2))
+LIVE_RESERVED_HOST_TASKS = int(environ.get("K1_LIVE_HOST_RESERVE", 1))
+
+HISTORY_STALE_ROWS = int(environ.get("K1_HISTORY_STALE_ROWS", 20))
+HISTORY_CHUNK_SIZE = int(environ.get("K1_HISTORY_CHUNK", 16384))
+
+BREAKER_FAILURES = int(environ.get("K1_BREAKER_FAILURES", 5))
+BREAKER_COOLDOWN = int(environ.get("K1_BREAKER_COOLDOWN", 30))
+BREAKER_MAX_COOLDOWN = int(environ.get("K1_BREAKER_MAX_COOLDOWN", 600))
+
+# Off unless a port is given; shards take the ports just above it
+METRICS_PORT = int(environ.get("K1_METRICS_PORT", 0))
+
+ARCHIVE_PATH = (
+    Path(environ["K1_ARCHIVE"]).absolute() if "K1_ARCHIVE" in environ else None
+)
+
+SPOOL_FSYNC_BATCH = int(environ.get("K1_SPOOL_BATCH", 8))
+MAX_CATCHUP_HEATS = int(environ.get("K1_CATCHUP_LIMIT", 200))
+
+REPAIR_INTERVAL = int(environ.get("K1_REPAIR_INTERVAL", 900))
+REPAIR_WINDOW = int(environ.get("K1_REPAIR_WINDOW", 500))
+REPAIR_BATCH_SIZE = int(environ.get("K1_REPAIR_BATCH", 5))
+REPAIR_MAX_ATTEMPTS = int(environ.get("K1_REPAIR_ATTEMPTS", 3))
+
+FOLLOW_INTERVAL = int(environ.get("K1_FOLLOW_INTERVAL", 3600))
+FOLLOW_LOOKBACK_DAYS = int(environ.get("K1_FOLLOW_LOOKBACK", 30))
+
+WATCH_WORKERS = int(environ.get("K1_WATCH_WORKERS", 0))
+
+CACHE_TTL = int(environ.get("K1_CACHE_TTL", 300))
+CACHE_MAX_ENTRIES = int(environ.get("K1_CACHE_ENTRIES", 2000))
+# Warmed results stay until the data moves on or they're crowded out, so
+# pages don't go cold again whenever it's quiet between heats
+WARM_CACHE_TTL = int(environ.get("K1_WARM_CACHE_TTL", 7 * 24 * 60 * 60))
+WARM_KART_PAGES = int(environ.get("K1_WARM_KARTS", 20))
+WARM_INTERVAL = int(environ.get("K1_WARM_INTERVAL", 30))
+
+LIVE_INTERVAL = int(environ.get("K1_LIVE_INTERVAL", 5))
+LIVE_KEEPALIVE = int(environ.get("K1_LIVE_KEEPALIVE", 15))
+LIVE_TIMEOUT = int(environ.get("K1_LIVE_TIMEOUT", 300))
+
+STATIC_PATH = Path(environ["K1_STATIC"]).absolute() if "K1_STATIC" in environ else None
+
+LOCATIONS: dict[str, K1Location] = (
+    load_locations(Path(environ["K1_LOCATIONS"]))
+    if "K1_LOCATIONS" in environ
+    else {
+        "atlanta": {
+            "location": "Atlanta",
+            "subdomain": "k1atlanta",
+            "tracks": 1,
+            "tz": timezone("US/Eastern"),
+            "hours": (10, 24),
+        },
+    }
+)
 
 
 class K1Location(TypedDict):
@@ -52,6 +147,27 @@ class K1Location(TypedDict):
     subdomain: str
     tracks: int
     tz: BaseTzInfo
+    hours: tuple[int, int]
+
+
+class RepairStatus:
+    PENDING = 0
+    REPAIRED = 1
+    ABANDONED = 2
+
+
+class RepairStats(TypedDict):
+    stored: int
+    pending: int
+    repaired: int
+    abandoned: int
+    completeness: float
+
+
+class WatcherCursor(TypedDict):
+    client_id: str
+    message_id: str
+    last_heat: int
 
 
 class HeatSession(TypedDict, total=False):
@@ -64,6 +180,7 @@ class HeatSession(TypedDict, total=False):
 
 class HeatData(TypedDict, total=False):
     heat_id: int
+    heat_no: int
     race_type: int
     win_cond: int
     time: datetime
@@ -74,6 +191,7 @@ class HeatData(TypedDict, total=False):
 
 class FullSession(TypedDict, total=False):
     hid: int
+    heat_no: int
     rid: int
     location: str
     track: int
@@ -9,7 +9,8 @@ from __future__ import annotations
 
 from collections.abc import Callable
 from datetime import date, datetime
-from functools import partial
+from functools import lru_cache, partial
+from itertools import groupby
 from logging import Logger
 from operator import itemgetter
 from pathlib import Path
@@ -23,30 +24,200 @@ from sqlite3 import (
 )
 from typing import Any, cast
 
-from k1insights.common.constants import FullSession, HeatData
+from pytz import utc
+
+from k1insights.common.batch import SessionBatch
+from k1insights.common.constants import (
+    LOCATIONS,
+    FullSession,
+    HeatData,
+    RepairStats,
+    RepairStatus,
+    WatcherCursor,
+)
+from k1insights.common.metrics import DB_COMMIT_SECONDS
 
 
 class K1DB:
+    # Each entry upgrades the schema by one version, tracked in user_version
+    MIGRATIONS: list[list[str]] = [
+        [
+            """
+            CREATE TABLE cursors (
+                location TEXT PRIMARY KEY NOT NULL,
+                client_id TEXT NOT NULL,
+                message_id TEXT NOT NULL,
+                last_heat INTEGER NOT NULL,
+                CHECK (LENGTH(location) > 0))
+            """,
+        ],
+        [
+            "ALTER TABLE heats ADD COLUMN heat_no INTEGER",
+            "CREATE INDEX idx_heats_heat_no ON heats (location, heat_no)",
+            """
+            CREATE TABLE repairs (
+                location TEXT NOT NULL,
+                heat_no INTEGER NOT NULL,
+                status INTEGER NOT NULL,
+                attempts INTEGER NOT NULL,
+                PRIMARY KEY (location, heat_no),
+                CHECK (
+                LENGTH(location) > 0
+                AND status BETWEEN 0 AND 2
+                AND attempts >= 0
+                ))
+            """,
+        ],
+        [
+            """
+            CREATE TABLE racer_locations (
+                rid INTEGER NOT NULL,
+                location TEXT NOT NULL,
+                PRIMARY KEY (rid, location),
+                CHECK (LENGTH(location) > 0)
+                ) WITHOUT ROWID
+            """,
+            """
+            CREATE TABLE racer_sweeps (
+                rid INTEGER PRIMARY KEY NOT NULL,
+                swept TIMESTAMP NOT NULL)
+            """,
+            """
+            INSERT INTO racer_locations
+            SELECT DISTINCT rid, location
+            FROM heats NATURAL JOIN sessions
+            """,
+        ],
+        [
+            "ALTER TABLE heats ADD COLUMN local_date DATE",
+            "UPDATE heats SET local_date = local_date(location, runtime)",
+            """
+            CREATE INDEX idx_heats_local_date ON heats (location,
+                                                        track,
+                                                        local_date)
+            """,
+        ],
+        [
+            # Runtimes become epoch seconds, which means rebuilding the table;
+            # the sessions pointing at it are only checked once it's refilled
+            "PRAGMA defer_foreign_keys = true",
+            "CREATE TEMP TABLE old_heats AS SELECT * FROM heats",
+            "DROP TABLE heats",
+            """
+            CREATE TABLE heats (
+                hid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL,
+                location TEXT NOT NULL,
+                track INTEGER NOT NULL,
+                runtime INTEGER NOT NULL,
+                type INTEGER NOT NULL,
+                wincond INTEGER NOT NULL,
+                heat_no INTEGER,
+                local_date DATE,
+                CHECK (
+                LENGTH(location) > 0
+                AND track >= 1
+                AND type >= 0
+                AND wincond >= 0
+                ))
+            """,
+            """
+            INSERT INTO heats
+            SELECT
+                hid,
+                location,
+                track,
+                CAST(STRFTIME('%s', runtime) AS INTEGER),
+                type,
+                wincond,
+                heat_no,
+                local_date
+            FROM old_heats
+            """,
+            "DROP TABLE old_heats",
+            """
+            CREATE UNIQUE INDEX idx_heats_kart_hist ON heats (location,
+                                                              track,
+                                                              runtime DESC)
+            """,
+            "CREATE INDEX idx_heats_heat_no ON heats (location, heat_no)",
+            """
+            CREATE INDEX idx_heats_local_date ON heats (location,
+                                                        track,
+                                                        local_date)
+            """,
+        ],
+        [
+            # Followed racers are a handful of all of them, so they're sought
+            # out rather than found by reading every racer
+            "CREATE INDEX idx_racers_follow ON racers (follow, rid)",
+        ],
+    ]
+
     session_times: itemgetter[tuple[float, ...]] = itemgetter(
         *(f"lap_{i}" for i in range(1, 51))
     )
     get_best_lap: Callable[[list[float]], float] = partial(
         lambda s: min(filter(None, K1DB.session_times(s)))
     )
+    # The same best lap, worked out by SQLite rather than per row in Python
+    best_lap_sql = "MIN({})".format(
+        ", ".join(f"COALESCE(lap_{i}, 300)" for i in range(1, 51))
+    )
 
     @staticmethod
     def make_timestamp(ts: bytes) -> datetime:
         return datetime.fromisoformat(ts.decode())
 
     @staticmethod
-    def connect(logger: Logger, db_path: Path) -> Connection | None:
+    def to_epoch(ts: datetime) -> int:
+        return int(ts.timestamp())
+
+    @staticmethod
+    @lru_cache(maxsize=4096)
+    def from_epoch(ts: int) -> datetime:
+        # Runtimes are kept as plain integers, so they're only turned into
+        # datetimes where something needs one
+        return datetime.fromtimestamp(ts, utc)
+
+    @staticmethod
+    def make_date(ts: bytes) -> date:
+        return date.fromisoformat(ts.decode())
+
+    @staticmethod
+    def local_date(location: str, runtime: datetime) -> date:
+        # Days are split at the location's midnight rather than UTC's, so a
+        # late race stays on the day it was run
+        tz = next(
+            (loc["tz"] for loc in LOCATIONS.values() if loc["location"] == location),
+            utc,
+        )
+        return runtime.astimezone(tz).date()
+
+    @staticmethod
+    def connect(
+        logger: Logger, db_path: Path, readonly: bool = False, check: bool = True
+    ) -> Connection | None:
         result = None
-        db = connect(db_path, detect_types=PARSE_DECLTYPES)
+
+        if readonly:
+            db = connect(
+                f"{db_path.absolute().as_uri()}?mode=ro",
+                detect_types=PARSE_DECLTYPES,
+                uri=True,
+            )
+        else:
+            db = connect(db_path, detect_types=PARSE_DECLTYPES)
 
         if db is not None:
+            # Reading every page of the database, the checks can take longer
+            # than whatever the connection is for, so callers that have
+            # already checked it once may skip them
             try:
-                tegridy = db.execute("PRAGMA integrity_check").fetchone()[0]
-                fk = db.execute("PRAGMA foreign_key_check").fetchone()
+                if check:
+                    tegridy = db.execute("PRAGMA integrity_check").fetchone()[0]
+                    fk = db.execute("PRAGMA foreign_key_check").fetchone()
+                else:
+                    (tegridy, fk) = ("ok", None)
             except DatabaseError:
                 logger.error("K1_DATA_DB does not contain path to valid database")
             else:
@@ -57,9 +228,42 @@ class K1DB:
                 else:
                     db.row_factory = Row
                     db.execute("PRAGMA foreign_keys = true")
+
+                    # Read-only connections belong to watcher processes, whose
+                    # parent has already migrated the database
+                    if not readonly:
+                        K1DB.migrate(db)
                     result = db
         return result
 
+    @staticmethod
+    def migrate(db: Connection) -> None:
+        if db.execute("PRAGMA user_version").fetchone()[0] < len(K1DB.MIGRATIONS):
+            # Take the write lock before rereading the version, so concurrent
+            # connections don't both try to apply the same migrations
+            db.execute("BEGIN IMMEDIATE")
+
+            db.create_function(
+                "local_date",
+                2,
+                lambda loc, ts: K1DB.local_date(
+                    loc, datetime.fromisoformat(ts)
+                ).isoformat(),
+                deterministic=True,
+            )
+
+            try:
+                version = db.execute("PRAGMA user_version").fetchone()[0]
+                for migration in K1DB.MIGRATIONS[version:]:
+                    for statement in migration:
+                        db.execute(statement)
+                db.execute(f"PRAGMA user_version = {len(K1DB.MIGRATIONS)}")
+            except BaseException:
+                db.rollback()
+                raise
+            else:
+                db.commit()
+
     @staticmethod
     def close(db: Connection) -> None:
         db.execute("PRAGMA optimize")
@@ -73,16 +277,30 @@ class K1DB:
         is_fast: bool = False,
         follow: bool = False,
     ) -> None:
-        with db:
+        with DB_COMMIT_SECONDS.time("add_racer"), db:
             db.execute(
                 """
-                INSERT OR IGNORE
+                INSERT
                 INTO racers
                 VALUES (?, ?, ?, ?)
+                ON CONFLICT (rid) DO UPDATE
+                SET follow = excluded.follow, fast = excluded.fast
                 """,
                 (racer_id, name, is_fast, follow),
             )
 
+    @staticmethod
+    def add_racers(db: Connection, racers: list[tuple[int, str]]) -> None:
+        with DB_COMMIT_SECONDS.time("add_racers"), db:
+            db.executemany(
+                """
+                INSERT OR IGNORE
+                INTO racers
+                VALUES (?, ?, 0, 0)
+                """,
+                racers,
+            )
+
     @staticmethod
     def add_heats(db: Connection, data: HeatData | list[FullSession]) -> None:
         if isinstance(data, dict):
@@ -90,22 +308,45 @@ class K1DB:
         elif not isinstance(data, list):
             raise ValueError("Provide data as dict or list of dicts")
 
-        with db:
+        with DB_COMMIT_SECONDS.time("add_heats"), db:
             db.executemany(
                 """
                 INSERT OR IGNORE
-                INTO heats (location, track, runtime, type, wincond)
-                VALUES (?, ?, ?, ?, ?)
+                INTO heats (
+                location, track, runtime, type, wincond, heat_no, local_date
+                )
+                VALUES (?, ?, ?, ?, ?, ?, ?)
                 """,
                 (
                     (
                         h["location"],
                         h["track"],
-                        h["time"],
+                        K1DB.to_epoch(h["time"]),
                         h["race_type"],
                         h["win_cond"],
+                        h.get("heat_no"),
+                        K1DB.local_date(h["location"], h["time"]),
+                    )
+                    for h in data
+                ),
+            )
+
+            # Heats saved before heat numbers were tracked pick them up here
+            db.executemany(
+                """
+                UPDATE heats
+                SET heat_no = ?
+                WHERE location = ? AND track = ? AND runtime = ? AND heat_no IS NULL
+                """,
+                (
+                    (
+                        h["heat_no"],
+                        h["location"],
+                        h["track"],
+                        K1DB.to_epoch(h["time"]),
                     )
                     for h in data
+                    if h.get("heat_no") is not None
                 ),
             )
 
@@ -116,18 +357,33 @@ class K1DB:
         elif not isinstance(data, list):
             raise ValueError("Provide data as dict or list of dicts")
 
-        with db:
+        with DB_COMMIT_SECONDS.time("add_sessions"), db:
             for session in data:
                 hid = db.execute(
                     """
                     SELECT hid FROM heats
                     WHERE location = ? AND track = ? AND runtime = ?
                     """,
-                    (session["location"], session["track"], session["time"]),
+                    (
+                        session["location"],
+                        session["track"],
+                        K1DB.to_epoch(session["time"]),
+                    ),
                 ).fetchone()["hid"]
 
                 session["hid"] = hid
 
+            # Keeps track of where each racer turns up, so refreshing their
+            # history can skip the locations they've never been to
+            db.executemany(
+                """
+                INSERT OR IGNORE
+                INTO racer_locations
+                VALUES (?, ?)
+                """,
+                ((s["rid"], s["location"]) for s in data),
+            )
+
             db.executemany(
                 """
                 INSERT OR IGNORE
@@ -155,6 +411,305 @@ class K1DB:
                 ),
             )
 
+    @staticmethod
+    def add_session_batch(db: Connection, batch: SessionBatch) -> None:
+        with DB_COMMIT_SECONDS.time("add_session_batch"), db:
+            # One lookup per heat rather than one per session
+            hids = [
+                db.execute(
+                    """
+                    SELECT hid FROM heats
+                    WHERE location = ? AND track = ? AND runtime = ?
+                    """,
+                    (heat["location"], heat["track"], K1DB.to_epoch(heat["time"])),
+                ).fetchone()["hid"]
+                for heat in batch.heats
+            ]
+
+            db.executemany(
+                """
+                INSERT OR IGNORE
+                INTO racer_locations
+                VALUES (?, ?)
+                """,
+                (
+                    (batch.rids[s], heat["location"])
+                    for (idx, heat) in enumerate(batch.heats)
+                    for s in batch.heat_sessions(idx)
+                ),
+            )
+
+            db.executemany(
+                """
+                INSERT OR IGNORE
+                INTO sessions
+                VALUES (
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?, ?, ?, ?, ?, ?,
+                ?, ?, ?, ?, ?
+                )
+                """,
+                (
+                    (
+                        hid,
+                        batch.rids[s],
+                        batch.positions[s],
+                        batch.karts[s],
+                        batch.scores[s],
+                        *batch.lap_times(s),
+                        *(None for _ in range(50 - batch.lap_count(s))),
+                    )
+                    for (idx, hid) in enumerate(hids)
+                    for s in batch.heat_sessions(idx)
+                ),
+            )
+
+    @staticmethod
+    def racer_locations(db: Connection, rid: int) -> tuple[list[str], datetime | None]:
+        with db:
+            locations = [
+                r["location"]
+                for r in db.execute(
+                    """
+                    SELECT location
+                    FROM racer_locations
+                    WHERE rid = ?
+                    ORDER BY location
+                    """,
+                    (rid,),
+                ).fetchall()
+            ]
+            swept = db.execute(
+                "SELECT swept FROM racer_sweeps WHERE rid = ?", (rid,)
+            ).fetchone()
+
+        return (locations, None if swept is None else swept["swept"])
+
+    @staticmethod
+    def add_racer_locations(
+        db: Connection,
+        rid: int,
+        locations: list[str],
+        swept: datetime | None = None,
+    ) -> None:
+        with DB_COMMIT_SECONDS.time("add_racer_locations"), db:
+            db.executemany(
+                """
+                INSERT OR IGNORE
+                INTO racer_locations
+                VALUES (?, ?)
+                """,
+                ((rid, loc) for loc in locations),
+            )
+
+            if swept is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO racer_sweeps VALUES (?, ?)", (rid, swept)
+                )
+
+    @staticmethod
+    def followed_racers(db: Connection) -> list[tuple[int, datetime | None]]:
+        # Session columns were declared without a type, so comparing them with
+        # typed columns stops their indexes being used; the unary plus drops
+        # the other side's affinity to get the seek back
+        with db:
+            return [
+                (
+                    r["rid"],
+                    None if r["newest"] is None else K1DB.from_epoch(r["newest"]),
+                )
+                for r in db.execute(
+                    """
+                    SELECT racers.rid, MAX(runtime) AS newest
+                    FROM racers
+                    LEFT JOIN sessions ON sessions.rid = +racers.rid
+                    LEFT JOIN heats ON heats.hid = sessions.hid
+                    WHERE follow = 1
+                    GROUP BY racers.rid
+                    ORDER BY racers.rid
+                    """
+                ).fetchall()
+            ]
+
+    @staticmethod
+    def stored_heats(db: Connection, loc: str, heats: list[int]) -> set[int]:
+        with db:
+            return {
+                r["heat_no"]
+                for r in db.execute(
+                    f"""
+                    SELECT heat_no
+                    FROM heats
+                    WHERE location = ? AND heat_no IN ({", ".join("?" * len(heats))})
+                    """,
+                    (loc, *heats),
+                ).fetchall()
+            }
+
+    @staticmethod
+    def get_cursor(db: Connection, loc: str) -> WatcherCursor | None:
+        result: WatcherCursor | None = None
+
+        with db:
+            cursor = db.execute(
+                """
+                SELECT client_id, message_id, last_heat
+                FROM cursors
+                WHERE location = ?
+                """,
+                (loc,),
+            ).fetchone()
+
+        if cursor is not None:
+            result = {
+                "client_id": cursor["client_id"],
+                "message_id": cursor["message_id"],
+                "last_heat": cursor["last_heat"],
+            }
+
+        return result
+
+    @staticmethod
+    def save_cursor(db: Connection, loc: str, cursor: WatcherCursor) -> None:
+        with DB_COMMIT_SECONDS.time("save_cursor"), db:
+            db.execute(
+                """
+                INSERT OR REPLACE
+                INTO cursors
+                VALUES (?, ?, ?, ?)
+                """,
+                (loc, cursor["client_id"], cursor["message_id"], cursor["last_heat"]),
+            )
+
+    @staticmethod
+    def heat_gaps(db: Connection, loc: str, window: int) -> list[int]:
+        result: list[int] = []
+
+        with db:
+            for gap in db.execute(
+                """
+                SELECT heat_no, next_no
+                FROM (
+                    SELECT heat_no, LEAD(heat_no) OVER (ORDER BY heat_no) AS next_no
+                    FROM heats
+                    WHERE location = ?1 AND heat_no >= (
+                        SELECT MAX(heat_no) FROM heats WHERE location = ?1
+                        ) - ?2
+                    )
+                WHERE next_no - heat_no > 1
+                """,
+                (loc, window),
+            ).fetchall():
+                result.extend(range(gap["heat_no"] + 1, gap["next_no"]))
+
+        return result
+
+    @staticmethod
+    def queue_repairs(db: Connection, loc: str, heats: list[int]) -> None:
+        with db:
+            db.executemany(
+                """
+                INSERT OR IGNORE
+                INTO repairs
+                VALUES (?, ?, ?, 0)
+                """,
+                ((loc, h, RepairStatus.PENDING) for h in heats),
+            )
+
+    @staticmethod
+    def pending_repairs(db: Connection, loc: str, limit: int) -> list[int]:
+        with db:
+            return [
+                r["heat_no"]
+                for r in db.execute(
+                    """
+                    SELECT heat_no
+                    FROM repairs
+                    WHERE location = ? AND status = ?
+                    ORDER BY heat_no DESC
+                    LIMIT ?
+                    """,
+                    (loc, RepairStatus.PENDING, limit),
+                ).fetchall()
+            ]
+
+    @staticmethod
+    def finish_repairs(
+        db: Connection,
+        loc: str,
+        attempted: list[int],
+        repaired: set[int],
+        max_attempts: int,
+    ) -> None:
+        with db:
+            db.executemany(
+                """
+                UPDATE repairs
+                SET attempts = attempts + 1,
+                status = CASE
+                    WHEN ?3 THEN ?4
+                    WHEN attempts + 1 >= ?5 THEN ?6
+                    ELSE status
+                    END
+                WHERE location = ?1 AND heat_no = ?2
+                """,
+                (
+                    (
+                        loc,
+                        h,
+                        h in repaired,
+                        RepairStatus.REPAIRED,
+                        max_attempts,
+                        RepairStatus.ABANDONED,
+                    )
+                    for h in attempted
+                ),
+            )
+
+    @staticmethod
+    def repair_stats(db: Connection, loc: str, window: int) -> RepairStats:
+        counts = {
+            RepairStatus.PENDING: 0,
+            RepairStatus.REPAIRED: 0,
+            RepairStatus.ABANDONED: 0,
+        }
+
+        with db:
+            floor = db.execute(
+                "SELECT MAX(heat_no) - ? FROM heats WHERE location = ?",
+                (window, loc),
+            ).fetchone()[0]
+
+            stored = db.execute(
+                "SELECT COUNT(*) FROM heats WHERE location = ? AND heat_no >= ?",
+                (loc, floor),
+            ).fetchone()[0]
+
+            for row in db.execute(
+                """
+                SELECT status, COUNT(*) AS total
+                FROM repairs
+                WHERE location = ? AND heat_no >= ?
+                GROUP BY status
+                """,
+                (loc, floor),
+            ).fetchall():
+                counts[row["status"]] = row["total"]
+
+        expected = stored + counts[RepairStatus.PENDING]
+        expected += counts[RepairStatus.ABANDONED]
+
+        return {
+            "stored": stored,
+            "pending": counts[RepairStatus.PENDING],
+            "repaired": counts[RepairStatus.REPAIRED],
+            "abandoned": counts[RepairStatus.ABANDONED],
+            "completeness": stored / expected if expected else 1.0,
+        }
+
     # @staticmethod
     # def last_heats(db):
     #   result = {}
@@ -179,35 +734,155 @@ class K1DB:
         since: datetime | date,
         track: int = 1,
         kart: int | None = None,
+        until: date = date.max,
     ) -> dict[date, float] | dict[date, dict[int, float]]:
         result: dict[date, Any] = {}
 
+        if isinstance(since, datetime):
+            since = K1DB.local_date(loc, since)
+
+        # See followed_racers for the unary plus
         with db:
-            for session in db.execute(
-                """
-                SELECT *
-                FROM heats NATURAL JOIN sessions
-                WHERE location = ? AND track = ? AND runtime >= ?
+            for day in db.execute(
+                f"""
+                SELECT local_date, kart, MIN({K1DB.best_lap_sql}) AS best_lap
+                FROM heats JOIN sessions ON sessions.hid = +heats.hid
+                WHERE location = ?1 AND track = ?2
+                AND local_date BETWEEN ?3 AND ?5
+                AND (?4 IS NULL OR kart = ?4)
+                GROUP BY local_date, kart
+                HAVING best_lap < 300
                 """,
-                (loc, track, since),
+                (loc, track, since, kart, until),
             ).fetchall():
 
-                best_lap = K1DB.get_best_lap(session)
-
                 if kart is None:
-                    heat_date = result.setdefault(session["runtime"].date(), {})
-                    curr_best = heat_date.get(session["kart"], 300)
+                    heat_date = result.setdefault(day["local_date"], {})
+                    heat_date[day["kart"]] = day["best_lap"]
+                else:
+                    result[day["local_date"]] = day["best_lap"]
 
-                    if best_lap < curr_best:
-                        heat_date[session["kart"]] = best_lap
+        return result
 
-                elif session["kart"] == kart:
-                    curr_best = result.get(session["runtime"].date(), 300)
+    @staticmethod
+    def location_top_karts(
+        db: Connection,
+        loc: str,
+        since: date,
+        track: int,
+        limit: int,
+        until: date = date.max,
+    ) -> list[tuple[date, list[tuple[int, float]]]]:
+        # Ranked in SQLite, so only the karts that get shown ever leave it,
+        # however many karts the location runs
+        with db:
+            rows = db.execute(
+                f"""
+                SELECT local_date, kart, best_lap
+                FROM (
+                    SELECT
+                        local_date,
+                        kart,
+                        best_lap,
+                        ROW_NUMBER() OVER (
+                            PARTITION BY local_date ORDER BY best_lap, kart
+                            ) AS place
+                    FROM (
+                        SELECT local_date, kart, MIN({K1DB.best_lap_sql}) AS best_lap
+                        FROM heats JOIN sessions ON sessions.hid = +heats.hid
+                        WHERE location = ?1 AND track = ?2
+                        AND local_date BETWEEN ?3 AND ?5
+                        GROUP BY local_date, kart
+                        HAVING best_lap < 300
+                        )
+                    )
+                WHERE place <= ?4
+                ORDER BY local_date DESC, place
+                """,
+                (loc, track, since, limit, until),
+            ).fetchall()
 
-                    if best_lap < curr_best:
-                        result[session["runtime"].date()] = best_lap
+        return [
+            (day, [(r["kart"], r["best_lap"]) for r in karts])
+            for (day, karts) in groupby(rows, itemgetter("local_date"))
+        ]
 
-        return result
+    @staticmethod
+    def location_karts(
+        db: Connection, loc: str, since: date, track: int, until: date = date.max
+    ) -> set[int]:
+        with db:
+            return {
+                r["kart"]
+                for r in db.execute(
+                    """
+                    SELECT DISTINCT kart
+                    FROM heats JOIN sessions ON sessions.hid = +heats.hid
+                    WHERE location = ? AND track = ?
+                    AND local_date BETWEEN ? AND ?
+                    """,
+                    (loc, track, since, until),
+                ).fetchall()
+            }
+
+    @staticmethod
+    def neighbour_days(
+        db: Connection, loc: str, track: int, since: date, until: date
+    ) -> tuple[date | None, date | None]:
+        # The nearest raced days either side of a page, each a single seek, so
+        # paging back costs the same however far back it goes
+        with db:
+            older = db.execute(
+                """
+                SELECT local_date
+                FROM heats
+                WHERE location = ? AND track = ? AND local_date < ?
+                ORDER BY local_date DESC
+                LIMIT 1
+                """,
+                (loc, track, since),
+            ).fetchone()
+            newer = db.execute(
+                """
+                SELECT local_date
+                FROM heats
+                WHERE location = ? AND track = ? AND local_date > ?
+                ORDER BY local_date
+                LIMIT 1
+                """,
+                (loc, track, until),
+            ).fetchone()
+
+        return (
+            None if older is None else older["local_date"],
+            None if newer is None else newer["local_date"],
+        )
+
+    @staticmethod
+    def watermark(db: Connection) -> int:
+        # Sessions are only ever added, and always after their heat, so the
+        # newest session's rowid moves whenever anything shown could change
+        with db:
+            return int(
+                db.execute("SELECT COALESCE(MAX(rowid), 0) FROM sessions").fetchone()[0]
+            )
+
+    @staticmethod
+    def changed_karts(db: Connection, watermark: int) -> set[tuple[str, int]]:
+        # Every kart raced at each location since an earlier watermark, which
+        # is everything whose pages could now look different
+        with db:
+            return {
+                (r["location"], r["kart"])
+                for r in db.execute(
+                    """
+                    SELECT DISTINCT location, kart
+                    FROM sessions JOIN heats ON heats.hid = sessions.hid
+                    WHERE sessions.rowid > ?
+                    """,
+                    (watermark,),
+                ).fetchall()
+            }
 
     @staticmethod
     def create_db(dest: Path) -> None:
@@ -270,7 +945,9 @@ class K1DB:
             """
         )
 
+        K1DB.migrate(db)
         K1DB.close(db)
 
 
 register_converter("timestamp", K1DB.make_timestamp)
+register_converter("date", K1DB.make_date)
@@ -0,0 +1,190 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections.abc import Iterator
+from time import perf_counter
+from types import TracebackType
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Metric(ABC):
+    kind = "untyped"
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+        REGISTRY.append(self)
+
+    def _label_str(self, values: tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{k}="{escape(v)}"' for (k, v) in zip(self.labels, values)]
+
+        if extra:
+            pairs.append(extra)
+
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    @abstractmethod
+    def samples(self) -> Iterator[str]:
+        pass
+
+    def render(self) -> Iterator[str]:
+        yield f"# HELP {self.name} {self.doc}"
+        yield f"# TYPE {self.name} {self.kind}"
+        yield from self.samples()
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, doc, labels)
+        self.values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> Iterator[str]:
+        for labels, value in sorted(self.values.items()):
+            yield f"{self.name}{self._label_str(labels)} {value}"
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, *labels: str) -> None:
+        self.values[labels] = value
+
+
+class Timer:
+    __slots__ = ("_hist", "_labels", "_start")
+
+    def __init__(self, hist: Histogram, labels: tuple[str, ...]) -> None:
+        self._hist = hist
+        self._labels = labels
+        self._start = 0.0
+
+    def __enter__(self) -> Timer:
+        self._start = perf_counter()
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self._hist.observe(perf_counter() - self._start, *self._labels)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        doc: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, doc, labels)
+        self.buckets = buckets
+        # Per label set: one count per bucket plus +Inf, then the running sum
+        self.values: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        counts = self.values.get(labels)
+
+        if counts is None:
+            counts = self.values[labels] = [0.0] * (len(self.buckets) + 2)
+
+        counts[bisect_left(self.buckets, value)] += 1
+        counts[-1] += value
+
+    def time(self, *labels: str) -> Timer:
+        return Timer(self, labels)
+
+    def samples(self) -> Iterator[str]:
+        for labels, counts in sorted(self.values.items()):
+            total = 0.0
+
+            for bound, count in zip((*self.buckets, "+Inf"), counts):
+                total += count
+                le = self._label_str(labels, f'le="{bound}"')
+                yield f"{self.name}_bucket{le} {total}"
+
+            yield f"{self.name}_sum{self._label_str(labels)} {counts[-1]}"
+            yield f"{self.name}_count{self._label_str(labels)} {total}"
+
+
+def render() -> str:
+    return "\n".join(line for metric in REGISTRY for line in metric.render()) + "\n"
+
+
+REGISTRY: list[Metric] = []
+
+POLL_SECONDS = Histogram(
+    "k1_poll_seconds", "Round trip time of live scoreboard polls", ("location",)
+)
+POLLS = Counter("k1_polls_total", "Live scoreboard polls made", ("location",))
+FETCH_NETWORK_SECONDS = Histogram(
+    "k1_fetch_network_seconds", "Time spent downloading ClubSpeed pages", ("page",)
+)
+FETCH_PARSE_SECONDS = Histogram(
+    "k1_fetch_parse_seconds", "Time spent parsing ClubSpeed pages", ("page",)
+)
+FETCH_WAIT_SECONDS = Histogram(
+    "k1_fetch_wait_seconds", "Time fetches spent queued for a slot", ("priority",)
+)
+FETCH_COALESCED = Counter(
+    "k1_fetch_coalesced_total",
+    "Fetches answered by an identical request already in flight",
+    ("page",),
+)
+FETCH_ERRORS = Counter(
+    "k1_fetch_errors_total", "ClubSpeed fetches that failed", ("page", "reason")
+)
+PARSE_FAILURES = Counter(
+    "k1_parse_failures_total", "ClubSpeed pages that could not be parsed", ("page",)
+)
+BREAKER_STATE = Gauge(
+    "k1_breaker_state",
+    "Circuit state per K1 server: 0 closed, 1 open, 2 half-open",
+    ("host",),
+)
+BREAKER_REJECTED = Counter(
+    "k1_breaker_rejected_total",
+    "Requests refused without trying because the circuit was open",
+    ("host",),
+)
+RETRIES = Counter("k1_retries_total", "Work deferred for another try", ("reason",))
+DB_COMMIT_SECONDS = Histogram(
+    "k1_db_commit_seconds", "Time spent writing to the database", ("operation",)
+)
+HEATS_INGESTED = Counter(
+    "k1_heats_ingested_total", "Heats committed to the database", ("location",)
+)
+FOLLOWED_HEATS = Counter(
+    "k1_followed_heats_total",
+    "Heats added by refreshing followed racers",
+    ("location",),
+)
+HEAT_COMPLETENESS = Gauge(
+    "k1_heat_completeness",
+    "Fraction of recent heat numbers stored in the database",
+    ("location",),
+)
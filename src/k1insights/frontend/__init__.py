@@ -7,15 +7,20 @@
 
 from __future__ import annotations
 
+from os import getpid
 from pathlib import Path
+from sqlite3 import Connection
 
-from flask import Flask, abort, g
+from flask import Flask, Response, abort, g, request
 from werkzeug.routing import BaseConverter
 
-from k1insights.common.constants import DB_PATH, LOCATIONS, K1Location
+from k1insights.common.constants import CACHE_PATH, DB_PATH, LOCATIONS, K1Location
 from k1insights.common.db import K1DB
+from k1insights.frontend.assets import asset_url, send_asset
+from k1insights.frontend.cache import get_cache
 from k1insights.frontend.index import IndexView
 from k1insights.frontend.kart import KartView
+from k1insights.frontend.live import LiveView, get_feed
 from k1insights.frontend.location import LocationView
 
 
@@ -33,6 +38,8 @@ app = Flask(
     template_folder=str(Path(__file__).parent / "templates"),
 )
 app.url_map.converters["location"] = LocationConverter
+app.add_template_global(asset_url, "asset")
+app.add_url_rule("/static/dist/<path:filename>", view_func=send_asset)
 app.add_url_rule("/", view_func=IndexView.as_view("render_index"))
 app.add_url_rule(
     "/locations/<location:loc>", view_func=LocationView.as_view("render_location")
@@ -41,13 +48,50 @@ app.add_url_rule(
     "/locations/<location:loc>/karts/<int:kart>",
     view_func=KartView.as_view("render_kart"),
 )
+app.add_url_rule(
+    "/locations/<location:loc>/live", view_func=LiveView.as_view("stream_location")
+)
+
+
+NO_DB_ENDPOINTS = {"stream_location", "send_asset", "static"}
+_CHECKED: set[tuple[Path, int]] = set()
+
+
+def open_db(path: Path) -> Connection | None:
+    # Checking the database costs more than most pages do, so each worker
+    # checks it on its first connection and trusts it after that
+    key = (path, getpid())
+    result = K1DB.connect(app.logger, path, check=key not in _CHECKED)
+
+    if result is not None:
+        _CHECKED.add(key)
+
+    return result
 
 
 @app.before_request
 def get_db() -> None:
-    g.db = K1DB.connect(app.logger, DB_PATH)
+    # Live streams are fed by their worker's poller and assets come off disk,
+    # so neither holds a connection open for as long as they're being served
+    if request.endpoint not in NO_DB_ENDPOINTS:
+        g.db = open_db(DB_PATH)
+
+    g.cache = get_cache(CACHE_PATH)
+    g.feed = get_feed(app.logger, DB_PATH, CACHE_PATH)
+
+
+@app.after_request
+def count_view(response: Response) -> Response:
+    # Warming skips the request hooks, so only real visitors are counted
+    if request.endpoint == "render_kart" and response.status_code == 200:
+        g.cache.count_view(request.path)
+
+    return response
 
 
 @app.teardown_request
 def close_db(exc: BaseException | None) -> None:
-    K1DB.close(g.db)
+    db = g.pop("db", None)
+
+    if db is not None:
+        K1DB.close(db)
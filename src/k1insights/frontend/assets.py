@@ -0,0 +1,126 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from functools import lru_cache
+from gzip import compress
+from hashlib import sha256
+from importlib import import_module
+from json import JSONDecodeError, dumps, loads
+from mimetypes import guess_type
+from pathlib import Path
+from shutil import rmtree
+
+from flask import Response, request, send_from_directory
+
+
+STATIC_DIR = Path(__file__).parent / "static"
+BUILD_DIR = STATIC_DIR / "dist"
+MANIFEST = BUILD_DIR / "manifest.json"
+# A year, which is as long as any cache will keep something
+ASSET_MAX_AGE = 365 * 24 * 60 * 60
+# Best first; brotli is only used if it's installed
+ENCODINGS = [("br", ".br"), ("gzip", ".gz")]
+
+
+def compressors() -> dict[str, Callable[[bytes], bytes]]:
+    result: dict[str, Callable[[bytes], bytes]] = {
+        "gzip": lambda data: compress(data, 9, mtime=0)
+    }
+
+    try:
+        result["br"] = import_module("brotli").compress
+    except ImportError:
+        pass
+
+    return result
+
+
+def build_assets(src: Path = STATIC_DIR, dest: Path = BUILD_DIR) -> dict[str, str]:
+    result = {}
+    packers = compressors()
+
+    rmtree(dest, ignore_errors=True)
+
+    for path in sorted(src.rglob("*")):
+        if not path.is_file() or dest in path.parents:
+            continue
+
+        data = path.read_bytes()
+        name = path.relative_to(src)
+
+        # Source maps are found by name from the files they describe, so they
+        # keep theirs; everything else is named after its content
+        if path.suffix == ".map":
+            built = dest / name
+        else:
+            digest = sha256(data).hexdigest()[:12]
+            built = dest / name.with_name(f"{path.stem}.{digest}{path.suffix}")
+            result[name.as_posix()] = built.relative_to(dest).as_posix()
+
+        built.parent.mkdir(parents=True, exist_ok=True)
+        built.write_bytes(data)
+
+        for (encoding, suffix) in ENCODINGS:
+            if encoding in packers:
+                built.with_name(built.name + suffix).write_bytes(
+                    packers[encoding](data)
+                )
+
+    dest.mkdir(parents=True, exist_ok=True)
+    (dest / MANIFEST.name).write_text(dumps(result, indent=2, sort_keys=True))
+    manifest.cache_clear()
+    return result
+
+
+@lru_cache(maxsize=1)
+def manifest() -> dict[str, str]:
+    result: dict[str, str] = {}
+
+    try:
+        result.update(loads(MANIFEST.read_text()))
+    except (FileNotFoundError, JSONDecodeError, TypeError, ValueError):
+        pass
+
+    return result
+
+
+def asset_url(name: str) -> str:
+    # Without a build the original file is served, so a checkout still works
+    if name in manifest():
+        return f"/static/dist/{manifest()[name]}"
+    else:
+        return f"/static/{name}"
+
+
+def send_asset(filename: str) -> Response:
+    (sent, encoding) = (filename, None)
+
+    for (accepted, suffix) in ENCODINGS:
+        if request.accept_encodings[accepted] and (
+            BUILD_DIR.joinpath(filename + suffix).is_file()
+        ):
+            (sent, encoding) = (filename + suffix, accepted)
+            break
+
+    response = send_from_directory(
+        BUILD_DIR,
+        sent,
+        mimetype=guess_type(filename)[0],
+        max_age=ASSET_MAX_AGE,
+    )
+
+    # Names change with their content, so nothing ever needs revalidating
+    if encoding is not None:
+        response.content_encoding = encoding
+
+    response.vary.add("Accept-Encoding")
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
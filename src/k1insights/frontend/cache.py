@@ -0,0 +1,181 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from collections.abc import Callable
+from pathlib import Path
+from pickle import HIGHEST_PROTOCOL, dumps, loads
+from sqlite3 import connect
+from threading import get_ident
+from time import time
+from typing import Any, TypeVar
+
+from k1insights.common.constants import CACHE_MAX_ENTRIES, CACHE_TTL
+
+
+T = TypeVar("T")
+
+
+class ResultCache:
+    def __init__(
+        self, path: Path, ttl: int = CACHE_TTL, max_entries: int = CACHE_MAX_ENTRIES
+    ) -> None:
+        # Every gunicorn worker opens the same file, so a result worked out by
+        # one of them is there for the rest
+        self._db = connect(path, timeout=30)
+        self._ttl = ttl
+        self._max_entries = max(max_entries, 1)
+
+        self._db.execute("PRAGMA journal_mode = WAL")
+        self._db.execute("PRAGMA synchronous = NORMAL")
+
+        with self._db:
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    watermark INTEGER NOT NULL,
+                    expires INTEGER NOT NULL,
+                    used INTEGER NOT NULL,
+                    value BLOB NOT NULL
+                )
+                """
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS idx_results_used ON results (used)"
+            )
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS views (
+                    page TEXT PRIMARY KEY,
+                    hits INTEGER NOT NULL
+                )
+                """
+            )
+            self._db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS claims (
+                    key TEXT PRIMARY KEY,
+                    expires INTEGER NOT NULL
+                )
+                """
+            )
+
+    def get(self, key: str, watermark: int) -> Any | None:
+        result = None
+        now = int(time())
+
+        row = self._db.execute(
+            "SELECT watermark, expires, used, value FROM results WHERE key = ?",
+            (key,),
+        ).fetchone()
+
+        # Anything computed before the data last changed is as good as missing
+        if row is not None and row[0] == watermark and row[1] > now:
+            result = loads(row[3])
+
+            # Bumped at most once a second, so busy keys don't queue writers
+            if row[2] < now:
+                with self._db:
+                    self._db.execute(
+                        "UPDATE results SET used = ? WHERE key = ?", (now, key)
+                    )
+
+        return result
+
+    def set(self, key: str, watermark: int, value: Any) -> None:
+        now = int(time())
+
+        with self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)",
+                (key, watermark, now + self._ttl, now, dumps(value, HIGHEST_PROTOCOL)),
+            )
+            self._db.execute(
+                """
+                DELETE FROM results
+                WHERE expires <= ?1 OR key IN (
+                    SELECT key FROM results ORDER BY used DESC LIMIT -1 OFFSET ?2
+                    )
+                """,
+                (now, self._max_entries),
+            )
+
+    def keep(self, watermark: int, ttl: int) -> int:
+        # Whatever was worked out for the current data is good until it moves
+        # on, however quiet it gets, so only the watermark needs to expire it
+        with self._db:
+            return self._db.execute(
+                "UPDATE results SET expires = MAX(expires, ?) WHERE watermark = ?",
+                (int(time()) + ttl, watermark),
+            ).rowcount
+
+    def cached(self, key: str, watermark: int, compute: Callable[[], T]) -> T:
+        result = self.get(key, watermark)
+
+        if result is None:
+            result = compute()
+            self.set(key, watermark, result)
+
+        return result
+
+    def count_view(self, page: str) -> None:
+        with self._db:
+            self._db.execute(
+                """
+                INSERT INTO views VALUES (?, 1)
+                ON CONFLICT (page) DO UPDATE SET hits = hits + 1
+                """,
+                (page,),
+            )
+
+    def popular(self, limit: int) -> list[str]:
+        return [
+            row[0]
+            for row in self._db.execute(
+                "SELECT page FROM views ORDER BY hits DESC, page LIMIT ?", (limit,)
+            )
+        ]
+
+    def claim(self, key: str) -> bool:
+        now = int(time())
+
+        # Only the first caller gets a key until it expires along with whatever
+        # was cached under it
+        with self._db:
+            self._db.execute("DELETE FROM claims WHERE expires <= ?", (now,))
+            result = (
+                self._db.execute(
+                    "INSERT OR IGNORE INTO claims VALUES (?, ?)", (key, now + self._ttl)
+                ).rowcount
+                == 1
+            )
+
+        return result
+
+    def release(self, key: str) -> None:
+        # Gives up a claim whose work failed, so someone else can try it
+        with self._db:
+            self._db.execute("DELETE FROM claims WHERE key = ?", (key,))
+
+    def close(self) -> None:
+        self._db.close()
+
+
+_CACHES: dict[tuple[Path, int], ResultCache] = {}
+
+
+def get_cache(path: Path) -> ResultCache:
+    # Opened on first use by each thread, so every worker gets its own
+    # connections after forking and threaded workers don't share one
+    key = (path, get_ident())
+
+    if key not in _CACHES:
+        _CACHES[key] = ResultCache(path)
+
+    return _CACHES[key]
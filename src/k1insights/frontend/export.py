@@ -0,0 +1,116 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+from json import JSONDecodeError, dumps, loads
+from pathlib import Path
+from shutil import copytree
+from typing import TypedDict
+
+from flask import g
+
+from k1insights.common.constants import LOCATION_LOOKBACK_DAYS, LOCATIONS
+from k1insights.common.db import K1DB
+from k1insights.frontend import app
+from k1insights.frontend.cache import ResultCache
+from k1insights.frontend.render import render_pages
+
+
+MANIFEST = ".k1-static.json"
+
+
+class Manifest(TypedDict):
+    watermark: int
+    pages: dict[str, str]
+
+
+def read_manifest(dest: Path) -> Manifest:
+    result: Manifest = {"watermark": 0, "pages": {}}
+
+    try:
+        result.update(loads((dest / MANIFEST).read_text()))
+    except (FileNotFoundError, JSONDecodeError, TypeError, ValueError):
+        pass
+
+    return result
+
+
+def page_file(dest: Path, page: str) -> Path:
+    # Every page is a directory index, so the same urls work from any server
+    return dest.joinpath(page.strip("/"), "index.html")
+
+
+def write_file(path: Path, content: str) -> None:
+    # Swapped in whole, so the server never hands out half a page
+    path.parent.mkdir(parents=True, exist_ok=True)
+    temp = path.with_name(f".{path.name}.tmp")
+    temp.write_text(content)
+    temp.replace(path)
+
+
+def render_site(db_path: Path, cache_path: Path, dest: Path, full: bool = False) -> int:
+    result = 0
+    db = K1DB.connect(app.logger, db_path)
+
+    if db is not None:
+        cache = ResultCache(cache_path)
+        old = read_manifest(dest)
+        manifest: Manifest = {"watermark": K1DB.watermark(db), "pages": {"/": ""}}
+        changed = K1DB.changed_karts(db, 0 if full else old["watermark"])
+        # The index doesn't touch the database, so it's always redrawn
+        stale = ["/"]
+
+        # Pages are stamped with the local day they were drawn on, since their
+        # window moves on at midnight even when nothing new has been raced
+        for (key, loc) in LOCATIONS.items():
+            today = datetime.now(loc["tz"]).date()
+            since = today - timedelta(days=LOCATION_LOOKBACK_DAYS)
+            karts: set[int] = set()
+
+            for track in range(1, loc["tracks"] + 1):
+                karts.update(K1DB.location_karts(db, loc["location"], since, track))
+
+            pages = {f"/locations/{key}": any(loc["location"] == c[0] for c in changed)}
+            pages.update(
+                (f"/locations/{key}/karts/{kart}", (loc["location"], kart) in changed)
+                for kart in sorted(karts)
+            )
+
+            for (page, moved) in pages.items():
+                manifest["pages"][page] = today.isoformat()
+
+                if full or moved or old["pages"].get(page) != today.isoformat():
+                    stale.append(page)
+
+        # The request's teardown closes the connection
+        with app.test_request_context():
+            g.db = db
+            g.cache = cache
+            g.static = True
+
+            for (page, html) in render_pages(stale):
+                write_file(page_file(dest, page), html)
+                result += 1
+
+        cache.close()
+
+        # Karts that have dropped out of every location page go with it
+        for page in old["pages"].keys() - manifest["pages"].keys():
+            page_file(dest, page).unlink(missing_ok=True)
+
+        copytree(Path(__file__).parent / "static", dest / "static", dirs_exist_ok=True)
+        write_file(dest / MANIFEST, dumps(manifest, indent=2, sort_keys=True))
+        app.logger.info(
+            "Rendered %s of %s page(s) at watermark %s",
+            result,
+            len(manifest["pages"]),
+            manifest["watermark"],
+        )
+
+    return result
@@ -7,7 +7,7 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+from datetime import date
 from typing import Any, cast
 
 from flask import g, render_template
@@ -15,22 +15,36 @@ from flask.views import View
 
 from k1insights.common.constants import KART_LOOKBACK_DAYS, K1Location
 from k1insights.common.db import K1DB
+from k1insights.frontend.paging import date_page, date_range
 
 
 class KartView(View):
     methods = ["GET"]
 
-    def dispatch_request(self, **kwargs: dict[str, Any]) -> str:
-        loc = cast(K1Location, kwargs["loc"])
-        kart = cast(int, kwargs["kart"])
-        loc_str = loc["location"]
-        url_loc = loc_str.replace(" ", "_").lower()
-        then = datetime.utcnow().date() - timedelta(days=KART_LOOKBACK_DAYS)
+    def results(
+        self, loc: K1Location, kart: int, since: date, until: date
+    ) -> dict[str, Any]:
         times = {}
 
         for track in range(1, loc["tracks"] + 1):
-            track_times = K1DB.location_ftd(g.db, loc_str, then, track, kart)
+            track_times = K1DB.location_ftd(
+                g.db, loc["location"], since, track, kart, until
+            )
             times[track] = track_times
 
-        ctx = {"records": times, "url_loc": url_loc, "location": loc_str, "kart": kart}
+        return {"records": times, "page": date_page(loc, since, until)}
+
+    def dispatch_request(self, **kwargs: dict[str, Any]) -> str:
+        loc = cast(K1Location, kwargs["loc"])
+        kart = cast(int, kwargs["kart"])
+        loc_str = loc["location"]
+        url_loc = loc_str.replace(" ", "_").lower()
+        (since, until) = date_range(loc, KART_LOOKBACK_DAYS)
+
+        ctx = g.cache.cached(
+            f"kart:{url_loc}:{kart}:{since}:{until}",
+            K1DB.watermark(g.db),
+            lambda: self.results(loc, kart, since, until),
+        )
+        ctx.update(url_loc=url_loc, location=loc_str, kart=kart)
         return render_template("kart.html", **ctx)
@@ -0,0 +1,155 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+from datetime import date, datetime
+from json import dumps
+from logging import Logger
+from pathlib import Path
+from sqlite3 import Connection, OperationalError
+from threading import Condition, Thread
+from time import monotonic, sleep
+from typing import Any, TypedDict, cast
+
+from flask import Response, g
+from flask.views import View
+
+from k1insights.common.constants import (
+    LIVE_INTERVAL,
+    LIVE_KEEPALIVE,
+    LIVE_TIMEOUT,
+    LOCATIONS,
+    K1Location,
+)
+from k1insights.common.db import K1DB
+from k1insights.frontend.cache import ResultCache
+from k1insights.frontend.location import LocationView
+
+
+class RowUpdate(TypedDict):
+    track: int
+    date: str
+    karts: list[tuple[int, float]]
+
+
+def today_rows(db: Connection, loc: K1Location, today: date) -> list[RowUpdate]:
+    result: list[RowUpdate] = []
+
+    for track in range(1, loc["tracks"] + 1):
+        for (day, karts) in K1DB.location_top_karts(
+            db, loc["location"], today, track, LocationView.top_karts
+        ):
+            result.append({"track": track, "date": day.isoformat(), "karts": karts})
+
+    return result
+
+
+class LiveFeed:
+    def __init__(self, logger: Logger, db_path: Path, cache_path: Path) -> None:
+        self._logger = logger
+        self._db_path = db_path
+        self._cache_path = cache_path
+        self._changed = Condition()
+        self._watermark = -1
+        self._rows: dict[str, list[RowUpdate]] = {}
+        self._thread: Thread | None = None
+
+    def refresh(self, db: Connection, cache: ResultCache) -> None:
+        watermark = K1DB.watermark(db)
+
+        if watermark != self._watermark:
+            rows = {}
+
+            # Worked out once for every worker, whichever polls first
+            for (key, loc) in LOCATIONS.items():
+                today = datetime.now(loc["tz"]).date()
+                rows[key] = cache.cached(
+                    f"live:{key}:{today}",
+                    watermark,
+                    lambda: today_rows(db, loc, today),
+                )
+
+            with self._changed:
+                self._watermark = watermark
+                self._rows = rows
+                self._changed.notify_all()
+
+    def poll(self) -> None:
+        # However many pages are open, each worker runs one query per interval
+        db = K1DB.connect(self._logger, self._db_path)
+
+        if db is not None:
+            cache = ResultCache(self._cache_path)
+
+            while True:
+                try:
+                    self.refresh(db, cache)
+                except OperationalError as e:
+                    self._logger.warning("Skipping live update: %s", e)
+
+                sleep(LIVE_INTERVAL)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = Thread(target=self.poll, name="k1-live", daemon=True)
+            self._thread.start()
+
+    def subscribe(self, key: str, timeout: int = LIVE_TIMEOUT) -> Iterator[str]:
+        sent: dict[int, RowUpdate] = {}
+        seen = -1
+        deadline = monotonic() + timeout
+
+        # Browsers reconnect by themselves, so streams end every so often
+        # rather than holding a worker thread forever
+        yield f"retry: {LIVE_INTERVAL * 1000}\n\n"
+
+        while monotonic() < deadline:
+            with self._changed:
+                self._changed.wait_for(
+                    lambda: self._watermark != seen,
+                    min(LIVE_KEEPALIVE, max(deadline - monotonic(), 0)),
+                )
+                seen = self._watermark
+                rows = self._rows.get(key, [])
+
+            # Only rows that differ from what this page was last sent go out
+            updates = [row for row in rows if sent.get(row["track"]) != row]
+
+            for row in updates:
+                sent[row["track"]] = row
+                yield f"event: row\ndata: {dumps(row, separators=(',', ':'))}\n\n"
+
+            if not updates:
+                yield ": keepalive\n\n"
+
+
+_FEEDS: dict[Path, LiveFeed] = {}
+
+
+def get_feed(logger: Logger, db_path: Path, cache_path: Path) -> LiveFeed:
+    # Polling waits for the first subscriber, so it only runs in forked workers
+    if db_path not in _FEEDS:
+        _FEEDS[db_path] = LiveFeed(logger, db_path, cache_path)
+
+    return _FEEDS[db_path]
+
+
+class LiveView(View):
+    methods = ["GET"]
+
+    def dispatch_request(self, **kwargs: dict[str, Any]) -> Response:
+        loc = cast(K1Location, kwargs["loc"])
+        url_loc = loc["location"].replace(" ", "_").lower()
+
+        g.feed.start()
+        return Response(
+            g.feed.subscribe(url_loc),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
@@ -7,7 +7,7 @@
 
 from __future__ import annotations
 
-from datetime import datetime, timedelta
+from datetime import date
 from typing import Any, cast
 
 from flask import g, render_template
@@ -15,31 +15,42 @@ from flask.views import View
 
 from k1insights.common.constants import LOCATION_LOOKBACK_DAYS, K1Location
 from k1insights.common.db import K1DB
+from k1insights.frontend.paging import date_page, date_range
 
 
 class LocationView(View):
     methods = ["GET"]
+    top_karts = 5
 
-    def dispatch_request(self, **kwargs: dict[str, Any]) -> str:
-        loc = cast(K1Location, kwargs["loc"])
-        loc_str = loc["location"]
-        url_loc = loc_str.replace(" ", "_").lower()
-        then = datetime.utcnow().date() - timedelta(days=LOCATION_LOOKBACK_DAYS)
+    def results(self, loc: K1Location, since: date, until: date) -> dict[str, Any]:
         times = {}
         all_karts: set[int] = set()
 
         for track in range(1, loc["tracks"] + 1):
-            track_times = K1DB.location_ftd(g.db, loc_str, then, track)
-            times[track] = track_times
-
-            for day_times in track_times.values():
-                if isinstance(day_times, dict):
-                    all_karts.update(day_times.keys())
-
-        ctx = {
+            times[track] = K1DB.location_top_karts(
+                g.db, loc["location"], since, track, self.top_karts, until
+            )
+            all_karts.update(
+                K1DB.location_karts(g.db, loc["location"], since, track, until)
+            )
+
+        return {
             "records": times,
+            "top_karts": self.top_karts,
             "all_karts": all_karts,
-            "url_loc": url_loc,
-            "location": loc_str,
+            "page": date_page(loc, since, until),
         }
+
+    def dispatch_request(self, **kwargs: dict[str, Any]) -> str:
+        loc = cast(K1Location, kwargs["loc"])
+        loc_str = loc["location"]
+        url_loc = loc_str.replace(" ", "_").lower()
+        (since, until) = date_range(loc, LOCATION_LOOKBACK_DAYS)
+
+        ctx = g.cache.cached(
+            f"location:{url_loc}:{since}:{until}:{self.top_karts}",
+            K1DB.watermark(g.db),
+            lambda: self.results(loc, since, until),
+        )
+        ctx.update(url_loc=url_loc, location=loc_str)
         return render_template("location.html", **ctx)
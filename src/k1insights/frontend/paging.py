@@ -0,0 +1,68 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta
+from typing import TypedDict
+
+from flask import abort, g, request
+
+from k1insights.common.constants import K1Location
+from k1insights.common.db import K1DB
+
+
+class DatePage(TypedDict):
+    since: date
+    until: date
+    older: date | None
+    newer: date | None
+
+
+def date_range(loc: K1Location, lookback: int) -> tuple[date, date]:
+    today = datetime.now(loc["tz"]).date()
+    window = timedelta(days=lookback)
+    since = request.args.get("since", type=date.fromisoformat)
+    until = request.args.get("until", type=date.fromisoformat)
+
+    # Pages never cover more than the lookback, whichever end they're pinned
+    # to, and the newest page runs on past today
+    try:
+        if until is None:
+            if since is None or since + window >= today:
+                until = date.max
+            else:
+                until = since + window
+
+        if until == date.max:
+            since = today - window if since is None else min(since, today)
+        elif since is None or since < until - window:
+            since = until - window
+    except OverflowError:
+        abort(400, "since and until must be real dates")
+
+    if since > until:
+        abort(400, "since must not be after until")
+
+    return (since, until)
+
+
+def date_page(loc: K1Location, since: date, until: date) -> DatePage:
+    older: date | None = None
+    newer: date | None = None
+
+    for track in range(1, loc["tracks"] + 1):
+        (before, after) = K1DB.neighbour_days(
+            g.db, loc["location"], track, since, until
+        )
+
+        if before is not None and (older is None or before > older):
+            older = before
+        if after is not None and (newer is None or after < newer):
+            newer = after
+
+    return {"since": since, "until": until, "older": older, "newer": newer}
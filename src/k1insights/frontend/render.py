@@ -0,0 +1,31 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from collections.abc import Iterator
+
+from flask import request
+from werkzeug.exceptions import HTTPException
+
+from k1insights.frontend import app
+
+
+def render_pages(pages: list[str]) -> Iterator[tuple[str, str]]:
+    # Views run as they would for a visitor with no query string, so they fill
+    # the keys visitors will ask for; callers provide the request and g
+    adapter = app.create_url_adapter(request)
+
+    if adapter is not None:
+        for page in pages:
+            try:
+                (endpoint, args) = adapter.match(page)
+                html = app.view_functions[endpoint](**args)
+            except HTTPException as e:
+                app.logger.debug("Not rendering %s: %s", page, e)
+            else:
+                yield (page, html)
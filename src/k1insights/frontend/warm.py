@@ -0,0 +1,115 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from pathlib import Path
+from sqlite3 import OperationalError
+from threading import Thread
+from time import sleep
+from typing import Any
+
+from flask import g
+
+from k1insights.common.constants import (
+    CACHE_PATH,
+    DB_PATH,
+    LOCATIONS,
+    STATIC_PATH,
+    WARM_CACHE_TTL,
+    WARM_INTERVAL,
+    WARM_KART_PAGES,
+)
+from k1insights.common.db import K1DB
+from k1insights.frontend import app, open_db
+from k1insights.frontend.cache import ResultCache
+from k1insights.frontend.export import render_site
+from k1insights.frontend.render import render_pages
+
+
+def warm_pages(
+    db_path: Path, cache_path: Path, kart_pages: int = WARM_KART_PAGES
+) -> int:
+    result = 0
+    db = open_db(db_path)
+
+    if db is not None:
+        cache = ResultCache(cache_path)
+
+        try:
+            # The request's teardown closes the connection
+            with app.test_request_context():
+                g.db = db
+                g.cache = cache
+                watermark = K1DB.watermark(db)
+
+                # Whoever claims the data's current state warms it, so workers
+                # starting together or a heat landing mid-deploy don't repeat it
+                if cache.claim(f"warm:{watermark}"):
+                    pages = [f"/locations/{key}" for key in LOCATIONS]
+                    pages.extend(cache.popular(kart_pages))
+
+                    try:
+                        result = sum(1 for _ in render_pages(pages))
+                        cache.keep(watermark, WARM_CACHE_TTL)
+                    except Exception:
+                        cache.release(f"warm:{watermark}")
+                        raise
+
+                    app.logger.info(
+                        "Warmed %s page(s) at watermark %s", result, watermark
+                    )
+        finally:
+            cache.close()
+
+    return result
+
+
+def keep_warm(db_path: Path, cache_path: Path, static_path: Path | None) -> None:
+    warmed: int | None = None
+    db = open_db(db_path)
+
+    # Every worker watches for new heats, but whoever claims each watermark
+    # first does the work for all of them
+    if db is not None:
+        cache = ResultCache(cache_path)
+
+        while True:
+            # Anything going wrong is retried on the next look, rather than
+            # leaving the worker without a warmer until it restarts
+            try:
+                watermark = K1DB.watermark(db)
+
+                # However many heats were committed since the last look, the
+                # pages are only worked out again once
+                if watermark != warmed:
+                    warm_pages(db_path, cache_path)
+
+                    if static_path is not None and cache.claim(f"render:{watermark}"):
+                        try:
+                            render_site(db_path, cache_path, static_path)
+                        except Exception:
+                            cache.release(f"render:{watermark}")
+                            raise
+                    warmed = watermark
+            except OperationalError as e:
+                app.logger.warning("Skipping cache warming: %s", e)
+            except Exception:
+                app.logger.exception("Cache warming failed, trying again later")
+
+            sleep(WARM_INTERVAL)
+
+
+def post_worker_init(worker: Any) -> None:
+    # Gunicorn hook, so each worker starts serving straight away while the
+    # cache fills in the background
+    Thread(
+        target=keep_warm,
+        args=(DB_PATH, CACHE_PATH, STATIC_PATH),
+        name="k1-warm",
+        daemon=True,
+    ).start()
@@ -17,7 +17,7 @@ from typing import Any, cast
 
 from pytz import utc
 
-from k1insights.backend.clubspeed import get_racer_data
+from k1insights.backend.clubspeed import get_racer_data, history_locations
 from k1insights.common.constants import DB_PATH
 from k1insights.common.db import K1DB
 
@@ -85,12 +85,19 @@ def main(args: list[str] | None = None) -> None:
     db = K1DB.connect(logger, DB_PATH)
 
     if db is not None:
-        data = run(get_racer_data(logger, parsed.id, parsed.start))
+        (locs, sweep) = history_locations(db, parsed.id)
+        data = run(get_racer_data(logger, parsed.id, parsed.start, locs))
 
         if data:
             K1DB.add_racer(db, data["rid"], data["name"], parsed.fast, parsed.track)
-            K1DB.add_heats(db, data["sessions"])
-            K1DB.add_sessions(db, data["sessions"])
+            K1DB.add_racer_locations(
+                db,
+                data["rid"],
+                data["locations"],
+                datetime.now(utc) if sweep else None,
+            )
+            K1DB.add_heats(db, data["batch"].heats)
+            K1DB.add_session_batch(db, data["batch"])
             logger.info(
                 "Successfully added data for racer %s, id %s", data["name"], parsed.id
             )
@@ -0,0 +1,35 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from argparse import ArgumentParser
+from logging import INFO, StreamHandler, getLogger
+from sys import stdout
+
+from k1insights.frontend.assets import BUILD_DIR, build_assets, compressors
+
+
+def main(args: list[str] | None = None) -> None:
+    parser = ArgumentParser(
+        prog="k1-build-assets",
+        description="Fingerprint and precompress the frontend's static files",
+        epilog="Released under Prosperity Public License 3.0.0",
+    )
+
+    parser.parse_args(args)
+    logger = getLogger(__name__)
+    logger.addHandler(StreamHandler(stdout))
+    logger.setLevel(INFO)
+
+    built = build_assets()
+    logger.info(
+        "Built %s asset(s) into %s, compressed with %s",
+        len(built),
+        BUILD_DIR,
+        ", ".join(sorted(compressors())),
+    )
@@ -0,0 +1,56 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from argparse import ArgumentParser, Namespace
+from logging import INFO, StreamHandler, getLogger
+from pathlib import Path
+from sys import exit, stdout
+
+from k1insights.common.constants import CACHE_PATH, DB_PATH, STATIC_PATH
+from k1insights.frontend.export import render_site
+
+
+def main(args: list[str] | None = None) -> None:
+    parser = ArgumentParser(
+        prog="k1-render-static",
+        description="Render the site to static files, redrawing only changed pages",
+        epilog="Released under Prosperity Public License 3.0.0",
+    )
+
+    parser.add_argument(
+        "dest",
+        type=Path,
+        nargs="?",
+        default=STATIC_PATH,
+        help="Directory to render into, defaults to K1_STATIC",
+    )
+
+    parser.add_argument(
+        "-f",
+        "--full",
+        action="store_true",
+        help="Redraw every page, e.g. after upgrading",
+    )
+
+    parsed: Namespace = parser.parse_args(args)
+    # Shared with the frontend, which would otherwise log to stderr as well
+    logger = getLogger(__name__.split(".")[0])
+    logger.addHandler(StreamHandler(stdout))
+    logger.setLevel(INFO)
+
+    success = False
+
+    if parsed.dest is None:
+        logger.error("No destination given; pass one or set K1_STATIC")
+
+    else:
+        render_site(DB_PATH, CACHE_PATH, parsed.dest, parsed.full)
+        success = True
+
+    exit(0 if success else 1)
@@ -0,0 +1,233 @@
+################################################################################
+#                               K1 Data Insights                               #
+#   Capture K1 results to find hidden trends; pls don't call it data science   #
+#                            (C) 2022, Jeremy Brown                            #
+#                Released under Prosperity Public License 3.0.0                #
+################################################################################
+
+from __future__ import annotations
+
+from argparse import ArgumentParser, Namespace
+from base64 import b64decode
+from json import loads
+from logging import INFO, Logger, StreamHandler, getLogger
+from multiprocessing import Pool
+from operator import itemgetter
+from os import cpu_count
+from pathlib import Path
+from sys import exit, stdout
+from typing import Any, TypedDict
+from urllib.parse import parse_qs, urlsplit
+from zlib import decompress
+
+from k1insights.backend.archive import SCOREBOARD_PAGE, ArchivedPage, PageArchive
+from k1insights.backend.clubspeed import HeatParser, HistoryParser
+from k1insights.common.batch import SessionBatch
+from k1insights.common.constants import (
+    ARCHIVE_PATH,
+    DB_PATH,
+    LOCATIONS,
+    FullSession,
+)
+from k1insights.common.db import K1DB
+
+
+PARSERS: dict[str, type[HeatParser] | type[HistoryParser]] = {
+    "HeatParser": HeatParser,
+    "HistoryParser": HistoryParser,
+}
+
+
+def scoreboard_karts(body: str) -> list[tuple[int, int, int]]:
+    return [(int(r["HeatNo"]), int(r["CustID"]), int(r["AutoNo"])) for r in loads(body)]
+
+
+class ParsedPage(TypedDict):
+    id: int
+    parser: str
+    location: str
+    url: str
+    data: Any
+    error: str | None
+
+
+def parse_page(page: ArchivedPage) -> ParsedPage:
+    result: ParsedPage = {
+        "id": page["id"],
+        "parser": page["parser"],
+        "location": page["location"],
+        "url": page["url"],
+        "data": None,
+        "error": None,
+    }
+    loc = LOCATIONS.get(page["location"].replace(" ", "_").lower())
+
+    # Pages from locations no longer configured are skipped rather than failed
+    if page["parser"] not in PARSERS and page["parser"] != SCOREBOARD_PAGE:
+        result["error"] = f"no parser named {page['parser']}"
+
+    elif loc is not None:
+        # Sent back rather than logged here, since this runs in a pool worker
+        try:
+            body = decompress(page["body"]).decode()
+
+            if page["parser"] == SCOREBOARD_PAGE:
+                result["data"] = scoreboard_karts(body)
+            else:
+                parser = PARSERS[page["parser"]](loc)
+                parser.feed(body)
+                result["data"] = parser.data
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+
+    return result
+
+
+class Tally:
+    __slots__ = ("read", "skipped", "failed")
+
+    def __init__(self) -> None:
+        self.read = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def count(self, logger: Logger, parsed: ParsedPage) -> bool:
+        self.read += 1
+
+        if parsed["error"] is not None:
+            self.failed += 1
+            logger.warning(
+                "Could not reparse page %s (%s, %s): %s",
+                parsed["id"],
+                parsed["parser"],
+                parsed["url"],
+                parsed["error"],
+            )
+
+        elif parsed["data"] is None:
+            self.skipped += 1
+
+        return parsed["data"] is not None
+
+
+def rebuild(
+    logger: Logger, archive: PageArchive, jobs: int
+) -> tuple[list[tuple[int, str]], SessionBatch, Tally]:
+    karts: dict[tuple[str, int], dict[int, int]] = {}
+    racers: dict[int, str] = {}
+    seen: set[tuple[str, int]] = set()
+    batch = SessionBatch()
+    tally = Tally()
+
+    with Pool(jobs) as pool:
+        # Karts only come from live scoreboards and history pages, so reading
+        # those first lets each heat be packed away as soon as it's parsed
+        # rather than held to the end
+        for parsed in pool.imap_unordered(
+            parse_page, archive.pages(SCOREBOARD_PAGE), chunksize=32
+        ):
+            if tally.count(logger, parsed):
+                for (heat_no, rid, kart) in parsed["data"]:
+                    karts.setdefault((parsed["location"], heat_no), {})[rid] = kart
+
+        for parsed in pool.imap_unordered(
+            parse_page, archive.pages("HistoryParser"), chunksize=32
+        ):
+            if not tally.count(logger, parsed):
+                continue
+
+            # History pages only name the racer by the id in their url
+            (url, data) = (parsed["url"], parsed["data"])
+            rid = int(b64decode(parse_qs(urlsplit(url).query)["CustID"][0]))
+
+            for hist_loc, sessions in data["sessions"].items():
+                for s in sessions:
+                    karts.setdefault((hist_loc, s["heat_id"]), {})[rid] = s["kart"]
+
+        for parsed in pool.imap_unordered(
+            parse_page, archive.pages("HeatParser"), chunksize=32
+        ):
+            if not tally.count(logger, parsed):
+                continue
+
+            (location, data) = (parsed["location"], parsed["data"])
+            key = (location, data["heat_id"])
+
+            if key not in seen:
+                seen.add(key)
+                heat: FullSession = {
+                    "location": location,
+                    "heat_no": data["heat_id"],
+                    "track": data["track"],
+                    "time": data["time"],
+                    "race_type": data["race_type"],
+                    "win_cond": data["win_cond"],
+                }
+
+                if batch.add_heat(heat, data["sessions"], karts.get(key, {})):
+                    racers.update((s["rid"], s["name"]) for s in data["sessions"])
+
+    return (list(racers.items()), batch, tally)
+
+
+def main(args: list[str] | None = None) -> None:
+    parser = ArgumentParser(
+        prog="k1-reparse",
+        description="Rebuild race data from archived K1 pages without refetching",
+        epilog="Released under Prosperity Public License 3.0.0",
+    )
+
+    parser.add_argument(
+        "archive",
+        type=Path,
+        nargs="?",
+        default=ARCHIVE_PATH,
+        help="Page archive to replay, defaults to K1_ARCHIVE",
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=cpu_count() or 1,
+        help="Number of parser processes, defaults to one per core",
+    )
+
+    parsed: Namespace = parser.parse_args(args)
+    logger = getLogger(__name__)
+    logger.addHandler(StreamHandler(stdout))
+    logger.setLevel(INFO)
+
+    success = False
+
+    if parsed.archive is None or not parsed.archive.is_file():
+        logger.error("No page archive found; pass one or set K1_ARCHIVE")
+
+    else:
+        db = K1DB.connect(logger, DB_PATH)
+
+        if db is not None:
+            archive = PageArchive(parsed.archive)
+            (racers, batch, tally) = rebuild(logger, archive, parsed.jobs)
+            archive.close()
+
+            K1DB.add_racers(db, racers)
+            K1DB.add_heats(
+                db, sorted(batch.heats, key=itemgetter("location", "heat_no"))
+            )
+            K1DB.add_session_batch(db, batch)
+
+            logger.info(
+                "Reparsed %s page(s), %s skipped, %s failed; "
+                "loaded %s heat(s), %s session(s)",
+                tally.read,
+                tally.skipped,
+                tally.failed,
+                len(batch.heats),
+                len(batch),
+            )
+            success = True
+
+            K1DB.close(db)
+
+    exit(0 if success else 1)
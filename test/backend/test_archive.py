@@ -0,0 +1,75 @@
+from sqlite3 import OperationalError
+from unittest.mock import Mock, patch
+from zlib import decompress
+
+import pytest
+
+from k1insights.backend import archive
+from k1insights.backend.archive import PageArchive, get_archive
+from k1insights.backend.clubspeed import archive_page
+
+
+def test_page_archive(tmp_path):
+    store = PageArchive(tmp_path / "archive.db")
+
+    assert store.store("HeatParser", "Atlanta", "http://example.com/1", "<html>")
+    # Refetching an unchanged page is deduplicated, new bodies are kept
+    assert not store.store("HeatParser", "Atlanta", "http://example.com/1", "<html>")
+    assert not store.store("HeatParser", "Atlanta", "http://example.com/2", "<html>")
+    assert store.store("HeatParser", "Atlanta", "http://example.com/1", "<body>")
+    assert store.store("HistoryParser", "Atlanta", "http://example.com/3", "<div>")
+
+    assert ["3"] == [p["url"][-1] for p in store.pages("HistoryParser")]
+    pages = list(store.pages("HeatParser"))
+    assert 4 == len(list(store.pages()))
+    store.close()
+
+    assert ["1", "2", "1"] == [p["url"][-1] for p in pages]
+    assert [b"<html>", b"<html>", b"<body>"] == [decompress(p["body"]) for p in pages]
+    assert {"HeatParser"} == {p["parser"] for p in pages}
+    assert {"Atlanta"} == {p["location"] for p in pages}
+
+
+@pytest.mark.parametrize("enabled", [False, True])
+def test_get_archive(enabled, tmp_path, monkeypatch):
+    monkeypatch.setattr(archive, "_ARCHIVE", None)
+    monkeypatch.setattr(
+        archive, "ARCHIVE_PATH", tmp_path / "archive.db" if enabled else None
+    )
+
+    result = get_archive()
+
+    if enabled:
+        assert isinstance(result, PageArchive)
+        assert result is get_archive()
+        result.close()
+    else:
+        assert result is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("scenario", ["disabled", "stored", "locked"])
+@patch("k1insights.backend.clubspeed.get_archive")
+async def test_archive_page(mock_get_archive, scenario):
+    mock_logger = Mock()
+
+    if scenario == "disabled":
+        mock_get_archive.return_value = None
+    elif scenario == "locked":
+        mock_get_archive.return_value.store.side_effect = OperationalError(
+            "database is locked"
+        )
+
+    await archive_page(
+        mock_logger, "HeatParser", "Atlanta", "http://example.com", "<html>"
+    )
+
+    if scenario != "disabled":
+        mock_get_archive.return_value.store.assert_called_once_with(
+            "HeatParser", "Atlanta", "http://example.com", "<html>"
+        )
+
+    if scenario == "locked":
+        mock_logger.warning.assert_called_once()
+    else:
+        mock_logger.warning.assert_not_called()
@@ -0,0 +1,122 @@
+from asyncio import CancelledError
+from asyncio import TimeoutError as Timeout
+from unittest.mock import patch
+
+import pytest
+
+from aiohttp import (
+    ClientConnectorError,
+    ClientOSError,
+    ClientResponseError,
+    ServerDisconnectedError,
+)
+
+from k1insights.backend.breaker import (
+    BREAKERS,
+    BreakerState,
+    CircuitBreaker,
+    breaker_for,
+    is_outage,
+)
+from k1insights.common.metrics import BREAKER_REJECTED, BREAKER_STATE
+
+
+@pytest.mark.parametrize(
+    "exc, expected",
+    [
+        [ClientConnectorError(None, OSError(110)), True],
+        [ServerDisconnectedError(), True],
+        [ClientOSError(104, "Connection reset by peer"), True],
+        [Timeout(), True],
+        [ClientResponseError(None, (), status=503), True],
+        [ClientResponseError(None, (), status=404), False],
+        [KeyError("lblRaceType"), False],
+    ],
+)
+def test_is_outage(exc, expected):
+    assert expected == is_outage(exc)
+
+
+@patch("k1insights.backend.breaker.monotonic")
+def test_breaker(mock_time):
+    mock_time.return_value = 100.0
+    breaker = CircuitBreaker("k1test", threshold=3, cooldown=30, max_cooldown=100)
+
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.failure()
+
+    breaker.success()
+    assert 0 == breaker.failures
+
+    # Only consecutive failures trip the circuit
+    for _ in range(3):
+        assert breaker.allow()
+        breaker.failure()
+
+    assert BreakerState.OPEN == breaker.state
+    assert BreakerState.OPEN == BREAKER_STATE.values[("k1test",)]
+
+    rejected = BREAKER_REJECTED.values.get(("k1test",), 0)
+    mock_time.return_value = 129.0
+    assert not breaker.allow()
+    assert rejected + 1 == BREAKER_REJECTED.values[("k1test",)]
+
+    # A single probe goes out once the cooldown passes, and failing it
+    # backs off further
+    mock_time.return_value = 130.0
+    assert breaker.allow()
+    assert BreakerState.HALF_OPEN == breaker.state
+    assert not breaker.allow()
+
+    breaker.failure()
+    assert BreakerState.OPEN == breaker.state
+    assert 60 == breaker.cooldown
+
+    mock_time.return_value = 190.0
+    assert breaker.allow()
+    breaker.failure()
+    assert 100 == breaker.cooldown
+
+    # A probe that never reports back doesn't wedge the breaker
+    mock_time.return_value = 290.0
+    assert breaker.allow()
+    mock_time.return_value = 389.0
+    assert not breaker.allow()
+    mock_time.return_value = 390.0
+    assert breaker.allow()
+
+    breaker.success()
+    assert BreakerState.CLOSED == breaker.state
+    assert BreakerState.CLOSED == BREAKER_STATE.values[("k1test",)]
+    assert 30 == breaker.cooldown
+
+
+@pytest.mark.parametrize(
+    "exc, failures",
+    [
+        [None, 0],
+        [ClientResponseError(None, (), status=404), 0],
+        [Timeout(), 2],
+        [CancelledError(), 1],
+    ],
+)
+def test_breaker_context(exc, failures):
+    breaker = CircuitBreaker("k1test")
+    breaker.failure()
+
+    try:
+        with breaker:
+            if exc is not None:
+                raise exc
+    except BaseException as e:
+        assert e is exc
+
+    assert failures == breaker.failures
+
+
+def test_breaker_for():
+    breaker = breaker_for("k1test")
+
+    assert breaker is breaker_for("k1test")
+    assert {"k1test": breaker} == BREAKERS
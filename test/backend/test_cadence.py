@@ -0,0 +1,115 @@
+from datetime import datetime
+from unittest.mock import Mock, patch
+
+import pytest
+
+from pytz import timezone, utc
+
+from k1insights.backend.cadence import (
+    FAST_POLL_WINDOW,
+    POLL_CLOSED,
+    POLL_FAST,
+    POLL_IDLE,
+    POLL_RUNNING,
+    REPORT_INTERVAL,
+    PollCadence,
+)
+from k1insights.common.constants import LOCATIONS
+
+
+EASTERN = timezone("US/Eastern")
+
+
+def local(hour, minute=0, second=0):
+    return EASTERN.localize(datetime(2022, 5, 10, hour, minute, second)).astimezone(utc)
+
+
+@pytest.mark.parametrize(
+    "hours, hour, is_open",
+    [
+        [(10, 24), 9, False],
+        [(10, 24), 10, True],
+        [(10, 24), 23, True],
+        [(10, 2), 1, True],
+        [(10, 2), 3, False],
+        [(10, 2), 22, True],
+    ],
+)
+def test_is_open(hours, hour, is_open):
+    loc = dict(LOCATIONS["atlanta"], hours=hours)
+    cadence = PollCadence(Mock(), loc)
+
+    assert is_open == cadence.is_open(local(hour))
+
+
+@pytest.mark.parametrize(
+    "state, now, delay",
+    [
+        ["idle", local(12), POLL_IDLE],
+        ["running", local(12), POLL_RUNNING],
+        ["finished", local(12), POLL_FAST],
+        ["stale", local(12), POLL_IDLE],
+        ["finished", local(3), POLL_FAST],
+        ["idle", local(3), POLL_CLOSED],
+        ["idle", local(9, 58), 120],
+        ["idle", local(9, 59, 59), POLL_IDLE],
+    ],
+)
+@patch("k1insights.backend.cadence.monotonic")
+def test_delay(mock_monotonic, state, now, delay):
+    cadence = PollCadence(Mock(), LOCATIONS["atlanta"])
+    mock_monotonic.return_value = 1000
+
+    if state == "running":
+        cadence.observe(True, False)
+    elif state in ("finished", "stale"):
+        cadence.observe(False, True)
+
+        if state == "stale":
+            mock_monotonic.return_value += FAST_POLL_WINDOW
+    else:
+        cadence.observe(False, False)
+
+    assert delay == cadence.delay(now)
+
+
+@patch("k1insights.backend.cadence.monotonic")
+def test_report(mock_monotonic):
+    mock_logger = Mock()
+    mock_monotonic.return_value = 0
+    cadence = PollCadence(mock_logger, LOCATIONS["atlanta"])
+
+    cadence.report()
+    mock_logger.info.assert_not_called()
+
+    cadence.finished()
+    mock_monotonic.return_value = 4
+    cadence.observe(False, True)
+    cadence.ingested()
+    cadence.ingested()
+    cadence.observe(False, False)
+
+    mock_monotonic.return_value = REPORT_INTERVAL
+    cadence.report()
+    mock_logger.info.assert_called_once_with(
+        "%s watcher made %s polls and ingested %s heat(s), "
+        "%.1fs average time to ingest",
+        "Atlanta",
+        2,
+        1,
+        4.0,
+    )
+
+    mock_monotonic.return_value = REPORT_INTERVAL * 2
+    cadence.report()
+    assert 0.0 == mock_logger.info.call_args.args[-1]
+    assert 0 == cadence.polls
+    assert isinstance(cadence.delay(), (int, float))
+
+
+def test_delay_after_close():
+    loc = dict(LOCATIONS["atlanta"], hours=(10, 22))
+    cadence = PollCadence(Mock(), loc)
+    cadence.observe(False, False)
+
+    assert POLL_CLOSED == cadence.delay(local(23))
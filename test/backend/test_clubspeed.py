@@ -1,6 +1,9 @@
-from asyncio import CancelledError
+from asyncio import CancelledError, Event
 from asyncio import TimeoutError as Timeout
+from asyncio import create_task, sleep
 from datetime import datetime, timedelta
+from itertools import count as ticks
+from json import dumps
 from pathlib import Path
 from unittest.mock import AsyncMock, Mock, patch
 
@@ -11,21 +14,29 @@ from aiohttp import (
     ClientResponse,
     ClientResponseError,
     ClientSession,
+    ServerDisconnectedError,
 )
 from pytz import utc
 
+from k1insights.backend.breaker import breaker_for
 from k1insights.backend.clubspeed import (
+    IN_FLIGHT,
     HeatParser,
     HistoryParser,
     RaceTypes,
     WinConditions,
     fetch_and_parse,
     get_heat_info,
+    get_heat_records,
     get_racer_data,
     get_racer_history,
+    history_locations,
     watch_location,
 )
+from k1insights.backend.scheduler import FetchPriority
 from k1insights.common.constants import LOCATIONS
+from k1insights.common.db import K1DB
+from k1insights.common.metrics import FETCH_COALESCED
 
 
 @pytest.mark.asyncio
@@ -34,25 +45,32 @@ from k1insights.common.constants import LOCATIONS
     [
         "timeout",
         "bad-connect",
+        "disconnected",
         "bad-status",
         "normal-keyerror",
         "wonky-keyerror",
         "other-error",
+        "circuit-open",
         "good",
     ],
 )
 async def test_fetch_and_parse(scenario, blank_db):
     mock_logger = Mock()
     mock_parser = Mock()
+    mock_parser.__name__ = "MockParser"
     mock_parser.return_value = mock_parser
     mock_session = AsyncMock(spec=ClientSession)
 
     if scenario == "timeout":
         mock_session.get.side_effect = Timeout()
+    elif scenario == "circuit-open":
+        breaker_for("k1atlanta")._trip()
     elif scenario == "bad-connect":
         mock_session.get.side_effect = ClientConnectorError(
             "Cannot connect to host [Connect call failed]", os_error=OSError(110)
         )
+    elif scenario == "disconnected":
+        mock_session.get.side_effect = ServerDisconnectedError()
     elif scenario == "bad-status":
         mock_session.get.side_effect = ClientResponseError(
             request_info=None, history=(), status=404
@@ -77,7 +95,11 @@ async def test_fetch_and_parse(scenario, blank_db):
         mock_parser.feed.side_effect = Exception("Unexpected Exception")
 
     result = await fetch_and_parse(
-        mock_logger, mock_session, mock_parser, None, "http://example.com"
+        mock_logger,
+        mock_session,
+        mock_parser,
+        LOCATIONS["atlanta"],
+        "http://example.com",
     )
 
     if scenario == "good":
@@ -89,7 +111,7 @@ async def test_fetch_and_parse(scenario, blank_db):
             mock_logger.error.assert_called_once_with(
                 "Timed out connecting to URL %s", "http://example.com"
             )
-        elif scenario == "bad-connect":
+        elif scenario in ("bad-connect", "disconnected"):
             mock_logger.error.assert_called_once_with("Error connecting to K1 servers")
         elif scenario == "bad-status":
             mock_logger.error.assert_called_once_with(
@@ -102,12 +124,62 @@ async def test_fetch_and_parse(scenario, blank_db):
             mock_logger.error.assert_called_once_with(
                 "K1 could not provide valid response for URL %s", "http://example.com"
             )
+        elif scenario == "circuit-open":
+            mock_session.get.assert_not_called()
+            mock_logger.debug.assert_called_once_with(
+                "Skipping URL %s while K1 servers are down", "http://example.com"
+            )
         else:
             mock_logger.exception.assert_called_once_with(
                 "Failed to parse response for URL %s", "http://example.com"
             )
 
 
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "first, second, fetches",
+    [
+        [FetchPriority.BACKFILL, FetchPriority.BACKFILL, 1],
+        [FetchPriority.LIVE, FetchPriority.BACKFILL, 1],
+        [FetchPriority.BACKFILL, FetchPriority.LIVE, 2],
+    ],
+)
+async def test_fetch_and_parse_coalesced(first, second, fetches, blank_db):
+    mock_logger = Mock()
+    mock_parser = Mock()
+    mock_parser.__name__ = "CoalescedParser"
+    mock_parser.side_effect = lambda loc: Mock()
+    mock_session = AsyncMock(spec=ClientSession)
+    loc = LOCATIONS["atlanta"]
+    url = "http://example.com/coalesced"
+    released = Event()
+    before = FETCH_COALESCED.values.get(("CoalescedParser",), 0)
+
+    async def _text():
+        await released.wait()
+        return "page"
+
+    mock_session.get.return_value.__aenter__.return_value.text.side_effect = _text
+
+    waiters = [
+        create_task(
+            fetch_and_parse(mock_logger, mock_session, mock_parser, loc, url, p)
+        )
+        for p in (first, second, second)
+    ]
+    await sleep(0)
+
+    # A caller giving up mustn't take the fetch down for everyone else
+    waiters.pop().cancel()
+    released.set()
+    results = [await w for w in waiters]
+
+    assert fetches == mock_session.get.call_count
+    assert (fetches == 1) == (results[0] is results[1])
+    assert before + 3 - fetches == FETCH_COALESCED.values[("CoalescedParser",)]
+    assert {} == IN_FLIGHT
+
+
 @pytest.mark.asyncio
 @pytest.mark.parametrize("location", [None, "atl", "atlanta", 1])
 @patch("k1insights.backend.clubspeed.gather_iter", new_callable=AsyncMock)
@@ -185,6 +257,34 @@ async def test_get_racer_history(
         assert 1 == len(result["sessions"]["Location 2"])
         assert 1 == result["sessions"]["Location 1"][0]["heat_id"]
         assert 2 == result["sessions"]["Location 2"][0]["heat_id"]
+        assert ["Location 1", "Location 2"] == result["locations"]
+
+
+@pytest.mark.parametrize(
+    "known, swept_days, sweep",
+    [
+        [[], None, True],
+        [["Atlanta"], None, True],
+        [["Atlanta", "Moscow"], 1, False],
+        [["Moscow"], 1, True],
+        [["Atlanta"], 45, True],
+    ],
+)
+def test_history_locations(known, swept_days, sweep, blank_db):
+    swept = None
+
+    if swept_days is not None:
+        swept = datetime.now(utc) - timedelta(days=swept_days)
+
+    K1DB.add_racer_locations(blank_db, 123, known, swept)
+    (locs, full) = history_locations(blank_db, 123)
+
+    assert sweep == full
+
+    if sweep:
+        assert list(LOCATIONS.values()) == list(locs)
+    else:
+        assert [LOCATIONS["atlanta"]] == locs
 
 
 @pytest.mark.asyncio
@@ -401,22 +501,17 @@ async def test_get_racer_data(
         assert "Test Racer" == result["name"]
         assert 123 == result["rid"]
 
+        batch = result["batch"]
+
         if not got_heat_data:
-            assert "sessions" not in result
+            assert 0 == len(batch)
         else:
-            assert 2 == len(result["sessions"])
-            assert (
-                1
-                == [s for s in result["sessions"] if s["location"] == "Location 1"][0][
-                    "kart"
-                ]
-            )
-            assert (
-                2
-                == [s for s in result["sessions"] if s["location"] == "Location 2"][0][
-                    "kart"
-                ]
-            )
+            # Only the racer's own session is kept from each heat
+            assert [(123, "Location 1", 1), (123, "Location 2", 2)] == [
+                (s["rid"], s["location"], s["kart"]) for s in batch
+            ]
+            assert [1, 1] == [h["heat_no"] for h in batch.heats]
+            assert [(49.17, 2), (68.28, 1), (37.9, 1)] == list(batch)[1]["times"]
 
 
 @pytest.mark.asyncio
@@ -426,11 +521,14 @@ async def test_get_racer_data(
         ["timeout", False, False],
         ["bad-connect", False, False],
         ["bad-status", False, False],
+        ["circuit-open", False, False],
         ["good", True, True],
         ["good", False, False],
         ["good", False, True],
+        ["not-ready", False, True],
     ],
 )
+@patch("k1insights.backend.clubspeed.archive_page")
 @patch("k1insights.backend.clubspeed.sleep", side_effect=CancelledError)
 @patch("k1insights.backend.clubspeed.K1DB")
 @patch("k1insights.backend.clubspeed.get_heat_info")
@@ -440,12 +538,15 @@ async def test_watch_location(
     mock_get_info,
     mock_k1db,
     mock_sleep,
+    mock_archive,
     scenario,
     race_running,
     new_race,
     blank_db,
 ):
     mock_logger = Mock()
+    mock_spool = Mock()
+    mock_k1db.get_cursor.return_value = None
     now = datetime.now().replace(microsecond=0)
     loc = LOCATIONS["atlanta"]
 
@@ -463,10 +564,12 @@ async def test_watch_location(
         mock_ctx_man.post.side_effect = ClientResponseError(
             request_info=None, history=(), status=500
         )
+    elif scenario == "circuit-open":
+        breaker_for(loc["subdomain"])._trip()
     else:
         mock_ctx_man.post.return_value.__aenter__.return_value = mock_response
 
-    if scenario == "good":
+    if scenario in ("good", "not-ready"):
         mock_response.status = 200
         mock_response.json.return_value = {
             "MessageId": 42,
@@ -628,15 +731,25 @@ async def test_watch_location(
             mock_get_info.side_effect = [heat_info, None, heat_info]
             mock_sleep.side_effect = [None, None, CancelledError]
 
+            if scenario == "not-ready":
+                mock_get_info.side_effect = None
+                mock_get_info.return_value = {"Atlanta": {}}
+
     try:
-        await watch_location(mock_logger, loc, None)
+        await watch_location(mock_logger, loc, None, mock_spool)
     except CancelledError:
         pass
 
-    if scenario != "good":
+    mock_spool.commit.assert_called_with(None)
+
+    if scenario == "not-ready":
+        assert 3 == mock_get_info.call_count
+        mock_spool.append.assert_not_called()
+
+    elif scenario != "good":
         mock_get_info.assert_not_called()
-        mock_k1db.add_heats.assert_not_called()
-        mock_k1db.add_sessions.assert_not_called()
+        mock_spool.append.assert_not_called()
+        mock_spool.save_cursor.assert_not_called()
 
         if scenario == "timeout":
             mock_logger.error.assert_called_once_with(
@@ -648,71 +761,372 @@ async def test_watch_location(
             mock_logger.error.assert_called_once_with(
                 "Got %s HTTP code watching for %s data", 500, loc["location"]
             )
+        elif scenario == "circuit-open":
+            mock_ctx_man.post.assert_not_called()
+            mock_logger.error.assert_not_called()
     elif race_running or not new_race:
         mock_get_info.assert_not_called()
-        mock_k1db.add_heats.assert_not_called()
-        mock_k1db.add_sessions.assert_not_called()
+        mock_spool.append.assert_not_called()
+        mock_archive.assert_not_called()
 
     else:
-        mock_k1db.add_heats.assert_called_once()
-        mock_k1db.add_sessions.assert_called_once()
-        mock_logger.info.assert_any_call(
-            "Saved all data for %s race beginning at %s UTC",
+        mock_spool.append.assert_called_once()
+        mock_archive.assert_called_once_with(
+            mock_logger,
+            "Scoreboard",
             loc["location"],
-            now.time(),
+            "https://k1atlanta.clubspeedtiming.com/SP_Center/signalr",
+            dumps(
+                mock_response.json.return_value["Messages"][0]["Args"][0][
+                    "ScoreboardData"
+                ]
+            ),
         )
         mock_logger.debug.assert_called_once_with(
             "Got data for %s %s heat", loc["location"], now.time()
         )
-        mock_k1db.add_heats.assert_called_once_with(
+        mock_spool.save_cursor.assert_called_once_with(
             None,
+            loc["location"],
+            {
+                "client_id": mock_spool.save_cursor.call_args.args[2]["client_id"],
+                "message_id": "42",
+                "last_heat": 69,
+            },
+        )
+
+        record = mock_spool.append.call_args.args[0]
+        assert [(i, f"Racer {i}") for i in range(1, 4)] == record["racers"]
+        assert {
+            "location": loc["location"],
+            "heat_no": 69,
+            "track": 1,
+            "time": now,
+            "race_type": RaceTypes.STANDARD,
+            "win_cond": WinConditions.BEST_LAP,
+        } == record["heat"]
+        assert [
             {
+                "rid": 1,
                 "location": loc["location"],
                 "track": 1,
                 "time": now,
-                "race_type": RaceTypes.STANDARD,
-                "win_cond": WinConditions.BEST_LAP,
+                "kart": 11,
+                "score": 10,
+                "pos": 1,
+                "times": [(22.47, 1), (23.456, 1), (22.68, 1)],
+            },
+            {
+                "rid": 2,
+                "location": loc["location"],
+                "track": 1,
+                "time": now,
+                "kart": 22,
+                "score": 4,
+                "pos": 2,
+                "times": [(23.241, 2), (34.567, 2), (23.116, 2)],
             },
+            {
+                "rid": 3,
+                "location": loc["location"],
+                "track": 1,
+                "time": now,
+                "kart": 33,
+                "score": 2,
+                "pos": 3,
+                "times": [(23.645, 3), (45.678, 3), (23.405, 3)],
+            },
+        ] == record["sessions"]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("heat_no, saved", [["69", False], ["65", True]])
+@patch("k1insights.backend.clubspeed.REPAIR_BATCH_SIZE", 2)
+@patch("k1insights.backend.clubspeed.sleep")
+@patch("k1insights.backend.clubspeed.K1DB")
+@patch("k1insights.backend.clubspeed.get_heat_records")
+@patch("k1insights.backend.clubspeed.ClientSession", spec=ClientSession)
+async def test_watch_location_resume(
+    mock_session,
+    mock_get_records,
+    mock_k1db,
+    mock_sleep,
+    heat_no,
+    saved,
+    blank_db,
+):
+    mock_logger = Mock()
+    mock_spool = Mock()
+    loc = LOCATIONS["atlanta"]
+
+    mock_k1db.get_cursor.return_value = {
+        "client_id": "abc",
+        "message_id": "40",
+        "last_heat": 65,
+    }
+    if not saved:
+        mock_spool.save_cursor.return_value = False
+
+    mock_get_records.side_effect = [[{"heat": 66}], [{"heat": 68}]]
+
+    async def _sleep(delay):
+        # Gives the catch-up a chance to run before the watcher stops
+        for _ in range(5):
+            await sleep(0)
+        raise CancelledError
+
+    mock_sleep.side_effect = _sleep
+
+    mock_response = Mock(spec=ClientResponse)
+    mock_ctx_man = AsyncMock(spec=ClientSession)
+    mock_session.return_value.__aenter__.return_value = mock_ctx_man
+    mock_ctx_man.post.return_value.__aenter__.return_value = mock_response
+    mock_response.json.return_value = {
+        "MessageId": 42,
+        "Messages": [
+            {
+                "Args": [
+                    {
+                        "RaceRunning": True,
+                        "ScoreboardData": [
+                            {
+                                "CustID": "1",
+                                "HeatNo": heat_no,
+                                "RacerName": "Racer 1",
+                                "AutoNo": "11",
+                            }
+                        ],
+                    }
+                ],
+            }
+        ],
+    }
+
+    try:
+        await watch_location(mock_logger, loc, None, mock_spool)
+    except CancelledError:
+        pass
+
+    params = mock_ctx_man.post.call_args.kwargs["data"]
+    assert "abc" == params["clientId"]
+    mock_logger.info.assert_any_call(
+        "Resuming %s live data fetcher after heat %s", loc["location"], 65
+    )
+    mock_spool.save_cursor.assert_called_once_with(
+        None,
+        loc["location"],
+        {"client_id": "abc", "message_id": "42", "last_heat": 65},
+    )
+
+    if heat_no == "69":
+        # Caught up in the background, in batches, behind live fetches
+        assert [
+            ((mock_logger, mock_ctx_man, loc, [66, 67], FetchPriority.BACKFILL),),
+            ((mock_logger, mock_ctx_man, loc, [68], FetchPriority.BACKFILL),),
+        ] == [(c.args,) for c in mock_get_records.call_args_list]
+        assert 2 == mock_spool.append.call_count
+        mock_logger.debug.assert_called_once_with(
+            "Could not save %s watcher cursor", loc["location"]
         )
+    else:
+        mock_get_records.assert_not_called()
+        mock_spool.append.assert_not_called()
 
-        mock_k1db.add_sessions.assert_called_once_with(
-            None,
-            [
-                {
-                    "rid": 1,
-                    "location": loc["location"],
-                    "track": 1,
-                    "time": now,
-                    "kart": 11,
-                    "score": 10,
-                    "pos": 1,
-                    "times": [(22.47, 1), (23.456, 1), (22.68, 1)],
-                },
-                {
-                    "rid": 2,
-                    "location": loc["location"],
-                    "track": 1,
-                    "time": now,
-                    "kart": 22,
-                    "score": 4,
-                    "pos": 2,
-                    "times": [(23.241, 2), (34.567, 2), (23.116, 2)],
-                },
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("failed", [False, True])
+@patch("k1insights.backend.clubspeed.archive_page")
+@patch("k1insights.backend.clubspeed.sleep")
+@patch("k1insights.backend.clubspeed.K1DB")
+@patch("k1insights.backend.clubspeed.get_heat_info")
+@patch("k1insights.backend.clubspeed.get_heat_records")
+@patch("k1insights.backend.clubspeed.ClientSession", spec=ClientSession)
+async def test_watch_location_catch_up_cursor(
+    mock_session,
+    mock_get_records,
+    mock_get_info,
+    mock_k1db,
+    mock_sleep,
+    mock_archive,
+    failed,
+    blank_db,
+):
+    mock_spool = Mock()
+    loc = LOCATIONS["atlanta"]
+    released = Event()
+
+    mock_k1db.get_cursor.return_value = {
+        "client_id": "abc",
+        "message_id": "40",
+        "last_heat": 65,
+    }
+    mock_get_info.return_value = {
+        "Atlanta": {
+            69: {
+                "track": 1,
+                "time": datetime(2022, 5, 10, 21, 39, tzinfo=utc),
+                "race_type": 0,
+                "win_cond": 0,
+                "sessions": [{"rid": 1, "pos": 1, "score": 0, "lap_data": []}],
+            }
+        }
+    }
+
+    async def _get_records(*args):
+        await released.wait()
+        if failed:
+            raise ServerDisconnectedError()
+        return [{"heat": 66}]
+
+    mock_get_records.side_effect = _get_records
+
+    async def _sleep(delay):
+        if mock_sleep.call_count == 2:
+            released.set()
+            for _ in range(5):
+                await sleep(0)
+        elif mock_sleep.call_count == 3:
+            raise CancelledError
+
+    mock_sleep.side_effect = _sleep
+
+    mock_response = Mock(spec=ClientResponse)
+    mock_ctx_man = AsyncMock(spec=ClientSession)
+    mock_session.return_value.__aenter__.return_value = mock_ctx_man
+    mock_ctx_man.post.return_value.__aenter__.return_value = mock_response
+    mock_response.json.side_effect = [
+        {
+            "MessageId": message_id,
+            "Messages": [
                 {
-                    "rid": 3,
-                    "location": loc["location"],
-                    "track": 1,
-                    "time": now,
-                    "kart": 33,
-                    "score": 2,
-                    "pos": 3,
-                    "times": [(23.645, 3), (45.678, 3), (23.405, 3)],
-                },
+                    "Args": [
+                        {
+                            "RaceRunning": False,
+                            "ScoreboardData": [
+                                {
+                                    "CustID": "1",
+                                    "HeatNo": "69",
+                                    "RacerName": "Racer 1",
+                                    "AutoNo": "11",
+                                }
+                            ],
+                        }
+                    ],
+                }
             ],
-        )
+        }
+        for message_id in (42, 43, 44)
+    ]
+
+    with pytest.raises(CancelledError):
+        await watch_location(Mock(), loc, None, mock_spool)
+
+    # Heat 69 is spooled straight away, but the cursor stays behind the
+    # missed heats until the catch-up has spooled them too
+    assert 69 == mock_spool.append.call_args_list[0].args[0]["heat"]["heat_no"]
+    assert [("42", 65), ("43", 65), ("44", 65 if failed else 69),] == [
+        (c.args[2]["message_id"], c.args[2]["last_heat"])
+        for c in mock_spool.save_cursor.call_args_list
+    ]
+
+
+@pytest.mark.asyncio
+@patch("k1insights.backend.clubspeed.get_racer_history")
+@patch("k1insights.backend.clubspeed.get_heat_info")
+async def test_get_heat_records(mock_get_info, mock_get_history, blank_db):
+    mock_logger = Mock()
+    mock_session = Mock()
+    now = datetime.now(utc).replace(microsecond=0)
+    loc = LOCATIONS["atlanta"]
+
+    mock_get_info.return_value = {
+        "Atlanta": {
+            67: {
+                "race_type": RaceTypes.JUNIOR,
+                "win_cond": WinConditions.BEST_LAP,
+                "time": now,
+                "track": 1,
+                "sessions": [
+                    {
+                        "name": "Racer 3",
+                        "rid": 3,
+                        "pos": 1,
+                        "score": 1200,
+                        "lap_data": [(30.1, 1)],
+                    },
+                ],
+            },
+            66: {
+                "race_type": RaceTypes.STANDARD,
+                "win_cond": WinConditions.BEST_LAP,
+                "time": now,
+                "track": 1,
+                "sessions": [
+                    {
+                        "name": "Racer 1",
+                        "rid": 1,
+                        "pos": 1,
+                        "score": 1210,
+                        "lap_data": [(22.47, 1), (22.99, 1)],
+                    },
+                    {
+                        "name": "Racer 2",
+                        "rid": 2,
+                        "pos": 2,
+                        "score": 1204,
+                        "lap_data": [(23.77, 2), (24.01, 2)],
+                    },
+                ],
+            },
+        }
+    }
+
+    def history(logger, session, rid, after, locs, priority):
+        assert FetchPriority.REPAIR == priority
+        assert now - timedelta(minutes=1) == after
+        assert "Atlanta" == locs
+        result = {}
+
+        if rid == 1:
+            result = {
+                "name": "Racer 1",
+                "sessions": {
+                    "Atlanta": [
+                        {"location": "Atlanta", "heat_id": 70, "kart": 9, "time": now},
+                        {"location": "Atlanta", "heat_id": 66, "kart": 5, "time": now},
+                    ]
+                },
+            }
+        elif rid == 3:
+            result = {"name": "Racer 3", "sessions": {"Atlanta": []}}
+
+        return result
+
+    mock_get_history.side_effect = history
+
+    result = await get_heat_records(mock_logger, mock_session, loc, [66, 67])
 
-        for i in range(1, 4):
-            mock_k1db.add_racer.assert_any_call(None, i, f"Racer {i}")
+    mock_get_info.assert_called_once_with(
+        mock_logger, mock_session, loc, [66, 67], FetchPriority.REPAIR
+    )
+    assert 1 == len(result)
+    assert [(1, "Racer 1"), (2, "Racer 2")] == result[0]["racers"]
+    assert RaceTypes.STANDARD == result[0]["heat"]["race_type"]
+    assert [
+        {
+            "rid": 1,
+            "location": "Atlanta",
+            "track": 1,
+            "time": now,
+            "kart": 5,
+            "score": 1210,
+            "pos": 1,
+            "times": [(22.47, 1), (22.99, 1)],
+        }
+    ] == result[0]["sessions"]
+    mock_logger.warning.assert_called_once_with(
+        "Could not find karts for %s heat %s", "Atlanta", 67
+    )
 
 
 def test_history_parser(blank_db):
@@ -732,6 +1146,113 @@ def test_history_parser(blank_db):
     } == result["sessions"]["Atlanta"][0]
 
 
+@pytest.mark.parametrize(
+    "after, count, done",
+    [
+        [datetime(2022, 1, 1, tzinfo=utc), 68, True],
+        [datetime(2010, 1, 1, tzinfo=utc), 451, False],
+    ],
+)
+def test_history_parser_cutoff(after, count, done, blank_db):
+    hist_path = Path(__file__).parents[1].joinpath("data", "history.html")
+
+    parser = HistoryParser(LOCATIONS["atlanta"])
+    parser.stop_at(after)
+    assert not parser.raced
+
+    parser.feed(hist_path.read_text())
+    assert parser.raced
+    sessions = parser.data["sessions"]["Atlanta"]
+
+    assert done == parser.done
+    assert count == len(sessions)
+    assert all(s["time"] > after for s in sessions)
+
+    # Anything fed after the cutoff is ignored
+    parser.feed(hist_path.read_text())
+    assert (count if done else 2 * count) == len(parser.data["sessions"]["Atlanta"])
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "after, count",
+    [
+        [datetime(2022, 1, 1, tzinfo=utc), 68],
+        [datetime(2010, 1, 1, tzinfo=utc), 451],
+    ],
+)
+@patch("k1insights.backend.clubspeed.FETCH_PARSE_SECONDS")
+@patch("k1insights.backend.clubspeed.FETCH_NETWORK_SECONDS")
+@patch("k1insights.backend.clubspeed.perf_counter")
+async def test_fetch_and_parse_history_cutoff(
+    mock_clock, mock_network, mock_parse, after, count, blank_db
+):
+    mock_clock.side_effect = ticks()
+    hist_page = Path(__file__).parents[1].joinpath("data", "history.html").read_bytes()
+    mock_logger = Mock()
+    mock_session = AsyncMock(spec=ClientSession)
+    mock_res = mock_session.get.return_value.__aenter__.return_value
+    read = []
+
+    async def chunks(size):
+        for idx in range(0, len(hist_page), size):
+            read.append(hist_page[idx : idx + size])
+            yield read[-1]
+
+    mock_res.charset = None
+    mock_res.content.iter_chunked = chunks
+    mock_res.close = Mock()
+
+    result = await fetch_and_parse(
+        mock_logger,
+        mock_session,
+        HistoryParser,
+        LOCATIONS["atlanta"],
+        "http://example.com",
+        after=after,
+    )
+
+    assert count == len(result.data["sessions"]["Atlanta"])
+    mock_res.text.assert_not_called()
+
+    # Each tick of the clock is one call, and each feed takes one tick; the
+    # reads get the rest, so feeding isn't counted as network time as well
+    chunks = len(read)
+    mock_parse.observe.assert_called_once_with(chunks, "HistoryParser")
+    mock_network.observe.assert_called_once_with(chunks + 1, "HistoryParser")
+
+    if result.done:
+        assert len(b"".join(read)) < len(hist_page)
+        mock_res.close.assert_called_once_with()
+    else:
+        assert hist_page == b"".join(read)
+        mock_res.close.assert_not_called()
+
+
+@pytest.mark.asyncio
+@patch("k1insights.backend.clubspeed.get_archive")
+async def test_fetch_and_parse_history_archived(mock_get_archive, blank_db):
+    hist_page = Path(__file__).parents[1].joinpath("data", "history.html").read_text()
+    mock_session = AsyncMock(spec=ClientSession)
+    mock_res = mock_session.get.return_value.__aenter__.return_value
+    mock_res.text.return_value = hist_page
+
+    result = await fetch_and_parse(
+        Mock(),
+        mock_session,
+        HistoryParser,
+        LOCATIONS["atlanta"],
+        "http://example.com",
+        after=datetime(2022, 1, 1, tzinfo=utc),
+    )
+
+    # The whole page is kept, not just as much as the cutoff needed
+    assert 68 == len(result.data["sessions"]["Atlanta"])
+    mock_get_archive.return_value.store.assert_called_once_with(
+        "HistoryParser", "Atlanta", "http://example.com", hist_page
+    )
+
+
 @pytest.mark.parametrize(
     "heat_type",
     [
@@ -0,0 +1,144 @@
+from asyncio import CancelledError
+from datetime import datetime, timedelta
+from sqlite3 import OperationalError
+from unittest.mock import AsyncMock, Mock, patch
+
+import pytest
+
+from aiohttp import ClientSession
+from pytz import utc
+
+from k1insights.backend.refresh import refresh_followed, refresh_racer
+from k1insights.backend.scheduler import FetchPriority
+from k1insights.common.constants import LOCATIONS
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("scenario", ["new", "known", "no-history"])
+@patch("k1insights.backend.refresh.REPAIR_BATCH_SIZE", 2)
+@patch("k1insights.backend.refresh.history_locations")
+@patch("k1insights.backend.refresh.K1DB")
+@patch("k1insights.backend.refresh.get_heat_records")
+@patch("k1insights.backend.refresh.get_racer_history", new_callable=AsyncMock)
+async def test_refresh_racer(
+    mock_get_history,
+    mock_get_records,
+    mock_k1db,
+    mock_locations,
+    scenario,
+    blank_db,
+):
+    mock_logger = Mock()
+    mock_session = Mock()
+    mock_spool = Mock()
+    newest = datetime(2022, 4, 20, 20, tzinfo=utc)
+    locs = [LOCATIONS["atlanta"]]
+
+    mock_locations.return_value = (locs, scenario == "new")
+    mock_k1db.stored_heats.return_value = {10}
+
+    def record(heat_no):
+        return {
+            "heat": {"location": "Atlanta", "heat_no": heat_no},
+            "sessions": [{"rid": r, "kart": heat_no} for r in (123, 456)],
+        }
+
+    mock_get_records.side_effect = [[record(11), record(12)], [record(13)]]
+
+    if scenario == "no-history":
+        mock_get_history.return_value = {}
+    else:
+        mock_get_history.return_value = {
+            "name": "Test Racer",
+            "sessions": {
+                "Atlanta": [
+                    {"location": "Atlanta", "heat_id": h, "kart": h, "time": newest}
+                    for h in (13, 12, 11, 10)
+                ]
+            },
+            "locations": ["Atlanta"],
+        }
+
+    result = await refresh_racer(
+        mock_logger,
+        mock_session,
+        None,
+        mock_spool,
+        123,
+        None if scenario == "new" else newest,
+    )
+
+    after = mock_get_history.call_args.args[3]
+
+    if scenario == "new":
+        assert datetime.now(utc) - after > timedelta(days=29)
+    else:
+        assert newest - timedelta(minutes=1) == after
+
+    assert (locs, FetchPriority.BACKFILL) == mock_get_history.call_args.args[4:]
+
+    if scenario == "no-history":
+        assert 0 == result
+        mock_k1db.add_racer_locations.assert_not_called()
+        mock_get_records.assert_not_called()
+    else:
+        assert 3 == result
+        (_, rid, found, swept) = mock_k1db.add_racer_locations.call_args.args
+        assert (123, ["Atlanta"]) == (rid, found)
+        assert (scenario == "new") == (swept is not None)
+
+        mock_k1db.stored_heats.assert_called_once_with(
+            None, "Atlanta", [13, 12, 11, 10]
+        )
+        assert [[11, 12], [13]] == [c.args[3] for c in mock_get_records.call_args_list]
+        assert {FetchPriority.BACKFILL} == {
+            c.args[4] for c in mock_get_records.call_args_list
+        }
+        assert 2 == mock_spool.commit.call_count
+
+        # Every racer's session in the heat is stored, not just the followed one
+        records = [c.args[0] for c in mock_spool.append.call_args_list]
+        assert [11, 12, 13] == [r["heat"]["heat_no"] for r in records]
+        assert [[123, 456]] * 3 == [[s["rid"] for s in r["sessions"]] for r in records]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("scenario", ["no-racers", "db-locked", "good", "no-db"])
+@patch("k1insights.backend.refresh.FOLLOW_INTERVAL", 60)
+@patch("k1insights.backend.refresh.sleep")
+@patch("k1insights.backend.refresh.K1DB")
+@patch("k1insights.backend.refresh.refresh_racer")
+@patch("k1insights.backend.refresh.ClientSession", spec=ClientSession)
+async def test_refresh_followed(
+    mock_session, mock_refresh_racer, mock_k1db, mock_sleep, scenario, blank_db
+):
+    mock_logger = Mock()
+    mock_sleep.side_effect = [None, None, CancelledError]
+
+    if scenario == "no-db":
+        mock_k1db.followed_racers.side_effect = OperationalError("database is locked")
+    elif scenario == "no-racers":
+        mock_k1db.followed_racers.return_value = []
+    else:
+        mock_k1db.followed_racers.return_value = [(1, None), (2, None), (3, None)]
+
+    if scenario == "db-locked":
+        mock_refresh_racer.side_effect = OperationalError("database is locked")
+    else:
+        mock_refresh_racer.side_effect = [0, 2, 0]
+
+    with pytest.raises(CancelledError):
+        await refresh_followed(mock_logger, None, None)
+
+    if scenario in ("no-racers", "no-db"):
+        mock_refresh_racer.assert_not_called()
+        mock_sleep.assert_called_with(60)
+    else:
+        # Three racers share the interval between them
+        mock_sleep.assert_called_with(20)
+        assert 3 == mock_refresh_racer.call_count
+
+    if scenario == "good":
+        mock_logger.info.assert_any_call("Added %s heat(s) for racer %s", 2, 2)
+    elif scenario != "no-racers":
+        mock_logger.warning.assert_called()
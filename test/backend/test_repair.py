@@ -0,0 +1,88 @@
+from asyncio import CancelledError
+from sqlite3 import OperationalError
+from unittest.mock import Mock, patch
+
+import pytest
+
+from aiohttp import ClientSession
+
+from k1insights.backend.repair import repair_gaps, repair_location
+from k1insights.common.constants import LOCATIONS
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("gaps", [True, False])
+@patch("k1insights.backend.repair.REPAIR_BATCH_SIZE", 2)
+@patch("k1insights.backend.repair.sleep")
+@patch("k1insights.backend.repair.K1DB")
+@patch("k1insights.backend.repair.get_heat_records")
+async def test_repair_location(mock_get_records, mock_k1db, mock_sleep, gaps, blank_db):
+    mock_logger = Mock()
+    mock_session = Mock()
+    mock_spool = Mock()
+    loc = LOCATIONS["atlanta"]
+
+    mock_k1db.heat_gaps.return_value = [12, 13, 14] if gaps else []
+    mock_k1db.pending_repairs.return_value = [14, 13, 12] if gaps else []
+    mock_get_records.side_effect = [
+        [{"heat": {"heat_no": 14}}],
+        [{"heat": {"heat_no": 12}}],
+    ]
+
+    result = await repair_location(mock_logger, mock_session, None, mock_spool, loc)
+
+    assert mock_k1db.repair_stats.return_value is result
+
+    if gaps:
+        mock_k1db.queue_repairs.assert_called_once_with(None, "Atlanta", [12, 13, 14])
+        mock_logger.info.assert_called_once_with(
+            "Repairing %s missing %s heat(s)", 3, "Atlanta"
+        )
+        assert 2 == mock_spool.append.call_count
+        assert 2 == mock_spool.commit.call_count
+        mock_k1db.finish_repairs.assert_any_call(None, "Atlanta", [14, 13], {14}, 3)
+        mock_k1db.finish_repairs.assert_any_call(None, "Atlanta", [12], {12}, 3)
+    else:
+        mock_k1db.queue_repairs.assert_not_called()
+        mock_get_records.assert_not_called()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("db_locked", [True, False])
+@patch("k1insights.backend.repair.sleep", side_effect=CancelledError)
+@patch("k1insights.backend.repair.repair_location")
+@patch("k1insights.backend.repair.ClientSession", spec=ClientSession)
+async def test_repair_gaps(
+    mock_session, mock_repair_location, mock_sleep, db_locked, blank_db
+):
+    mock_logger = Mock()
+
+    if db_locked:
+        mock_repair_location.side_effect = OperationalError("database is locked")
+    else:
+        mock_repair_location.return_value = {
+            "stored": 9,
+            "pending": 1,
+            "repaired": 2,
+            "abandoned": 0,
+            "completeness": 0.9,
+        }
+
+    with pytest.raises(CancelledError):
+        await repair_gaps(mock_logger, None, None)
+
+    assert len(LOCATIONS) == mock_repair_location.call_count
+
+    if db_locked:
+        mock_logger.warning.assert_called()
+    else:
+        mock_logger.info.assert_any_call(
+            "%s heats %.1f%% complete: %s stored, %s pending, "
+            "%s repaired, %s abandoned",
+            "Atlanta",
+            90.0,
+            9,
+            1,
+            2,
+            0,
+        )
@@ -0,0 +1,165 @@
+from asyncio import CancelledError, create_task, sleep
+
+import pytest
+
+from k1insights.backend.scheduler import FetchPriority, FetchScheduler
+from k1insights.common.metrics import FETCH_WAIT_SECONDS
+
+
+async def start(scheduler, host, priority, started):
+    await scheduler.acquire(host, priority)
+    started.append((host, priority))
+
+
+@pytest.mark.asyncio
+async def test_priority_order():
+    scheduler = FetchScheduler(1, 1)
+    started = []
+
+    await scheduler.acquire("a", FetchPriority.BACKFILL)
+
+    tasks = [
+        create_task(start(scheduler, "a", p, started))
+        for p in (FetchPriority.BACKFILL, FetchPriority.REPAIR, FetchPriority.LIVE)
+    ]
+    await sleep(0)
+    assert 3 == scheduler.waiting
+    assert [] == started
+
+    for expected in (
+        FetchPriority.LIVE,
+        FetchPriority.REPAIR,
+        FetchPriority.BACKFILL,
+    ):
+        scheduler.release("a")
+        await sleep(0)
+        assert ("a", expected) == started[-1]
+
+    for task in tasks:
+        await task
+
+    assert 1 == scheduler.active
+    assert 0 == scheduler.waiting
+
+
+@pytest.mark.asyncio
+async def test_host_limit():
+    scheduler = FetchScheduler(3, 1)
+    started = []
+
+    await scheduler.acquire("a", FetchPriority.BACKFILL)
+    blocked = create_task(start(scheduler, "a", FetchPriority.LIVE, started))
+    other = create_task(start(scheduler, "b", FetchPriority.BACKFILL, started))
+    await other
+
+    # The busy host doesn't hold up work bound for another one
+    assert [("b", FetchPriority.BACKFILL)] == started
+    assert {"a": 1, "b": 1} == scheduler.host_active
+
+    scheduler.release("b")
+    assert {"a": 1} == scheduler.host_active
+
+    scheduler.release("a")
+    await blocked
+    assert ("a", FetchPriority.LIVE) == started[-1]
+
+
+@pytest.mark.asyncio
+async def test_live_reserve():
+    scheduler = FetchScheduler(3, 3, reserved=2)
+    started = []
+
+    await scheduler.acquire("a", FetchPriority.BACKFILL)
+    backfill = create_task(start(scheduler, "b", FetchPriority.BACKFILL, started))
+    await sleep(0)
+    assert [] == started
+
+    await scheduler.acquire("c", FetchPriority.LIVE)
+    await scheduler.acquire("c", FetchPriority.LIVE)
+    assert 3 == scheduler.active
+
+    scheduler.release("c")
+    scheduler.release("c")
+    await sleep(0)
+    assert [] == started
+
+    scheduler.release("a")
+    await backfill
+    assert [("b", FetchPriority.BACKFILL)] == started
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("granted", [False, True])
+async def test_cancel(granted):
+    scheduler = FetchScheduler(1, 1)
+    started = []
+
+    await scheduler.acquire("a", FetchPriority.LIVE)
+    task = create_task(start(scheduler, "a", FetchPriority.REPAIR, started))
+    await sleep(0)
+
+    if granted:
+        # Handed a slot, but cancelled before it gets to run
+        scheduler.release("a")
+    task.cancel()
+
+    with pytest.raises(CancelledError):
+        await task
+
+    assert [] == started
+    assert (0 if granted else 1) == scheduler.active
+
+    if not granted:
+        scheduler.release("a")
+
+    await scheduler.acquire("a", FetchPriority.BACKFILL)
+    assert 0 == scheduler.waiting
+
+
+@pytest.mark.asyncio
+async def test_slot():
+    scheduler = FetchScheduler(2, 2)
+    before = FETCH_WAIT_SECONDS.values.get(("repair",), [0])[0]
+
+    with pytest.raises(ValueError):
+        async with scheduler.slot("a", FetchPriority.REPAIR):
+            assert {"a": 1} == scheduler.host_active
+            raise ValueError("Fetch failed")
+
+    assert 0 == scheduler.active
+    assert {} == scheduler.host_active
+    assert before + 1 == FETCH_WAIT_SECONDS.values[("repair",)][0]
+
+
+@pytest.mark.asyncio
+async def test_live_host_reserve():
+    scheduler = FetchScheduler(10, 4, reserved=2, host_reserved=1)
+    started = []
+
+    # Everything bound for one server, which bulk work alone can't fill
+    for _ in range(3):
+        await scheduler.acquire("a", FetchPriority.BACKFILL)
+
+    backfill = create_task(start(scheduler, "a", FetchPriority.BACKFILL, started))
+    repair = create_task(start(scheduler, "a", FetchPriority.REPAIR, started))
+    await sleep(0)
+    assert [] == started
+    assert 2 == scheduler.waiting
+
+    await start(scheduler, "a", FetchPriority.LIVE, started)
+    assert [("a", FetchPriority.LIVE)] == started
+    assert {"a": 4} == scheduler.host_active
+
+    scheduler.release("a")
+    await sleep(0)
+    assert not repair.done()
+
+    scheduler.release("a")
+    await repair
+    assert ("a", FetchPriority.REPAIR) == started[-1]
+    assert not backfill.done()
+
+    scheduler.release("a")
+    await backfill
+    assert ("a", FetchPriority.BACKFILL) == started[-1]
+    assert {"a": 3} == scheduler.host_active
@@ -0,0 +1,184 @@
+from datetime import datetime
+from queue import Queue
+from sqlite3 import OperationalError
+from unittest.mock import Mock, patch
+
+import pytest
+
+from pytz import utc
+
+from k1insights.backend.clubspeed import RaceTypes, WinConditions
+from k1insights.backend.spool import HeatSpool, ShardSpool
+from k1insights.common.db import K1DB
+
+
+def make_record(hour):
+    now = datetime(2022, 5, 1, hour, tzinfo=utc)
+
+    return {
+        "racers": [(1, "Racer 1"), (2, "Racer 2")],
+        "heat": {
+            "location": "Atlanta",
+            "track": 1,
+            "time": now,
+            "race_type": RaceTypes.STANDARD,
+            "win_cond": WinConditions.BEST_LAP,
+        },
+        "sessions": [
+            {
+                "rid": 1,
+                "location": "Atlanta",
+                "track": 1,
+                "time": now,
+                "kart": 11,
+                "score": 1210,
+                "pos": 1,
+                "times": [(22.47, 1), (23.456, 1)],
+            },
+            {
+                "rid": 2,
+                "location": "Atlanta",
+                "track": 1,
+                "time": now,
+                "kart": 22,
+                "score": 1204,
+                "pos": 2,
+                "times": [(23.241, 2), (34.567, 2)],
+            },
+        ],
+    }
+
+
+def test_spool_commit(blank_db, tmp_path):
+    mock_logger = Mock()
+    spool = HeatSpool(mock_logger, tmp_path / "test.spool")
+    spool.open()
+
+    assert 0 == spool.commit(blank_db)
+
+    spool.append(make_record(16))
+    spool.append(make_record(17))
+    assert 2 == spool.pending
+
+    assert 2 == spool.commit(blank_db)
+    assert 0 == spool.pending
+    assert 2 == blank_db.execute("select count(*) from heats").fetchone()[0]
+    assert 4 == blank_db.execute("select count(*) from sessions").fetchone()[0]
+    assert 0 == (tmp_path / "test.spool").stat().st_size
+    mock_logger.info.assert_any_call(
+        "Saved all data for %s race beginning at %s UTC",
+        "Atlanta",
+        datetime(2022, 5, 1, 17).time(),
+    )
+
+    spool.close()
+    spool.close()
+
+
+@pytest.mark.parametrize("torn", [True, False])
+def test_spool_replay(torn, blank_db, tmp_path):
+    mock_logger = Mock()
+    spool_path = tmp_path / "test.spool"
+
+    spool = HeatSpool(mock_logger, spool_path, fsync_batch=1)
+    spool.open()
+    spool.append(make_record(16))
+    spool.append(make_record(17))
+    spool.close()
+
+    if torn:
+        with spool_path.open("a") as f:
+            f.write('{"seq":3,"rec')
+
+    replay = HeatSpool(mock_logger, spool_path)
+    replay.open()
+
+    assert 2 == replay.pending
+    mock_logger.info.assert_called_once_with("Found %s uncommitted heat(s) in spool", 2)
+
+    if torn:
+        mock_logger.warning.assert_called_once_with(
+            "Skipping unreadable spool entry on line %s", 3
+        )
+
+    assert 2 == replay.commit(blank_db)
+    replay.close()
+
+    session = blank_db.execute(
+        "select * from sessions where rid = 2 and hid = 2"
+    ).fetchone()
+    assert 22 == session["kart"]
+    assert 34.567 == session["lap_2"]
+
+
+@patch("k1insights.backend.spool.K1DB")
+def test_spool_db_outage(mock_k1db, tmp_path):
+    mock_logger = Mock()
+    spool_path = tmp_path / "test.spool"
+    mock_k1db.add_sessions.side_effect = [
+        None,
+        OperationalError("database is locked"),
+        None,
+    ]
+
+    spool = HeatSpool(mock_logger, spool_path)
+    spool.open()
+    spool.append(make_record(16))
+    spool.append(make_record(17))
+
+    assert 1 == spool.commit(None)
+    assert 1 == spool.pending
+    mock_logger.warning.assert_called_once()
+    spool.close()
+
+    replay = HeatSpool(mock_logger, spool_path)
+    replay.open()
+    assert 1 == replay.pending
+    assert 1 == replay.commit(None)
+    replay.close()
+
+
+def test_spool_unopened(tmp_path):
+    spool = HeatSpool(Mock(), tmp_path / "test.spool")
+
+    with pytest.raises(RuntimeError):
+        spool.append(make_record(16))
+
+    with pytest.raises(TypeError):
+        HeatSpool._encode(object())
+
+
+@pytest.mark.parametrize("locked", [False, True])
+def test_spool_save_cursor(locked, blank_db, tmp_path):
+    spool = HeatSpool(Mock(), tmp_path / "test.spool")
+    cursor = {"client_id": "abc", "message_id": "42", "last_heat": 69}
+
+    if locked:
+        with patch.object(
+            K1DB, "save_cursor", side_effect=OperationalError("database is locked")
+        ):
+            assert not spool.save_cursor(blank_db, "Atlanta", cursor)
+        assert K1DB.get_cursor(blank_db, "Atlanta") is None
+    else:
+        assert spool.save_cursor(blank_db, "Atlanta", cursor)
+        assert cursor == K1DB.get_cursor(blank_db, "Atlanta")
+
+
+def test_shard_spool():
+    queue = Queue()
+    spool = ShardSpool(queue)
+    cursor = {"client_id": "abc", "message_id": "42", "last_heat": 69}
+
+    assert 0 == spool.commit(None)
+    assert queue.empty()
+
+    spool.append(make_record(16))
+    spool.append(make_record(17))
+    assert 2 == spool.commit(None)
+    assert ("heats", [make_record(16), make_record(17)]) == queue.get_nowait()
+
+    spool.append(make_record(18))
+    assert spool.save_cursor(None, "Atlanta", cursor)
+    assert ("heats", [make_record(18)]) == queue.get_nowait()
+    assert ("cursor", ("Atlanta", cursor)) == queue.get_nowait()
+    assert queue.empty()
@@ -1,32 +1,237 @@
-from unittest.mock import patch
+from queue import Empty
+from unittest.mock import AsyncMock, Mock, patch
 
 import pytest
 
+from k1insights.backend.refresh import refresh_followed
+from k1insights.backend.repair import repair_gaps
 from k1insights.common.constants import LOCATIONS
 
 
 @pytest.mark.asyncio
+async def test_metrics_handler(blank_db):
+    from k1insights.backend.watchers import metrics_handler
+
+    response = await metrics_handler(None)
+
+    assert response.content_type == "text/plain"
+    assert b"# TYPE k1_polls_total counter" in response.body
+
+
+@pytest.mark.asyncio
+@patch("k1insights.backend.watchers.sleep_forever", new_callable=AsyncMock)
+@patch("k1insights.backend.watchers.web.TCPSite")
+@patch("k1insights.backend.watchers.web.AppRunner")
+async def test_serve_metrics(mock_runner, mock_site, mock_sleep, blank_db):
+    from k1insights.backend.watchers import serve_metrics
+
+    mock_runner.return_value.setup = AsyncMock()
+    mock_runner.return_value.cleanup = AsyncMock()
+    mock_site.return_value.start = AsyncMock()
+
+    await serve_metrics(9464)
+
+    mock_site.assert_called_once_with(mock_runner.return_value, "127.0.0.1", 9464)
+    mock_site.return_value.start.assert_awaited_once()
+    mock_sleep.assert_awaited_once()
+    mock_runner.return_value.cleanup.assert_awaited_once()
+
+
+@pytest.mark.parametrize(
+    "workers, expected",
+    [
+        [1, [["a", "b", "c"]]],
+        [2, [["a", "c"], ["b"]]],
+        [4, [["a"], ["b"], ["c"]]],
+    ],
+)
+def test_shard_locations(workers, expected, blank_db):
+    from k1insights.backend.watchers import shard_locations
+
+    assert expected == shard_locations(["a", "b", "c"], workers)
+
+
+@pytest.mark.asyncio
+async def test_write_shards(blank_db):
+    from k1insights.backend.watchers import LOG, write_shards
+
+    mock_spool = Mock()
+    mock_spool.save_cursor.side_effect = [True, False]
+    mock_queue = Mock()
+    cursor = {"client_id": "abc", "message_id": "42", "last_heat": 69}
+    mock_queue.get.side_effect = [
+        ("heats", [{"heat": 1}, {"heat": 2}]),
+        Empty(),
+        ("cursor", ("Atlanta", cursor)),
+        ("cursor", ("Atlanta", cursor)),
+        RuntimeError("Stop writing"),
+    ]
+
+    with patch.object(LOG, "debug") as mock_debug, pytest.raises(RuntimeError):
+        await write_shards(blank_db, mock_spool, mock_queue)
+
+    assert [({"heat": 1},), ({"heat": 2},)] == [
+        c.args for c in mock_spool.append.call_args_list
+    ]
+    mock_spool.commit.assert_called_once_with(blank_db)
+    mock_spool.save_cursor.assert_called_with(blank_db, "Atlanta", cursor)
+    mock_debug.assert_called_once_with("Could not save %s watcher cursor", "Atlanta")
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("metrics_port", [0, 9464])
+@patch("k1insights.backend.watchers.create_task_group")
+async def test_start_shard(mock_task_group, metrics_port, blank_db):
+    from k1insights.backend.watchers import serve_metrics, start_shard, watch_location
+
+    mock_task_group.return_value.__aenter__.return_value = mock_task_group
+    calls = mock_task_group.start_soon.call_args_list
+
+    with patch("k1insights.backend.watchers.METRICS_PORT", metrics_port):
+        await start_shard(1, ["atlanta"], Mock())
+
+    assert [(watch_location, LOCATIONS["atlanta"])] == [
+        (c.args[0], c.args[2]) for c in calls if c.args[0] is watch_location
+    ]
+
+    if metrics_port:
+        assert any([c.args == (serve_metrics, 9466) for c in calls])
+    else:
+        assert not any([c.args[0] is serve_metrics for c in calls])
+
+
+@pytest.mark.parametrize("interrupted", [False, True])
+@patch("k1insights.backend.watchers.configure_logging")
+@patch("k1insights.backend.watchers.run")
+def test_run_shard(mock_run, mock_logging, interrupted, blank_db):
+    from k1insights.backend.watchers import run_shard, start_shard
+
+    mock_queue = Mock()
+
+    if interrupted:
+        mock_run.side_effect = KeyboardInterrupt
+
+    run_shard(0, ["atlanta"], mock_queue, True)
+
+    mock_logging.assert_called_once_with(True)
+    mock_run.assert_called_once_with(start_shard, 0, ["atlanta"], mock_queue)
+    mock_logging.return_value.stop.assert_called_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("pending", [0, 2])
+@pytest.mark.parametrize("metrics_port", [0, 9464])
+@patch("k1insights.backend.watchers.HeatSpool")
 @patch("k1insights.backend.watchers.create_task_group")
-async def test_start_watchers(mock_task_group, blank_db):
-    from k1insights.backend.watchers import start_watchers
+async def test_start_watchers(
+    mock_task_group, mock_spool, metrics_port, pending, blank_db
+):
+    from k1insights.backend.watchers import LOG, serve_metrics, start_watchers
 
     mock_task_group.return_value.__aenter__.return_value = mock_task_group
+    mock_spool.return_value.commit.return_value = pending
+
+    with patch.object(LOG, "info") as mock_info, patch(
+        "k1insights.backend.watchers.METRICS_PORT", metrics_port
+    ):
+        await start_watchers()
 
-    await start_watchers()
+    mock_spool.return_value.open.assert_called_once()
+    mock_spool.return_value.close.assert_called_once()
+
+    if pending:
+        mock_info.assert_called_once_with("Replayed spooled heats from previous run")
+    else:
+        mock_info.assert_not_called()
 
     for loc in LOCATIONS.values():
         assert any(
-            [c.args[2] == loc for c in mock_task_group.start_soon.call_args_list]
+            [c.args[2:3] == (loc,) for c in mock_task_group.start_soon.call_args_list]
         )
 
+    assert any(
+        [c.args[0] is repair_gaps for c in mock_task_group.start_soon.call_args_list]
+    )
+    assert any(
+        [
+            c.args[0] is refresh_followed
+            for c in mock_task_group.start_soon.call_args_list
+        ]
+    )
+    assert bool(metrics_port) == any(
+        [c.args[0] is serve_metrics for c in mock_task_group.start_soon.call_args_list]
+    )
 
-@pytest.mark.parametrize("debug", [True, False])
+
+@pytest.mark.asyncio
+@patch("k1insights.backend.watchers.get_context")
+@patch("k1insights.backend.watchers.HeatSpool")
+@patch("k1insights.backend.watchers.create_task_group")
+async def test_start_watchers_sharded(
+    mock_task_group, mock_spool, mock_context, blank_db
+):
+    from k1insights.backend.watchers import (
+        run_shard,
+        start_watchers,
+        watch_location,
+        write_shards,
+    )
+
+    mock_task_group.return_value.__aenter__.return_value = mock_task_group
+    mock_spool.return_value.commit.return_value = 0
+    mock_ctx = mock_context.return_value
+    calls = mock_task_group.start_soon.call_args_list
+
+    await start_watchers(2)
+
+    mock_context.assert_called_once_with("spawn")
+    mock_ctx.Process.assert_called_once_with(
+        target=run_shard,
+        args=(0, ["atlanta"], mock_ctx.Queue.return_value, False),
+        name="k1-watcher-0",
+        daemon=True,
+    )
+    mock_ctx.Process.return_value.start.assert_called_once()
+    mock_ctx.Process.return_value.terminate.assert_called_once()
+    mock_ctx.Process.return_value.join.assert_called_once()
+
+    assert not any([c.args[0] is watch_location for c in calls])
+    assert any(
+        [
+            c.args[0] is write_shards and c.args[2] is mock_spool.return_value
+            for c in calls
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "args, debug, workers",
+    [[[], False, 0], [["-d"], True, 0], [["-w", "4"], False, 4]],
+)
+@patch("k1insights.backend.watchers.configure_logging")
 @patch("k1insights.backend.watchers.run")
-def test_main(mock_run, debug, blank_db):
+def test_main(mock_run, mock_logging, args, debug, workers, blank_db):
     from k1insights.backend.watchers import main, start_watchers
 
-    args = ["-d"] if debug else []
-
     main(args)
 
-    mock_run.assert_called_once_with(start_watchers, backend_options={"debug": debug})
+    mock_logging.assert_called_once_with(debug)
+    mock_run.assert_called_once_with(
+        start_watchers, workers, backend_options={"debug": debug}
+    )
+
+
+@pytest.mark.parametrize("debug", [True, False])
+def test_configure_logging(debug, blank_db):
+    from logging import DEBUG, INFO, getLogger
+
+    from k1insights.backend.watchers import configure_logging
+
+    service_logger = getLogger("k1insights")
+    lstnr = configure_logging(debug)
+
+    try:
+        assert (DEBUG if debug else INFO) == service_logger.level
+    finally:
+        lstnr.stop()
+        service_logger.removeHandler(service_logger.handlers[-1])
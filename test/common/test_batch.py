@@ -0,0 +1,88 @@
+from datetime import datetime
+
+from pytz import utc
+
+from k1insights.common.batch import SessionBatch
+
+
+HEAT = {
+    "location": "Atlanta",
+    "heat_no": 1,
+    "track": 1,
+    "time": datetime(2022, 4, 20, 20, tzinfo=utc),
+    "race_type": 0,
+    "win_cond": 0,
+}
+
+SESSIONS = [
+    {
+        "name": "Racer 1",
+        "rid": 1,
+        "pos": 1,
+        "score": 1212,
+        "lap_data": [(50.812, 2), (23.15, 1), (22.99, 1)],
+    },
+    {
+        "name": "Racer 2",
+        "rid": 2,
+        "pos": 2,
+        "score": 1200,
+        "lap_data": [(45.19, 1), (23.771, 2)],
+    },
+    {
+        "name": "Racer 3",
+        "rid": 3,
+        "pos": 3,
+        "score": 1199,
+        "lap_data": [(47.5, 3)],
+    },
+]
+
+
+def test_session_batch():
+    batch = SessionBatch()
+
+    assert 2 == batch.add_heat(HEAT, SESSIONS, {1: 7, 2: 12})
+    # Heats with no usable sessions are left out entirely
+    assert 0 == batch.add_heat(dict(HEAT, heat_no=2), SESSIONS, {})
+    assert 1 == batch.add_heat(dict(HEAT, heat_no=3), SESSIONS[2:], {3: 1})
+
+    assert 3 == len(batch)
+    assert [1, 3] == [h["heat_no"] for h in batch.heats]
+    assert range(0, 2) == batch.heat_sessions(0)
+    assert range(2, 3) == batch.heat_sessions(1)
+    assert [3, 2, 1] == [batch.lap_count(s) for s in range(3)]
+    assert [45.19, 23.771] == batch.lap_times(1)
+
+    assert [
+        {
+            "rid": 1,
+            "location": "Atlanta",
+            "track": 1,
+            "time": HEAT["time"],
+            "kart": 7,
+            "score": 1212,
+            "pos": 1,
+            "times": [(50.812, 2), (23.15, 1), (22.99, 1)],
+        },
+        {
+            "rid": 2,
+            "location": "Atlanta",
+            "track": 1,
+            "time": HEAT["time"],
+            "kart": 12,
+            "score": 1200,
+            "pos": 2,
+            "times": [(45.19, 1), (23.771, 2)],
+        },
+        {
+            "rid": 3,
+            "location": "Atlanta",
+            "track": 1,
+            "time": HEAT["time"],
+            "kart": 1,
+            "score": 1199,
+            "pos": 3,
+            "times": [(47.5, 3)],
+        },
+    ] == list(batch)
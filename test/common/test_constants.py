@@ -1,3 +1,7 @@
+import sys
+
+from json import dumps
+
 import pytest
 
 
@@ -21,3 +25,88 @@ def test_db_path(scenario, tmp_path, monkeypatch):
         from k1insights.common.constants import DB_PATH
 
         assert db_path.absolute() == DB_PATH
+
+
+@pytest.mark.parametrize("scenario", ["default", "override"])
+def test_spool_path(scenario, tmp_path, monkeypatch):
+    db_path = tmp_path.joinpath("test.db")
+    db_path.touch()
+    monkeypatch.setenv("K1_DATA_DB", str(db_path.absolute()))
+
+    if scenario == "override":
+        monkeypatch.setenv("K1_SPOOL", str(tmp_path.joinpath("other.spool")))
+
+    from k1insights.common.constants import SPOOL_PATH
+
+    if scenario == "default":
+        assert tmp_path.joinpath("test.spool").absolute() == SPOOL_PATH
+    else:
+        assert tmp_path.joinpath("other.spool").absolute() == SPOOL_PATH
+
+
+@pytest.mark.parametrize("scenario", ["default", "override"])
+def test_cache_path(scenario, tmp_path, monkeypatch):
+    db_path = tmp_path.joinpath("test.db")
+    db_path.touch()
+    monkeypatch.setenv("K1_DATA_DB", str(db_path.absolute()))
+
+    if scenario == "override":
+        monkeypatch.setenv("K1_CACHE", str(tmp_path.joinpath("other.cache")))
+
+    from k1insights.common.constants import CACHE_PATH
+
+    if scenario == "default":
+        assert tmp_path.joinpath("test.cache").absolute() == CACHE_PATH
+    else:
+        assert tmp_path.joinpath("other.cache").absolute() == CACHE_PATH
+
+
+@pytest.mark.parametrize(
+    "scenario", ["good", "unreadable", "bad-json", "bad-tz", "missing-key", "empty"]
+)
+def test_load_locations(scenario, tmp_path, monkeypatch):
+    config = tmp_path.joinpath("locations.json")
+    entries = [
+        {
+            "location": "Atlanta",
+            "subdomain": "k1atlanta",
+            "tracks": 1,
+            "tz": "US/Eastern",
+            "hours": [10, 24],
+        },
+        {
+            "location": "San Diego",
+            "subdomain": "k1sandiego",
+            "tracks": 2,
+            "tz": "US/Pacific",
+        },
+    ]
+
+    if scenario == "bad-json":
+        config.write_text("[{")
+    elif scenario == "bad-tz":
+        entries[1]["tz"] = "Mars/Olympus_Mons"
+    elif scenario == "missing-key":
+        del entries[1]["subdomain"]
+    elif scenario == "empty":
+        entries = []
+
+    if scenario not in ("unreadable", "bad-json"):
+        config.write_text(dumps(entries))
+
+    monkeypatch.setenv("K1_LOCATIONS", str(config))
+    sys.modules.pop("k1insights.common.constants", None)
+
+    if scenario != "good":
+        with pytest.raises(ValueError):
+            from k1insights.common.constants import LOCATIONS
+    else:
+        from k1insights.common.constants import LOCATIONS
+
+        assert ["atlanta", "san_diego"] == list(LOCATIONS)
+        assert (10, 24) == LOCATIONS["atlanta"]["hours"]
+        assert (0, 24) == LOCATIONS["san_diego"]["hours"]
+        assert 2 == LOCATIONS["san_diego"]["tracks"]
+        assert "US/Pacific" == LOCATIONS["san_diego"]["tz"].zone
+
+    sys.modules.pop("k1insights.common.constants", None)
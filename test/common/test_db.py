@@ -1,14 +1,17 @@
+import sqlite3
+
 from datetime import datetime, timedelta
 from os import environ
 from pathlib import Path
 from random import randint
-from unittest.mock import Mock
+from unittest.mock import Mock, patch
 
 import pytest
 
 from pytz import utc
 
 from k1insights.backend.clubspeed import RaceTypes, WinConditions
+from k1insights.common.batch import SessionBatch
 from k1insights.common.db import K1DB
 
 
@@ -47,14 +50,32 @@ def test_connect(scenario, test_db):
         mock_logger.error.assert_not_called()
 
 
+def test_connect_unchecked():
+    mock_logger = Mock()
+    p = Path(__file__).parents[1] / "data" / "bad_tegridy.db"
+
+    # Only skipped for a database that has been checked before
+    result = K1DB.connect(mock_logger, p, readonly=True, check=False)
+
+    assert result is not None
+    mock_logger.error.assert_not_called()
+    result.close()
+
+
 def test_add_racer(blank_db):
     K1DB.add_racer(blank_db, 1, "Racer 1")
     K1DB.add_racer(blank_db, 2, "Racer 2", True, True)
-    K1DB.add_racer(blank_db, 1, "Racer 1", True, True)
 
     racer_1 = blank_db.execute("select * from racers where rid = 1").fetchone()
     assert not racer_1["fast"]
     assert not racer_1["follow"]
+
+    # Adding a known racer again updates how they're tracked
+    K1DB.add_racer(blank_db, 1, "Racer 1", True, True)
+
+    racer_1 = blank_db.execute("select * from racers where rid = 1").fetchone()
+    assert racer_1["fast"]
+    assert racer_1["follow"]
     assert 2 == blank_db.execute("select count(*) from racers").fetchone()[0]
 
 
@@ -105,7 +126,7 @@ def test_add_heats(scenario, blank_db):
         K1DB.add_heats(blank_db, heats)
 
         heat_1 = blank_db.execute(
-            "select * from heats where runtime = ?", (now,)
+            "select * from heats where runtime = ?", (K1DB.to_epoch(now),)
         ).fetchone()
         assert RaceTypes.STANDARD == heat_1["type"]
         assert WinConditions.BEST_LAP == heat_1["wincond"]
@@ -204,7 +225,8 @@ def test_location_ftd(scenario, test_db):
         today_results = all_results[today]
 
         sessions = test_db.execute(
-            "select * from heats natural join sessions where runtime >= ?", (today,)
+            "select * from heats natural join sessions where local_date >= ?",
+            (today,),
         ).fetchall()
         for session in sessions:
             assert K1DB.get_best_lap(session) >= today_results[session["kart"]]
@@ -222,4 +244,425 @@ def test_location_ftd(scenario, test_db):
                 break
 
         for session in sessions:
-            assert K1DB.get_best_lap(session) >= results[session["runtime"].date()]
+            runtime = K1DB.from_epoch(session["runtime"])
+            day = K1DB.local_date("Atlanta", runtime)
+            assert K1DB.get_best_lap(session) >= results[day]
+
+
+@pytest.mark.parametrize("limit", [1, 2, 10])
+def test_location_top_karts(limit, test_db):
+    then = datetime.now(utc).date() - timedelta(days=3)
+    all_results = K1DB.location_ftd(test_db, "Atlanta", then)
+    results = K1DB.location_top_karts(test_db, "Atlanta", then, 1, limit)
+
+    # Newest day first, each with its fastest karts in order
+    assert sorted(all_results, reverse=True) == [day for (day, _) in results]
+
+    for (day, karts) in results:
+        ranked = sorted(all_results[day].items(), key=lambda k: (k[1], k[0]))
+        assert ranked[:limit] == karts
+
+    assert [] == K1DB.location_top_karts(test_db, "Atlanta", then, 2, limit)
+
+
+def test_location_karts(test_db):
+    then = datetime.now(utc).date() - timedelta(days=3)
+    karts = {r[0] for r in test_db.execute("select kart from sessions").fetchall()}
+
+    assert karts == K1DB.location_karts(test_db, "Atlanta", then, 1)
+    assert set() == K1DB.location_karts(test_db, "Atlanta", then, 2)
+    assert set() == K1DB.location_karts(test_db, "Boston", then, 1)
+
+
+def test_neighbour_days(test_db):
+    today = datetime.now(utc).date()
+    days = [today - timedelta(days=i) for i in range(3)]
+
+    assert (days[2], days[0]) == K1DB.neighbour_days(
+        test_db, "Atlanta", 1, days[1], days[1]
+    )
+    assert (None, None) == K1DB.neighbour_days(test_db, "Atlanta", 1, days[2], days[0])
+    assert (None, None) == K1DB.neighbour_days(test_db, "Atlanta", 2, days[1], days[1])
+
+    # Pages stay within their dates
+    assert [days[1]] == list(
+        K1DB.location_ftd(test_db, "Atlanta", days[1], until=days[1])
+    )
+    assert [days[1]] == [
+        day
+        for (day, _) in K1DB.location_top_karts(
+            test_db, "Atlanta", days[1], 1, 5, days[1]
+        )
+    ]
+
+
+def test_watermark(blank_db):
+    assert 0 == K1DB.watermark(blank_db)
+
+    heat = {
+        "location": "Atlanta",
+        "track": 1,
+        "race_type": RaceTypes.STANDARD,
+        "win_cond": WinConditions.BEST_LAP,
+        "time": datetime.now(utc).replace(microsecond=0),
+    }
+    session = dict(heat, rid=1, kart=1, score=1200, pos=1, times=[(24.5, 1)])
+    K1DB.add_racer(blank_db, 1, "Racer 1")
+    K1DB.add_heats(blank_db, heat)
+
+    # Heats alone aren't enough to show anything new
+    assert 0 == K1DB.watermark(blank_db)
+
+    K1DB.add_sessions(blank_db, session)
+    mark = K1DB.watermark(blank_db)
+    assert 0 < mark
+
+    K1DB.add_sessions(blank_db, dict(session))
+    assert mark == K1DB.watermark(blank_db)
+
+
+def test_changed_karts(test_db):
+    assert {
+        ("Atlanta", k) for (k,) in test_db.execute("SELECT kart FROM sessions")
+    } == (K1DB.changed_karts(test_db, 0))
+
+    mark = K1DB.watermark(test_db)
+    assert set() == K1DB.changed_karts(test_db, mark)
+
+    heat = test_db.execute("SELECT * FROM heats LIMIT 1").fetchone()
+    K1DB.add_racer(test_db, 11, "Racer 11")
+    K1DB.add_sessions(
+        test_db,
+        {
+            "location": heat["location"],
+            "track": heat["track"],
+            "time": K1DB.from_epoch(heat["runtime"]),
+            "rid": 11,
+            "kart": 42,
+            "score": 1200,
+            "pos": 1,
+            "times": [(20.0, 1)],
+        },
+    )
+
+    assert {("Atlanta", 42)} == K1DB.changed_karts(test_db, mark)
+
+
+def test_local_date(blank_db):
+    late = datetime(2022, 7, 1, 2, 30, tzinfo=utc)
+    heats = [
+        {
+            "location": location,
+            "track": 1,
+            "race_type": RaceTypes.STANDARD,
+            "win_cond": WinConditions.BEST_LAP,
+            "time": late,
+        }
+        for location in ["Atlanta", "Nowhere"]
+    ]
+
+    K1DB.add_racer(blank_db, 1, "Racer 1")
+    K1DB.add_heats(blank_db, heats)
+    K1DB.add_sessions(
+        blank_db,
+        [
+            dict(h, rid=1, kart=3, score=1200, pos=1, times=[(24.5, 1), (23.5, 1)])
+            for h in heats
+        ],
+    )
+
+    # 22:30 in Atlanta is still the day before, unknown locations use UTC
+    assert {datetime(2022, 6, 30).date(): {3: 23.5}} == K1DB.location_ftd(
+        blank_db, "Atlanta", late - timedelta(days=1)
+    )
+    assert {datetime(2022, 7, 1).date(): 23.5} == K1DB.location_ftd(
+        blank_db, "Nowhere", late - timedelta(days=1), kart=3
+    )
+    assert {} == K1DB.location_ftd(blank_db, "Atlanta", late, kart=4)
+
+
+def test_migrate_heats(tmp_path):
+    old_path = tmp_path / "old.db"
+
+    with patch.object(K1DB, "MIGRATIONS", K1DB.MIGRATIONS[:3]):
+        K1DB.create_db(old_path)
+
+    # Heats stored before local dates, with runtimes as ISO text
+    db = sqlite3.connect(old_path)
+    with db:
+        db.execute("insert into racers values (1, 'Racer 1', 0, 0)")
+        db.executemany(
+            "insert into heats values (?, ?, 1, ?, 0, 0, ?)",
+            [
+                (1, "Atlanta", "2022-07-01 02:30:00+00:00", 10),
+                (2, "Nowhere", "2022-07-01 02:30:00.500000+00:00", None),
+            ],
+        )
+        db.execute(
+            "insert into sessions (hid, rid, position, kart, end_score, lap_1) "
+            "values (1, 1, 1, 3, 1200, 23.5)"
+        )
+    db.close()
+
+    db = K1DB.connect(Mock(), old_path)
+
+    assert len(K1DB.MIGRATIONS) == db.execute("PRAGMA user_version").fetchone()[0]
+    assert [
+        (1, "Atlanta", 1656642600, 10, "2022-06-30"),
+        (2, "Nowhere", 1656642600, None, "2022-07-01"),
+    ] == [
+        tuple(r)
+        for r in db.execute(
+            """
+            select hid, location, runtime, heat_no, cast(local_date as text)
+            from heats
+            order by hid
+            """
+        ).fetchall()
+    ]
+    assert db.execute("PRAGMA foreign_key_check").fetchone() is None
+    assert (
+        1
+        == db.execute("select count(*) from heats natural join sessions").fetchone()[0]
+    )
+
+    # New heats carry on numbering after the copied ones
+    K1DB.add_heats(
+        db,
+        {
+            "location": "Atlanta",
+            "track": 1,
+            "race_type": RaceTypes.STANDARD,
+            "win_cond": WinConditions.BEST_LAP,
+            "time": datetime(2022, 7, 2, tzinfo=utc),
+        },
+    )
+    assert 3 == db.execute("select max(hid) from heats").fetchone()[0]
+
+    K1DB.close(db)
+
+
+def test_connect_readonly(tmp_path):
+    old_path = tmp_path / "old.db"
+
+    with patch.object(K1DB, "MIGRATIONS", []):
+        K1DB.create_db(old_path)
+
+    db = K1DB.connect(Mock(), old_path, readonly=True)
+
+    # Migrating is left to the writer, and writes are refused outright
+    assert 0 == db.execute("PRAGMA user_version").fetchone()[0]
+
+    with pytest.raises(sqlite3.OperationalError):
+        K1DB.add_racer(db, 1, "Racer 1")
+
+    K1DB.close(db)
+
+
+@pytest.mark.parametrize("scenario", ["fresh", "outdated", "failed"])
+def test_migrate(scenario, blank_db, tmp_path):
+    version = blank_db.execute("PRAGMA user_version").fetchone()[0]
+    assert len(K1DB.MIGRATIONS) == version
+
+    if scenario == "fresh":
+        K1DB.migrate(blank_db)
+
+    elif scenario == "outdated":
+        old_path = tmp_path / "old.db"
+
+        with patch.object(K1DB, "MIGRATIONS", []):
+            K1DB.create_db(old_path)
+
+        blank_db = K1DB.connect(Mock(), old_path)
+
+    elif scenario == "failed":
+        blank_db.execute("PRAGMA user_version = 0")
+
+        with pytest.raises(sqlite3.OperationalError):
+            K1DB.migrate(blank_db)
+
+        assert 0 == blank_db.execute("PRAGMA user_version").fetchone()[0]
+        assert not blank_db.in_transaction
+
+    if scenario != "failed":
+        assert version == blank_db.execute("PRAGMA user_version").fetchone()[0]
+        assert 0 == blank_db.execute("select count(*) from cursors").fetchone()[0]
+
+
+def test_cursor(blank_db):
+    assert K1DB.get_cursor(blank_db, "Atlanta") is None
+
+    K1DB.save_cursor(
+        blank_db,
+        "Atlanta",
+        {"client_id": "abc", "message_id": "42", "last_heat": 159218},
+    )
+    K1DB.save_cursor(
+        blank_db,
+        "Atlanta",
+        {"client_id": "abc", "message_id": "43", "last_heat": 159219},
+    )
+
+    assert {
+        "client_id": "abc",
+        "message_id": "43",
+        "last_heat": 159219,
+    } == K1DB.get_cursor(blank_db, "Atlanta")
+    assert K1DB.get_cursor(blank_db, "Moscow") is None
+
+
+def test_heat_numbers(blank_db):
+    now = datetime.now(utc).replace(microsecond=0)
+    heat = {
+        "location": "Atlanta",
+        "track": 1,
+        "race_type": RaceTypes.STANDARD,
+        "win_cond": WinConditions.BEST_LAP,
+        "time": now,
+    }
+
+    K1DB.add_heats(blank_db, dict(heat))
+    assert blank_db.execute("select heat_no from heats").fetchone()[0] is None
+
+    K1DB.add_heats(blank_db, dict(heat, heat_no=100))
+    K1DB.add_heats(blank_db, dict(heat, heat_no=200))
+    assert 100 == blank_db.execute("select heat_no from heats").fetchone()[0]
+
+
+def test_repairs(blank_db):
+    now = datetime.now(utc).replace(microsecond=0)
+    heats = [
+        {
+            "location": "Atlanta",
+            "heat_no": heat_no,
+            "track": 1,
+            "race_type": RaceTypes.STANDARD,
+            "win_cond": WinConditions.BEST_LAP,
+            "time": now - timedelta(minutes=heat_no),
+        }
+        for heat_no in (10, 11, 15, 16, 18, 30)
+    ]
+    K1DB.add_heats(blank_db, heats)
+
+    assert [17, 19, 20, 21, 22, 23, 24, 25, 26, 27, 28, 29] == K1DB.heat_gaps(
+        blank_db, "Atlanta", 15
+    )
+    assert [12, 13, 14, 17] == K1DB.heat_gaps(blank_db, "Atlanta", 100)[:4]
+    assert [] == K1DB.heat_gaps(blank_db, "Moscow", 100)
+
+    K1DB.queue_repairs(blank_db, "Atlanta", [12, 13, 14, 17])
+    K1DB.queue_repairs(blank_db, "Atlanta", [12])
+    assert [17, 14] == K1DB.pending_repairs(blank_db, "Atlanta", 2)
+
+    K1DB.finish_repairs(blank_db, "Atlanta", [17, 14, 13], {17}, 2)
+    assert [14, 13, 12] == K1DB.pending_repairs(blank_db, "Atlanta", 10)
+
+    K1DB.finish_repairs(blank_db, "Atlanta", [14, 13], set(), 2)
+    assert [12] == K1DB.pending_repairs(blank_db, "Atlanta", 10)
+
+    K1DB.add_heats(blank_db, dict(heats[0], heat_no=17, time=now))
+    stats = K1DB.repair_stats(blank_db, "Atlanta", 100)
+    assert {
+        "stored": 7,
+        "pending": 1,
+        "repaired": 1,
+        "abandoned": 2,
+        "completeness": 0.7,
+    } == stats
+
+    assert 1.0 == K1DB.repair_stats(blank_db, "Moscow", 100)["completeness"]
+
+
+def test_racer_locations(test_db):
+    now = datetime.now(utc).replace(microsecond=0)
+    rid = test_db.execute("select rid from sessions").fetchone()[0]
+
+    assert (["Atlanta"], None) == K1DB.racer_locations(test_db, rid)
+    assert ([], None) == K1DB.racer_locations(test_db, 99)
+
+    K1DB.add_racer_locations(test_db, rid, ["Boston", "Atlanta"])
+    assert (["Atlanta", "Boston"], None) == K1DB.racer_locations(test_db, rid)
+
+    K1DB.add_racer_locations(test_db, rid, [], now)
+    assert (["Atlanta", "Boston"], now) == K1DB.racer_locations(test_db, rid)
+
+    # Racers already in the database are indexed when the table is created
+    with test_db:
+        test_db.execute("delete from racer_locations")
+        test_db.execute(K1DB.MIGRATIONS[2][-1])
+
+    assert ["Atlanta"] == K1DB.racer_locations(test_db, rid)[0]
+
+
+def test_followed_racers(test_db):
+    rid = test_db.execute("select rid from sessions").fetchone()[0]
+    newest = test_db.execute(
+        """
+        select max(runtime) as newest
+        from sessions natural join heats
+        where rid = ?
+        """,
+        (rid,),
+    ).fetchone()["newest"]
+
+    assert [] == K1DB.followed_racers(test_db)
+
+    K1DB.add_racer(test_db, 11, "Racer 11", follow=True)
+    with test_db:
+        test_db.execute("update racers set follow = 1 where rid = ?", (rid,))
+
+    assert [
+        (rid, K1DB.from_epoch(newest)),
+        (11, None),
+    ] == K1DB.followed_racers(test_db)
+
+
+def test_stored_heats(test_db):
+    now = datetime.now(utc).replace(microsecond=0)
+    K1DB.add_heats(
+        test_db,
+        {
+            "location": "Atlanta",
+            "heat_no": 12,
+            "track": 2,
+            "race_type": RaceTypes.STANDARD,
+            "win_cond": WinConditions.BEST_LAP,
+            "time": now,
+        },
+    )
+
+    assert {12} == K1DB.stored_heats(test_db, "Atlanta", [11, 12, 13])
+    assert set() == K1DB.stored_heats(test_db, "Moscow", [12])
+
+
+def test_add_session_batch(blank_db):
+    batch = SessionBatch()
+    heat = {
+        "location": "Atlanta",
+        "heat_no": 1,
+        "track": 1,
+        "time": datetime.now(utc).replace(microsecond=0),
+        "race_type": RaceTypes.STANDARD,
+        "win_cond": WinConditions.BEST_LAP,
+    }
+    batch.add_heat(
+        heat,
+        [
+            {"rid": 1, "pos": 2, "score": 1200, "lap_data": [(30.5, 2), (22.638, 2)]},
+            {"rid": 2, "pos": 1, "score": 1212, "lap_data": [(28.1, 1), (22.99, 1)]},
+        ],
+        {1: 4, 2: 9},
+    )
+
+    K1DB.add_racers(blank_db, [(1, "Racer 1"), (2, "Racer 2")])
+    K1DB.add_heats(blank_db, batch.heats)
+    K1DB.add_session_batch(blank_db, batch)
+
+    sessions = blank_db.execute(
+        "select rid, position, kart, end_score, lap_1, lap_2, lap_3 from sessions"
+    ).fetchall()
+    assert [
+        (1, 2, 4, 1200, 30.5, 22.638, None),
+        (2, 1, 9, 1212, 28.1, 22.99, None),
+    ] == [tuple(s) for s in sessions]
+    assert (["Atlanta"], None) == K1DB.racer_locations(blank_db, 2)
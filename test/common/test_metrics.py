@@ -0,0 +1,101 @@
+import pytest
+
+from k1insights.common.metrics import (
+    REGISTRY,
+    Counter,
+    Gauge,
+    Histogram,
+    Metric,
+    render,
+)
+
+
+@pytest.fixture
+def registry():
+    before = list(REGISTRY)
+    yield REGISTRY
+    REGISTRY[:] = before
+
+
+def test_metric(registry):
+    class Untyped(Metric):
+        def samples(self):
+            yield "k1_test 1"
+
+    with pytest.raises(TypeError):
+        Metric("k1_test", "Test metric")
+
+    metric = Untyped("k1_test", "Test metric")
+
+    assert metric in registry
+    assert list(metric.render()) == [
+        "# HELP k1_test Test metric",
+        "# TYPE k1_test untyped",
+        "k1_test 1",
+    ]
+
+
+def test_label_escaping(registry):
+    counter = Counter("k1_test_total", "Test counter", ("page",))
+    counter.inc('C:\\k1 "heat"\nlog')
+
+    assert list(counter.samples()) == [
+        'k1_test_total{page="C:\\\\k1 \\"heat\\"\\nlog"} 1'
+    ]
+
+
+def test_counter(registry):
+    counter = Counter("k1_test_total", "Test counter", ("location",))
+    counter.inc("atlanta")
+    counter.inc("atlanta", amount=2)
+    counter.inc("buford")
+
+    assert list(counter.render()) == [
+        "# HELP k1_test_total Test counter",
+        "# TYPE k1_test_total counter",
+        'k1_test_total{location="atlanta"} 3',
+        'k1_test_total{location="buford"} 1',
+    ]
+
+
+def test_gauge(registry):
+    gauge = Gauge("k1_test", "Test gauge")
+    gauge.set(0.5)
+    gauge.set(0.75)
+
+    assert list(gauge.samples()) == ["k1_test 0.75"]
+
+
+def test_histogram(registry):
+    hist = Histogram("k1_test_seconds", "Test histogram", ("page",), (0.1, 1))
+    hist.observe(0.05, "heat")
+    hist.observe(0.1, "heat")
+    hist.observe(5, "heat")
+
+    with hist.time("racer"):
+        pass
+
+    assert list(hist.samples()) == [
+        'k1_test_seconds_bucket{page="heat",le="0.1"} 2.0',
+        'k1_test_seconds_bucket{page="heat",le="1"} 2.0',
+        'k1_test_seconds_bucket{page="heat",le="+Inf"} 3.0',
+        'k1_test_seconds_sum{page="heat"} 5.15',
+        'k1_test_seconds_count{page="heat"} 3.0',
+        'k1_test_seconds_bucket{page="racer",le="0.1"} 1.0',
+        'k1_test_seconds_bucket{page="racer",le="1"} 1.0',
+        'k1_test_seconds_bucket{page="racer",le="+Inf"} 1.0',
+        f'k1_test_seconds_sum{{page="racer"}} {hist.values[("racer",)][-1]}',
+        'k1_test_seconds_count{page="racer"} 1.0',
+    ]
+
+
+def test_render(registry):
+    registry[:] = []
+    counter = Counter("k1_test_total", "Test counter")
+    counter.inc()
+
+    assert render() == (
+        "# HELP k1_test_total Test counter\n"
+        "# TYPE k1_test_total counter\n"
+        "k1_test_total 1\n"
+    )
@@ -0,0 +1,250 @@
+import re
+
+from datetime import timedelta
+from inspect import getsource
+
+import pytest
+
+from k1insights.common.batch import SessionBatch
+from k1insights.common.db import K1DB
+
+
+class PlanRecorder:
+    # Stands in for the connection, explaining each statement before running it
+    def __init__(self, db):
+        self.db = db
+        self.plans = []
+
+    def __enter__(self):
+        return self.db.__enter__()
+
+    def __exit__(self, *exc):
+        return self.db.__exit__(*exc)
+
+    def execute(self, sql, params=()):
+        self.explain(sql, params)
+        return self.db.execute(sql, params)
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+
+        if rows:
+            self.explain(sql, rows[0])
+
+        return self.db.executemany(sql, rows)
+
+    def explain(self, sql, params):
+        depth = {0: -1}
+        plan = []
+
+        for row in self.db.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall():
+            depth[row[0]] = depth.get(row[1], -1) + 1
+            # Older SQLite versions call every table a TABLE
+            detail = row[3].replace(" TABLE ", " ")
+            plan.append(f"{'  ' * depth[row[0]]}{detail}")
+
+        # Plain inserts have no plan, which is kept as such to be checked
+        self.plans.append("\n".join(plan))
+
+
+def heat(when, heat_no=None):
+    return {
+        "location": "Atlanta",
+        "heat_no": heat_no,
+        "track": 1,
+        "time": when,
+        "race_type": 0,
+        "win_cond": 0,
+    }
+
+
+def session(when):
+    return {
+        "location": "Atlanta",
+        "track": 1,
+        "time": when,
+        "rid": 1,
+        "kart": 1,
+        "score": 1200,
+        "pos": 1,
+        "times": [(25.0, 1)],
+    }
+
+
+def session_batch(when):
+    batch = SessionBatch()
+    batch.add_heat(
+        heat(when),
+        [
+            {
+                "name": "Racer 1",
+                "rid": 1,
+                "pos": 1,
+                "score": 1200,
+                "lap_data": [(25.0, 1)],
+            }
+        ],
+        {1: 1},
+    )
+    return batch
+
+
+# Setup and schema changes run once, so only the everyday queries are planned
+UNPLANNED = {"connect", "migrate", "close", "create_db"}
+
+# What each statement is expected to seek with, in the order they run; a
+# statement with nothing to seek with is a plain write that reads no table
+CALLS = {
+    "add_racer": (
+        lambda db, when: K1DB.add_racer(db, 1, "Racer 1", True, True),
+        [set()],
+    ),
+    "add_racers": (
+        lambda db, when: K1DB.add_racers(db, [(2, "Racer 2")]),
+        [set()],
+    ),
+    "add_heats": (
+        lambda db, when: K1DB.add_heats(db, [heat(when + timedelta(days=1), 1)]),
+        [set(), {"idx_heats_kart_hist"}],
+    ),
+    "add_sessions": (
+        lambda db, when: K1DB.add_sessions(db, [session(when)]),
+        [{"idx_heats_kart_hist"}, set(), set()],
+    ),
+    "add_session_batch": (
+        lambda db, when: K1DB.add_session_batch(db, session_batch(when)),
+        [{"idx_heats_kart_hist"}, set(), set()],
+    ),
+    "racer_locations": (
+        lambda db, when: K1DB.racer_locations(db, 1),
+        [{"PRIMARY KEY"}, {"INTEGER PRIMARY KEY"}],
+    ),
+    "add_racer_locations": (
+        lambda db, when: K1DB.add_racer_locations(db, 1, ["Atlanta"], when),
+        [set(), set()],
+    ),
+    "followed_racers": (
+        lambda db, when: K1DB.followed_racers(db),
+        [{"idx_racers_follow", "sqlite_autoindex_sessions_1", "INTEGER PRIMARY KEY"}],
+    ),
+    "stored_heats": (
+        lambda db, when: K1DB.stored_heats(db, "Atlanta", [1, 2, 3]),
+        [{"idx_heats_heat_no"}],
+    ),
+    "get_cursor": (
+        lambda db, when: K1DB.get_cursor(db, "Atlanta"),
+        [{"sqlite_autoindex_cursors_1"}],
+    ),
+    "save_cursor": (
+        lambda db, when: K1DB.save_cursor(
+            db, "Atlanta", {"client_id": "abc", "message_id": "1", "last_heat": 1}
+        ),
+        [set()],
+    ),
+    "heat_gaps": (
+        lambda db, when: K1DB.heat_gaps(db, "Atlanta", 500),
+        [{"idx_heats_heat_no"}],
+    ),
+    "queue_repairs": (
+        lambda db, when: K1DB.queue_repairs(db, "Atlanta", [1]),
+        [set()],
+    ),
+    "pending_repairs": (
+        lambda db, when: K1DB.pending_repairs(db, "Atlanta", 50),
+        [{"sqlite_autoindex_repairs_1"}],
+    ),
+    "finish_repairs": (
+        lambda db, when: K1DB.finish_repairs(db, "Atlanta", [1], set(), 3),
+        [{"sqlite_autoindex_repairs_1"}],
+    ),
+    "repair_stats": (
+        lambda db, when: K1DB.repair_stats(db, "Atlanta", 500),
+        [
+            {"idx_heats_heat_no"},
+            {"idx_heats_heat_no"},
+            {"sqlite_autoindex_repairs_1"},
+        ],
+    ),
+    "location_ftd": (
+        lambda db, when: K1DB.location_ftd(db, "Atlanta", when - timedelta(days=7)),
+        [{"idx_heats_local_date", "idx_sessions_kart_hist"}],
+    ),
+    "location_top_karts": (
+        lambda db, when: K1DB.location_top_karts(
+            db, "Atlanta", when.date() - timedelta(days=7), 1, 5
+        ),
+        [{"idx_heats_local_date", "idx_sessions_kart_hist"}],
+    ),
+    "location_karts": (
+        lambda db, when: K1DB.location_karts(db, "Atlanta", when.date(), 1),
+        [{"idx_heats_local_date", "idx_sessions_kart_hist"}],
+    ),
+    "neighbour_days": (
+        lambda db, when: K1DB.neighbour_days(
+            db, "Atlanta", 1, when.date(), when.date()
+        ),
+        [{"idx_heats_local_date"}, {"idx_heats_local_date"}],
+    ),
+    # MAX(rowid) reads the last row of the table, with no index to name
+    "watermark": (lambda db, when: K1DB.watermark(db), [set()]),
+    "changed_karts": (
+        lambda db, when: K1DB.changed_karts(db, 1),
+        [{"INTEGER PRIMARY KEY"}],
+    ),
+}
+
+ACCESS = re.compile(r"USING (?:COVERING )?INDEX (\w+)|USING ((?:INTEGER )?PRIMARY KEY)")
+SCANNED = re.compile(r"\bSCAN (\w+)")
+
+
+def test_every_query_planned():
+    queries = {
+        name
+        for (name, method) in vars(K1DB).items()
+        if isinstance(method, staticmethod)
+        and "db.execute" in getsource(method.__func__)
+    }
+
+    assert queries - UNPLANNED == set(CALLS)
+
+
+@pytest.mark.parametrize("method", CALLS)
+def test_query_plans(method, test_db):
+    (call, expected) = CALLS[method]
+    tables = {
+        r[0]
+        for r in test_db.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    }
+    when = K1DB.from_epoch(
+        test_db.execute("SELECT MAX(runtime) FROM heats").fetchone()[0]
+    )
+
+    # Without statistics the planner assumes every table is large, which is
+    # closer to a production database than the handful of rows here
+    recorder = PlanRecorder(test_db)
+    call(recorder, when)
+
+    assert len(expected) == len(recorder.plans), recorder.plans
+
+    for (plan, indexes) in zip(recorder.plans, expected):
+        assert indexes == {"".join(m) for m in ACCESS.findall(plan)}, plan
+        assert not tables & set(SCANNED.findall(plan)), plan
+
+        if not indexes and method != "watermark":
+            assert "" == plan
+
+
+def test_watermark_seeks(test_db):
+    # The plan for MAX(rowid) only says the table is searched, so the program
+    # is checked instead: it starts from the last row and stops after one
+    program = [
+        r["opcode"]
+        for r in test_db.execute(
+            "EXPLAIN SELECT COALESCE(MAX(rowid), 0) FROM sessions"
+        ).fetchall()
+    ]
+    step = program.index("AggStep")
+
+    assert "Last" in program
+    assert "Rewind" not in program
+    assert "Goto" == program[step + 1]
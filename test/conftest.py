@@ -1,16 +1,26 @@
 import sys
 
 from datetime import datetime, timedelta
+from os import environ
+from pathlib import Path
 from random import sample, uniform
 
 import pytest
 
 from pytz import utc
 
+from k1insights.backend.breaker import BREAKERS
 from k1insights.backend.clubspeed import RaceTypes, WinConditions
 from k1insights.common.db import K1DB
 
 
+@pytest.fixture(autouse=True)
+def reset_breakers():
+    # Failures in one test mustn't trip the circuit for the next
+    yield
+    BREAKERS.clear()
+
+
 @pytest.fixture()
 def blank_db(tmp_path, monkeypatch):
     db_path = tmp_path.joinpath("test.db")
@@ -137,8 +147,11 @@ def test_db(blank_db):
 
 
 @pytest.fixture()
-def test_client(test_db):
-    from k1insights.frontend import app
-
-    app.testing = True
-    return app.test_client()
+def test_client(test_db, tmp_path, monkeypatch):
+    import k1insights.frontend as frontend
+
+    # The frontend keeps whichever paths it was first imported with
+    monkeypatch.setattr(frontend, "DB_PATH", Path(environ["K1_DATA_DB"]))
+    monkeypatch.setattr(frontend, "CACHE_PATH", tmp_path.joinpath("test.cache"))
+    frontend.app.testing = True
+    return frontend.app.test_client()
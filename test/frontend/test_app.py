@@ -0,0 +1,30 @@
+from pathlib import Path
+from unittest.mock import patch
+
+
+@patch("k1insights.frontend.getpid")
+def test_open_db(mock_getpid, test_db, monkeypatch):
+    import k1insights.frontend as frontend
+
+    monkeypatch.setattr(frontend, "_CHECKED", set())
+    path = Path(test_db.execute("PRAGMA database_list").fetchone()["file"])
+
+    with patch.object(frontend.K1DB, "connect") as mock_connect:
+        # A fresh worker checks the database once, then trusts it
+        for pid in (1, 1, 2):
+            mock_getpid.return_value = pid
+            frontend.open_db(path)
+
+        assert [True, False, True] == [
+            c.kwargs["check"] for c in mock_connect.call_args_list
+        ]
+
+        # Nothing is remembered for a database that couldn't be opened
+        mock_connect.return_value = None
+        mock_getpid.return_value = 3
+        frontend.open_db(path)
+        frontend.open_db(path)
+
+        assert [True, True] == [
+            c.kwargs["check"] for c in mock_connect.call_args_list[-2:]
+        ]
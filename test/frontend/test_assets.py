@@ -0,0 +1,111 @@
+from gzip import decompress
+from json import loads
+from unittest.mock import Mock, patch
+
+import pytest
+
+
+def make_static(path):
+    path.joinpath("css").mkdir(parents=True)
+    path.joinpath("css", "main.css").write_text("body {}")
+    path.joinpath("css", "main.css.map").write_text("{}")
+
+
+@pytest.mark.parametrize("brotli", [False, True])
+def test_build_assets(brotli, blank_db, tmp_path):
+    from k1insights.frontend import assets
+    from k1insights.frontend.assets import build_assets
+
+    src = tmp_path / "static"
+    dest = src / "dist"
+    make_static(src)
+    dest.mkdir()
+    dest.joinpath("stale.css").write_text("")
+    mock_brotli = Mock()
+    mock_brotli.compress.return_value = b"brotli"
+
+    with patch.object(
+        assets,
+        "import_module",
+        side_effect=None if brotli else ImportError,
+        return_value=mock_brotli,
+    ):
+        result = build_assets(src, dest)
+
+    (hashed,) = result.values()
+    assert ["css/main.css"] == list(result)
+    assert hashed.startswith("css/main.") and hashed.endswith(".css")
+    assert result == loads((dest / "manifest.json").read_text())
+
+    # Earlier builds are cleared out, and maps keep their names
+    assert not dest.joinpath("stale.css").exists()
+    assert "{}" == dest.joinpath("css", "main.css.map").read_text()
+    assert b"body {}" == decompress(dest.joinpath(hashed + ".gz").read_bytes())
+    assert brotli == dest.joinpath(hashed + ".br").is_file()
+
+    # The same content always gets the same name
+    with patch.object(assets, "import_module", side_effect=ImportError):
+        assert result == build_assets(src, dest)
+
+
+def test_asset_url(blank_db, tmp_path, monkeypatch):
+    from k1insights.frontend import assets
+    from k1insights.frontend.assets import asset_url, build_assets, manifest
+
+    make_static(tmp_path / "static")
+    monkeypatch.setattr(assets, "MANIFEST", tmp_path / "missing.json")
+    manifest.cache_clear()
+
+    # Unbuilt files are served as they are
+    assert "/static/css/main.css" == asset_url("css/main.css")
+
+    monkeypatch.setattr(
+        assets, "MANIFEST", tmp_path / "static" / "dist" / "manifest.json"
+    )
+    built = build_assets(tmp_path / "static", tmp_path / "static" / "dist")
+
+    assert f"/static/dist/{built['css/main.css']}" == asset_url("css/main.css")
+    assert "/static/css/other.css" == asset_url("css/other.css")
+    manifest.cache_clear()
+
+
+@pytest.mark.parametrize(
+    "accept,encoding",
+    [("gzip, deflate, br", "br"), ("gzip, br;q=0", "gzip"), ("", None)],
+)
+def test_send_asset(accept, encoding, test_client, tmp_path, monkeypatch):
+    from k1insights.frontend import assets
+    from k1insights.frontend.assets import build_assets, manifest
+
+    dest = tmp_path / "static" / "dist"
+    make_static(tmp_path / "static")
+    monkeypatch.setattr(assets, "BUILD_DIR", dest)
+    monkeypatch.setattr(assets, "MANIFEST", dest / "manifest.json")
+    mock_brotli = Mock()
+    mock_brotli.compress.return_value = b"brotli"
+
+    with patch.object(assets, "import_module", return_value=mock_brotli):
+        hashed = build_assets(tmp_path / "static", dest)["css/main.css"]
+
+    with test_client as c:
+        res = c.get(f"/static/dist/{hashed}", headers={"Accept-Encoding": accept})
+
+        assert "200 OK" == res.status
+        assert "text/css" == res.mimetype
+        assert encoding == res.headers.get("Content-Encoding")
+        assert "Accept-Encoding" == res.headers["Vary"]
+        assert res.cache_control.immutable
+        assert 365 * 24 * 60 * 60 == res.cache_control.max_age
+
+        if encoding is None:
+            assert b"body {}" == res.data
+
+        # Pages link to the built file
+        assert f"/static/dist/{hashed}".encode() not in c.get("/").data
+        manifest.cache_clear()
+        monkeypatch.setitem(manifest(), "css/bootstrap.min.css", hashed)
+        assert f"/static/dist/{hashed}".encode() in c.get("/").data
+
+        assert "404 NOT FOUND" == c.get("/static/dist/css/missing.css").status
+
+    manifest.cache_clear()
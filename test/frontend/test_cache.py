@@ -0,0 +1,198 @@
+from unittest.mock import patch
+
+import pytest
+
+
+def test_result_cache(blank_db, tmp_path):
+    # The frontend package needs a database to import
+    from k1insights.frontend.cache import ResultCache
+
+    path = tmp_path / "results.cache"
+    first = ResultCache(path)
+    second = ResultCache(path)
+
+    assert first.get("key", 1) is None
+    first.set("key", 1, {"records": {1: [(2, 23.5)]}})
+
+    # Workers share whatever any of them computed, until the data moves on
+    assert {"records": {1: [(2, 23.5)]}} == second.get("key", 1)
+    assert second.get("key", 2) is None
+    assert second.get("other", 1) is None
+
+    first.close()
+    second.close()
+
+
+def test_result_cache_ttl(blank_db, tmp_path):
+    from k1insights.frontend import cache
+    from k1insights.frontend.cache import ResultCache
+
+    store = ResultCache(tmp_path / "results.cache", ttl=60)
+
+    with patch.object(cache, "time", return_value=1000):
+        store.set("key", 1, "value")
+
+    with patch.object(cache, "time", return_value=1059):
+        assert "value" == store.get("key", 1)
+
+    with patch.object(cache, "time", return_value=1060):
+        assert store.get("key", 1) is None
+
+        # Expired entries are cleared out by the next write
+        store.set("other", 1, "value")
+
+    assert [("other",)] == store._db.execute("SELECT key FROM results").fetchall()
+    store.close()
+
+
+def test_result_cache_lru(blank_db, tmp_path):
+    from k1insights.frontend import cache
+    from k1insights.frontend.cache import ResultCache
+
+    store = ResultCache(tmp_path / "results.cache", max_entries=2)
+
+    with patch.object(cache, "time", return_value=1000):
+        store.set("a", 1, "a")
+    with patch.object(cache, "time", return_value=1001):
+        store.set("b", 1, "b")
+    with patch.object(cache, "time", return_value=1002):
+        assert "a" == store.get("a", 1)
+    with patch.object(cache, "time", return_value=1003):
+        store.set("c", 1, "c")
+
+        # b went longest without being used
+        assert "a" == store.get("a", 1)
+        assert store.get("b", 1) is None
+        assert "c" == store.get("c", 1)
+
+    store.close()
+
+
+def test_keep(blank_db, tmp_path):
+    from k1insights.frontend import cache
+    from k1insights.frontend.cache import ResultCache
+
+    store = ResultCache(tmp_path / "results.cache", ttl=60)
+
+    with patch.object(cache, "time", return_value=1000):
+        store.set("old", 1, "old")
+        store.set("a", 2, "a")
+        store.set("b", 2, "b")
+        assert 2 == store.keep(2, 3600)
+
+    with patch.object(cache, "time", return_value=2000):
+        assert store.get("old", 1) is None
+        assert "a" == store.get("a", 2)
+        assert "b" == store.get("b", 2)
+
+    store.close()
+
+
+def test_popular(blank_db, tmp_path):
+    from k1insights.frontend.cache import ResultCache
+
+    store = ResultCache(tmp_path / "results.cache")
+
+    for page in ["a", "b", "b", "c", "c", "c"]:
+        store.count_view(page)
+
+    assert ["c", "b"] == store.popular(2)
+    assert ["c", "b", "a"] == store.popular(5)
+    store.close()
+
+
+def test_claim(blank_db, tmp_path):
+    from k1insights.frontend import cache
+    from k1insights.frontend.cache import ResultCache
+
+    first = ResultCache(tmp_path / "results.cache", ttl=60)
+    second = ResultCache(tmp_path / "results.cache", ttl=60)
+
+    with patch.object(cache, "time", return_value=1000):
+        assert first.claim("key")
+        assert not second.claim("key")
+        assert second.claim("other")
+
+    # Claims lapse along with the results they were taken out to compute
+    with patch.object(cache, "time", return_value=1060):
+        assert second.claim("key")
+
+    # A released claim can be taken again straight away
+    with patch.object(cache, "time", return_value=1060):
+        second.release("key")
+        assert first.claim("key")
+
+    first.close()
+    second.close()
+
+
+@pytest.mark.parametrize("scenario", ["hit", "miss", "stale"])
+def test_cached(scenario, blank_db, tmp_path):
+    from k1insights.frontend.cache import ResultCache
+
+    store = ResultCache(tmp_path / "results.cache")
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return {"value": len(calls)}
+
+    if scenario != "miss":
+        store.set("key", 1, {"value": 0})
+
+    result = store.cached("key", 2 if scenario == "stale" else 1, compute)
+
+    if scenario == "hit":
+        assert {"value": 0} == result
+        assert [] == calls
+    else:
+        assert {"value": 1} == result
+        assert {"value": 1} == store.get("key", 2 if scenario == "stale" else 1)
+
+    store.close()
+
+
+def test_get_cache(blank_db, tmp_path, monkeypatch):
+    from k1insights.frontend import cache
+    from k1insights.frontend.cache import get_cache
+
+    monkeypatch.setattr(cache, "_CACHES", {})
+
+    result = get_cache(tmp_path / "results.cache")
+
+    assert result is get_cache(tmp_path / "results.cache")
+    assert result is not get_cache(tmp_path / "other.cache")
+
+    for store in cache._CACHES.values():
+        store.close()
+
+
+def test_cached_views(test_db, test_client):
+    from k1insights.common.db import K1DB
+
+    heat = test_db.execute("select * from heats limit 1").fetchone()
+    session = {
+        "location": heat["location"],
+        "track": heat["track"],
+        "time": K1DB.from_epoch(heat["runtime"]),
+        "rid": 11,
+        "kart": 1,
+        "score": 1200,
+        "pos": 1,
+        "times": [(20.0, 1)],
+    }
+
+    with test_client as c, patch(
+        "k1insights.frontend.location.K1DB.location_top_karts",
+        wraps=K1DB.location_top_karts,
+    ) as query:
+        first = c.get("/locations/atlanta").data
+        assert first == c.get("/locations/atlanta").data
+        assert 1 == query.call_count
+
+        # New sessions move the watermark on, so the page is worked out again
+        K1DB.add_racer(test_db, 11, "Racer 11")
+        K1DB.add_sessions(test_db, session)
+
+        assert b"1 - 20.000" in c.get("/locations/atlanta").data
+        assert 2 == query.call_count
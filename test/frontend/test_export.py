@@ -0,0 +1,91 @@
+from json import dumps, loads
+from os import environ
+from pathlib import Path
+
+import pytest
+
+
+def add_session(db, kart):
+    from k1insights.common.db import K1DB
+
+    heat = db.execute("SELECT * FROM heats ORDER BY runtime DESC LIMIT 1").fetchone()
+    K1DB.add_racer(db, 11, "Racer 11")
+    K1DB.add_sessions(
+        db,
+        {
+            "location": heat["location"],
+            "track": heat["track"],
+            "time": K1DB.from_epoch(heat["runtime"]),
+            "rid": 11,
+            "kart": kart,
+            "score": 1200,
+            "pos": 1,
+            "times": [(20.0, 1)],
+        },
+    )
+
+
+def test_render_site(test_db, tmp_path):
+    from k1insights.frontend.export import MANIFEST, render_site
+
+    db_path = Path(environ["K1_DATA_DB"])
+    cache_path = tmp_path / "test.cache"
+    dest = tmp_path / "site"
+    karts = {
+        k for (k,) in test_db.execute("SELECT DISTINCT kart FROM sessions").fetchall()
+    }
+
+    # Everything is drawn the first time round
+    assert 2 + len(karts) == render_site(db_path, cache_path, dest)
+    assert (dest / "index.html").is_file()
+    assert (dest / "static" / "css" / "bootstrap.min.css").is_file()
+
+    html = (dest / "locations" / "atlanta" / "index.html").read_text()
+    assert "Showing" in html
+    assert "?until=" not in html
+
+    for kart in karts:
+        assert (dest / "locations" / "atlanta" / "karts" / str(kart)).is_dir()
+
+    # Only the index is redrawn while nothing changes
+    assert 1 == render_site(db_path, cache_path, dest)
+
+    # A new session redraws its kart and location, but no other karts
+    add_session(test_db, 42)
+    assert 3 == render_site(db_path, cache_path, dest)
+    assert (dest / "locations" / "atlanta" / "karts" / "42" / "index.html").is_file()
+
+    # Pages drawn on an earlier day are redrawn, and anything no longer listed
+    # is removed
+    manifest = loads((dest / MANIFEST).read_text())
+    manifest["pages"]["/locations/atlanta"] = "2022-01-01"
+    manifest["pages"]["/locations/atlanta/karts/99"] = "2022-01-01"
+    (dest / MANIFEST).write_text(dumps(manifest))
+    (dest / "locations" / "atlanta" / "karts" / "99").mkdir()
+    (dest / "locations" / "atlanta" / "karts" / "99" / "index.html").write_text("")
+
+    assert 2 == render_site(db_path, cache_path, dest)
+    assert not (dest / "locations" / "atlanta" / "karts" / "99" / "index.html").exists()
+
+    assert 3 + len(karts) == render_site(db_path, cache_path, dest, full=True)
+
+
+@pytest.mark.parametrize("manifest", ["", "[]", '{"watermark": "x"}'])
+def test_read_manifest(manifest, blank_db, tmp_path):
+    from k1insights.frontend.export import MANIFEST, read_manifest
+
+    (tmp_path / MANIFEST).write_text(manifest)
+
+    result = read_manifest(tmp_path)
+
+    assert {} == result["pages"]
+
+
+def test_render_site_no_db(blank_db, tmp_path):
+    from k1insights.frontend.export import render_site
+
+    db_path = tmp_path / "bad.db"
+    db_path.write_text("not a database")
+
+    assert 0 == render_site(db_path, tmp_path / "test.cache", tmp_path / "site")
+    assert not (tmp_path / "site").exists()
@@ -0,0 +1,155 @@
+from datetime import datetime
+from pathlib import Path
+from sqlite3 import OperationalError
+from unittest.mock import Mock, patch
+
+import pytest
+
+from k1insights.common.constants import LOCATIONS
+
+
+def test_today_rows(test_db):
+    from k1insights.frontend.live import today_rows
+
+    loc = LOCATIONS["atlanta"]
+    today = datetime.now(loc["tz"]).date()
+    result = today_rows(test_db, loc, today)
+
+    assert all([row["date"] == today.isoformat() for row in result])
+    assert all([1 <= len(row["karts"]) <= 5 for row in result])
+
+
+@patch("k1insights.frontend.live.LIVE_KEEPALIVE", 0)
+def test_subscribe(test_db, tmp_path):
+    from k1insights.common.db import K1DB
+    from k1insights.frontend.cache import ResultCache
+    from k1insights.frontend.live import LiveFeed
+
+    feed = LiveFeed(Mock(), Path(), tmp_path / "test.cache")
+    cache = ResultCache(tmp_path / "test.cache")
+    feed.refresh(test_db, cache)
+
+    stream = feed.subscribe("atlanta", timeout=60)
+    assert next(stream).startswith("retry: ")
+
+    # Whatever is already known is sent straight away
+    event = next(stream)
+    assert event.startswith('event: row\ndata: {"track":1,"date":')
+
+    # Nothing new means nothing more than a keepalive
+    assert ": keepalive\n\n" == next(stream)
+
+    # A new session only resends the row if it changed
+    heat = test_db.execute("SELECT * FROM heats ORDER BY runtime DESC").fetchone()
+    K1DB.add_racer(test_db, 11, "Racer 11")
+    K1DB.add_sessions(
+        test_db,
+        {
+            "location": heat["location"],
+            "track": heat["track"],
+            "time": K1DB.from_epoch(heat["runtime"]),
+            "rid": 11,
+            "kart": 42,
+            "score": 1200,
+            "pos": 1,
+            "times": [(10.0, 1)],
+        },
+    )
+    feed.refresh(test_db, cache)
+    event = next(stream)
+
+    assert "[42,10.0]" in event
+    assert ": keepalive\n\n" == next(stream)
+
+    # Streams end on their own, for the browser to reconnect
+    assert [] == list(feed.subscribe("atlanta", timeout=0))[1:]
+    cache.close()
+
+
+@pytest.mark.parametrize("scenario", ["good", "locked", "no-db"])
+@patch("k1insights.frontend.live.sleep")
+@patch("k1insights.frontend.live.K1DB")
+def test_poll(mock_k1db, mock_sleep, scenario, blank_db, tmp_path):
+    from k1insights.frontend.live import LiveFeed
+
+    mock_logger = Mock()
+    mock_sleep.side_effect = [None, StopIteration]
+    feed = LiveFeed(mock_logger, Path(), tmp_path / "test.cache")
+
+    if scenario == "no-db":
+        mock_k1db.connect.return_value = None
+    elif scenario == "locked":
+        mock_k1db.watermark.side_effect = OperationalError("database is locked")
+    else:
+        mock_k1db.watermark.return_value = 10
+        mock_k1db.location_top_karts.return_value = []
+
+    if scenario == "no-db":
+        feed.poll()
+        mock_sleep.assert_not_called()
+    else:
+        with pytest.raises(StopIteration):
+            feed.poll()
+
+        assert 2 == mock_k1db.watermark.call_count
+
+    if scenario == "locked":
+        assert 2 == mock_logger.warning.call_count
+    elif scenario == "good":
+        # The rows are only worked out when the watermark moves
+        assert 1 == mock_k1db.location_top_karts.call_count
+        assert 10 == feed._watermark
+
+
+@patch("k1insights.frontend.live.Thread")
+def test_start(mock_thread, blank_db):
+    from k1insights.frontend.live import LiveFeed
+
+    feed = LiveFeed(Mock(), Path(), Path())
+    feed.start()
+    feed.start()
+
+    mock_thread.assert_called_once_with(target=feed.poll, name="k1-live", daemon=True)
+    mock_thread.return_value.start.assert_called_once()
+
+
+def test_get_feed(blank_db, monkeypatch):
+    from k1insights.frontend import live
+    from k1insights.frontend.live import get_feed
+
+    monkeypatch.setattr(live, "_FEEDS", {})
+
+    result = get_feed(Mock(), Path("a.db"), Path("a.cache"))
+
+    assert result is get_feed(Mock(), Path("a.db"), Path("a.cache"))
+    assert result is not get_feed(Mock(), Path("b.db"), Path("a.cache"))
+
+
+@patch("k1insights.frontend.open_db")
+@patch("k1insights.frontend.live.LiveFeed.subscribe")
+@patch("k1insights.frontend.live.LiveFeed.start")
+def test_live_view(mock_start, mock_subscribe, mock_open_db, test_client):
+    mock_subscribe.return_value = iter([": keepalive\n\n"])
+
+    with test_client as c:
+        res = c.get("/locations/atlanta/live")
+        # Streams never touch the database, so they don't open it either
+        mock_open_db.assert_not_called()
+
+        assert "200 OK" == res.status
+        assert "text/event-stream" == res.mimetype
+        assert "no-cache" == res.headers["Cache-Control"]
+        assert b": keepalive\n\n" == res.data
+
+        assert "404 NOT FOUND" == c.get("/locations/moscow/live").status
+
+    mock_start.assert_called_once()
+    mock_subscribe.assert_called_once_with("atlanta")
+
+
+def test_live_script(test_client):
+    with test_client as c:
+        assert b"EventSource" in c.get("/locations/atlanta").data
+
+        # Older pages never change, so they aren't kept up to date
+        assert b"EventSource" not in c.get("/locations/atlanta?until=2022-01-01").data
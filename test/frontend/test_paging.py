@@ -0,0 +1,50 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from pytz import utc
+
+
+@pytest.mark.parametrize(
+    "args, status, cells, older, newer",
+    [
+        ["", "200 OK", 15, None, None],
+        ["?since=garbage", "200 OK", 15, None, None],
+        ["?since={d1}", "200 OK", 10, "?until={d2}", None],
+        ["?until={d1}", "200 OK", 10, None, "?since={d0}"],
+        ["?since={d10}", "200 OK", 0, None, "?since={d2}"],
+        ["?since={d1}&until={d1}", "200 OK", 5, "?until={d2}", "?since={d0}"],
+        ["?since={d0}&until={d1}", "400 BAD REQUEST", 0, None, None],
+        ["?until=0001-01-01", "400 BAD REQUEST", 0, None, None],
+    ],
+)
+def test_location_paging(args, status, cells, older, newer, test_client):
+    today = datetime.now(utc).date()
+    days = {f"d{i}": (today - timedelta(days=i)).isoformat() for i in range(11)}
+
+    with test_client as c:
+        res = c.get(f"/locations/atlanta{args.format(**days)}")
+        html = res.data.decode()
+
+        assert status == res.status
+
+        if status == "200 OK":
+            assert cells == html.count("/td")
+            assert (older is not None) == ("Older" in html)
+            assert (newer is not None) == ("Newer" in html)
+
+            for link in filter(None, [older, newer]):
+                assert f'href="{link.format(**days)}"' in html
+
+
+def test_kart_paging(test_db, test_client):
+    yday = (datetime.now(utc) - timedelta(days=1)).date().isoformat()
+    kart = test_db.execute("select kart from sessions").fetchone()[0]
+
+    with test_client as c:
+        res = c.get(f"/locations/atlanta/karts/{kart}?until={yday}")
+        html = res.data.decode()
+
+        assert "200 OK" == res.status
+        assert "Newer" in html
+        assert "Older" not in html
@@ -0,0 +1,166 @@
+from os import environ
+from pathlib import Path
+from sqlite3 import OperationalError
+from time import time
+from unittest.mock import call, patch
+
+import pytest
+
+
+def test_warm_pages(test_client, tmp_path):
+    from k1insights.frontend import CACHE_PATH
+    from k1insights.frontend.cache import ResultCache
+    from k1insights.frontend.warm import warm_pages
+
+    db_path = Path(environ["K1_DATA_DB"])
+
+    with test_client as c:
+        assert "200 OK" == c.get("/locations/atlanta/karts/1").status
+        assert "200 OK" == c.get("/locations/atlanta/karts/1?since=2022-01-01").status
+        assert "200 OK" == c.get("/locations/atlanta/karts/2").status
+        assert "404 NOT FOUND" == c.get("/locations/atlanta/karts/x").status
+
+    store = ResultCache(CACHE_PATH)
+    assert ["/locations/atlanta/karts/1"] == store.popular(1)
+    store.count_view("/locations/moscow/karts/1")
+    store._db.execute("DELETE FROM results")
+    store._db.commit()
+
+    assert 3 == warm_pages(db_path, CACHE_PATH, 5)
+
+    rows = store._db.execute("SELECT key, expires FROM results").fetchall()
+    keys = {row[0] for row in rows}
+    assert 3 == len(keys)
+    # Nothing warmed expires before the data changes under it
+    assert all(row[1] > time() + 24 * 60 * 60 for row in rows)
+    assert 1 == len([k for k in keys if k.startswith("location:atlanta:")])
+    assert 2 == len([k for k in keys if k.startswith("kart:atlanta:")])
+
+    # Warming the same data twice does nothing, whoever asks
+    assert 0 == warm_pages(db_path, CACHE_PATH, 5)
+    store.close()
+
+
+def test_warm_pages_failed(test_client):
+    from k1insights.frontend import CACHE_PATH
+    from k1insights.frontend.warm import warm_pages
+
+    db_path = Path(environ["K1_DATA_DB"])
+
+    with patch("k1insights.frontend.warm.render_pages", side_effect=RuntimeError):
+        with pytest.raises(RuntimeError):
+            warm_pages(db_path, CACHE_PATH, 5)
+
+    # The failed attempt gave up its claim, so the next one does the work
+    assert 1 <= warm_pages(db_path, CACHE_PATH, 5)
+
+
+def test_warm_pages_no_db(blank_db, tmp_path):
+    from k1insights.frontend.warm import warm_pages
+
+    db_path = tmp_path / "bad.db"
+    db_path.write_text("not a database")
+
+    assert 0 == warm_pages(db_path, tmp_path / "test.cache")
+
+
+@pytest.mark.parametrize("static", [False, True])
+@patch("k1insights.frontend.warm.sleep")
+@patch("k1insights.frontend.warm.render_site")
+@patch("k1insights.frontend.warm.warm_pages")
+def test_keep_warm(mock_warm, mock_render, mock_sleep, static, test_db, tmp_path):
+    from k1insights.frontend.warm import K1DB, WARM_INTERVAL, keep_warm
+
+    db_path = Path(environ["K1_DATA_DB"])
+    cache_path = tmp_path / "test.cache"
+    static_path = tmp_path / "site" if static else None
+    mock_sleep.side_effect = [None, None, None, None, KeyboardInterrupt]
+
+    with patch.object(K1DB, "watermark") as mock_watermark:
+        mock_watermark.side_effect = [
+            10,
+            10,
+            OperationalError("database is locked"),
+            12,
+            12,
+        ]
+
+        with pytest.raises(KeyboardInterrupt):
+            keep_warm(db_path, cache_path, static_path)
+
+    # Only a watermark that's moved on is worth warming for
+    assert [call(db_path, cache_path)] * 2 == mock_warm.call_args_list
+    assert ([call(db_path, cache_path, static_path)] * 2 if static else []) == (
+        mock_render.call_args_list
+    )
+    mock_sleep.assert_called_with(WARM_INTERVAL)
+
+    # Other workers leave the rendering to whoever got there first
+    mock_sleep.side_effect = [KeyboardInterrupt]
+
+    with patch.object(K1DB, "watermark", return_value=12):
+        with pytest.raises(KeyboardInterrupt):
+            keep_warm(db_path, cache_path, static_path)
+
+    assert 3 == mock_warm.call_count
+    assert (2 if static else 0) == mock_render.call_count
+
+
+@patch("k1insights.frontend.warm.sleep")
+@patch("k1insights.frontend.warm.render_site")
+@patch("k1insights.frontend.warm.warm_pages")
+def test_keep_warm_failed(
+    mock_warm, mock_render, mock_sleep, test_db, tmp_path, caplog
+):
+    from k1insights.frontend.warm import K1DB, keep_warm
+
+    db_path = Path(environ["K1_DATA_DB"])
+    cache_path = tmp_path / "test.cache"
+    static_path = tmp_path / "site"
+    mock_sleep.side_effect = [None, None, None, KeyboardInterrupt]
+    mock_warm.side_effect = [RuntimeError("warming"), 0, 0]
+    mock_render.side_effect = [RuntimeError("rendering"), None]
+
+    with patch.object(K1DB, "watermark", return_value=10):
+        with pytest.raises(KeyboardInterrupt):
+            keep_warm(db_path, cache_path, static_path)
+
+    # Each failure is logged and tried again on the next look, with the render
+    # claim given back so it can be taken again
+    assert 3 == mock_warm.call_count
+    assert 2 == mock_render.call_count
+    assert 2 == caplog.text.count("Cache warming failed, trying again later")
+    assert "RuntimeError: warming" in caplog.text
+    assert "RuntimeError: rendering" in caplog.text
+
+
+@patch("k1insights.frontend.warm.sleep")
+def test_keep_warm_no_db(mock_sleep, blank_db, tmp_path):
+    from k1insights.frontend.warm import keep_warm
+
+    db_path = tmp_path / "bad.db"
+    db_path.write_text("not a database")
+
+    keep_warm(db_path, tmp_path / "test.cache", None)
+    mock_sleep.assert_not_called()
+
+
+@patch("k1insights.frontend.warm.Thread")
+def test_post_worker_init(mock_thread, blank_db):
+    from k1insights.frontend.warm import (
+        CACHE_PATH,
+        DB_PATH,
+        STATIC_PATH,
+        keep_warm,
+        post_worker_init,
+    )
+
+    post_worker_init(None)
+
+    mock_thread.assert_called_once_with(
+        target=keep_warm,
+        args=(DB_PATH, CACHE_PATH, STATIC_PATH),
+        name="k1-warm",
+        daemon=True,
+    )
+    mock_thread.return_value.start.assert_called_once()
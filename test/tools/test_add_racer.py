@@ -3,16 +3,22 @@ from unittest.mock import patch
 
 import pytest
 
+from k1insights.common.batch import SessionBatch
+
 
 @pytest.mark.parametrize("scenario", ["bad-start", "good-start", "no-start"])
 @patch("k1insights.tools.add_racer.exit")
 @patch("k1insights.tools.add_racer.K1DB")
 @patch("k1insights.tools.add_racer.get_racer_data")
+@patch("k1insights.tools.add_racer.history_locations")
 @patch("k1insights.tools.add_racer.getLogger")
-def test_main(mock_logger, mock_get_data, mock_k1db, mock_exit, scenario, blank_db):
+def test_main(
+    mock_logger, mock_locations, mock_get_data, mock_k1db, mock_exit, scenario, blank_db
+):
     from k1insights.tools.add_racer import main
 
     args = ["123"]
+    mock_locations.return_value = ([], scenario == "no-start")
 
     if scenario == "bad-start":
         args.extend(["-s", "1234-56-78", "-f"])
@@ -22,45 +28,32 @@ def test_main(mock_logger, mock_get_data, mock_k1db, mock_exit, scenario, blank_
         mock_get_data.return_value = None
 
     else:
-        mock_get_data.return_value = {
-            "sessions": [
+        batch = SessionBatch()
+        batch.add_heat(
+            {
+                "location": "Atlanta",
+                "heat_no": 1,
+                "track": 1,
+                "time": datetime(2022, 1, 1),
+                "race_type": 0,
+                "win_cond": 0,
+            },
+            [
                 {
-                    "kart": 1,
-                    "location": "Atlanta",
+                    "name": "Test Racer",
+                    "rid": 123,
                     "pos": 1,
                     "score": 1212,
-                    "time": datetime(2022, 1, 1),
-                    "times": [
-                        (36.173, 5),
-                        (37.703, 11),
-                        (45.985, 11),
-                        (27.234, 4),
-                        (24.194, 1),
-                    ],
-                    "track": 1,
-                    "type": 0,
-                    "win_cond": 0,
-                },
-                {
-                    "kart": 2,
-                    "location": "Atlanta",
-                    "pos": 2,
-                    "score": 1234,
-                    "time": datetime(2022, 1, 2),
-                    "times": [
-                        (52.668, 4),
-                        (24.421, 1),
-                        (24.963, 2),
-                        (24.06, 2),
-                        (24.711, 2),
-                    ],
-                    "track": 1,
-                    "type": 0,
-                    "win_cond": 0,
-                },
+                    "lap_data": [(36.173, 5), (37.703, 11), (24.194, 1)],
+                }
             ],
+            {123: 1},
+        )
+        mock_get_data.return_value = {
+            "batch": batch,
             "rid": 123,
             "name": "Test Racer",
+            "locations": ["Atlanta"],
         }
 
     try:
@@ -75,3 +68,13 @@ def test_main(mock_logger, mock_get_data, mock_k1db, mock_exit, scenario, blank_
         mock_exit.assert_called_once_with(1)
     elif scenario == "no-start":
         mock_exit.assert_called_once_with(0)
+        (_, rid, locations, swept) = mock_k1db.add_racer_locations.call_args.args
+        assert (123, ["Atlanta"]) == (rid, locations)
+        assert swept is not None
+
+        mock_k1db.add_heats.assert_called_once_with(
+            mock_k1db.connect.return_value, batch.heats
+        )
+        mock_k1db.add_session_batch.assert_called_once_with(
+            mock_k1db.connect.return_value, batch
+        )
@@ -0,0 +1,18 @@
+from unittest.mock import patch
+
+
+@patch("k1insights.tools.build_assets.compressors")
+@patch("k1insights.tools.build_assets.build_assets")
+@patch("k1insights.tools.build_assets.getLogger")
+def test_main(mock_logger, mock_build, mock_compressors, blank_db):
+    from k1insights.tools.build_assets import BUILD_DIR, main
+
+    mock_build.return_value = {"css/main.css": "css/main.0123456789ab.css"}
+    mock_compressors.return_value = {"gzip": None, "br": None}
+
+    main([])
+
+    mock_build.assert_called_once_with()
+    mock_logger.return_value.info.assert_called_once_with(
+        "Built %s asset(s) into %s, compressed with %s", 1, BUILD_DIR, "br, gzip"
+    )
@@ -0,0 +1,28 @@
+from unittest.mock import patch
+
+import pytest
+
+
+@pytest.mark.parametrize("scenario", ["dest", "env", "none"])
+@patch("k1insights.tools.render_static.exit")
+@patch("k1insights.tools.render_static.render_site")
+def test_main(mock_render, mock_exit, scenario, blank_db, tmp_path):
+    from k1insights.tools.render_static import CACHE_PATH, DB_PATH, main
+
+    args = [str(tmp_path / "site"), "-f"] if scenario == "dest" else []
+    static_path = tmp_path / "site" if scenario == "env" else None
+
+    with patch("k1insights.tools.render_static.STATIC_PATH", static_path):
+        main(args)
+
+    if scenario == "none":
+        mock_render.assert_not_called()
+        mock_exit.assert_called_once_with(1)
+    else:
+        mock_render.assert_called_once_with(
+            DB_PATH,
+            CACHE_PATH,
+            tmp_path / "site",
+            scenario == "dest",
+        )
+        mock_exit.assert_called_once_with(0)
@@ -0,0 +1,109 @@
+from base64 import b64encode
+from json import dumps
+from os import environ
+from pathlib import Path
+from unittest.mock import patch
+
+import pytest
+
+from k1insights.backend.archive import PageArchive
+
+
+DATA = Path(__file__).parents[1] / "data"
+HISTORY_URL = (
+    "https://k1atlanta.clubspeedtiming.com/sp_center/RacerHistory.aspx?CustID={}"
+)
+SIGNALR_URL = "https://k1atlanta.clubspeedtiming.com/SP_Center/signalr"
+HEAT_URL = "https://k1atlanta.clubspeedtiming.com/sp_center/HeatDetails.aspx?HeatNo={}"
+
+
+def make_archive(path):
+    store = PageArchive(path)
+
+    for (heat_no, name) in [(158727, "standard"), (159850, "junior"), (0, "unk_type")]:
+        store.store(
+            "HeatParser",
+            "Atlanta",
+            HEAT_URL.format(heat_no),
+            (DATA / f"{name}.html").read_text(),
+        )
+
+    store.store(
+        "HistoryParser",
+        "Atlanta",
+        HISTORY_URL.format(b64encode(b"6305759").decode()),
+        (DATA / "history.html").read_text(),
+    )
+    # Pages from locations no longer configured are skipped
+    store.store("HeatParser", "Nowhere", HEAT_URL.format(1), "<html>")
+    store.store("HistoryParser", "Nowhere", HISTORY_URL.format("MQ=="), "<html>")
+    # Heats recorded live have no history page, only the scoreboard's karts
+    store.store(
+        "Scoreboard",
+        "Atlanta",
+        SIGNALR_URL,
+        dumps([{"CustID": "23252174", "HeatNo": "159850", "AutoNo": "7"}]),
+    )
+    store.close()
+
+
+def test_parse_page(tmp_path, blank_db):
+    from k1insights.tools.reparse import parse_page
+
+    make_archive(tmp_path / "archive.db")
+    store = PageArchive(tmp_path / "archive.db")
+    results = [parse_page(p) for p in store.pages()]
+    store.close()
+
+    assert [1, 2, 3, 4, 5, 6, 7] == [r["id"] for r in results]
+    assert [True, True, False, True, False, False, True] == [
+        r["data"] is not None for r in results
+    ]
+    assert 158727 == results[0]["data"]["heat_id"]
+    assert "HeatParser" == results[2]["parser"]
+    assert HEAT_URL.format(0) == results[2]["url"]
+    assert results[2]["error"].startswith("ValueError: Unknown race type")
+    assert [None, None] == [r["error"] for r in results[4:6]]
+    assert [(159850, 23252174, 7)] == results[6]["data"]
+
+    unknown = parse_page({**results[0], "parser": "LapParser", "body": b""})
+    assert "no parser named LapParser" == unknown["error"]
+
+
+@pytest.mark.parametrize("scenario", ["good", "no-archive"])
+@patch("k1insights.tools.reparse.exit")
+def test_main(mock_exit, scenario, tmp_path, blank_db, caplog):
+    from k1insights.tools.reparse import main
+
+    archive_path = tmp_path / "archive.db"
+
+    if scenario == "good":
+        make_archive(archive_path)
+
+    with patch("k1insights.tools.reparse.DB_PATH", Path(environ["K1_DATA_DB"])):
+        main([str(archive_path), "-j", "2"])
+
+    if scenario == "good":
+        mock_exit.assert_called_once_with(0)
+
+        heats = blank_db.execute(
+            "SELECT location, heat_no FROM heats ORDER BY heat_no"
+        ).fetchall()
+        assert [("Atlanta", 158727), ("Atlanta", 159850)] == [tuple(h) for h in heats]
+
+        sessions = blank_db.execute(
+            "SELECT rid, kart FROM sessions ORDER BY rid"
+        ).fetchall()
+        assert [(6305759, 4), (23252174, 7)] == [tuple(s) for s in sessions]
+
+        racers = blank_db.execute("SELECT COUNT(*) FROM racers").fetchone()[0]
+        assert 8 == racers
+
+        # The page that couldn't be parsed is named, not just counted
+        assert f"Could not reparse page 3 (HeatParser, {HEAT_URL.format(0)})" in (
+            caplog.text
+        )
+        assert "Reparsed 7 page(s), 2 skipped, 1 failed" in caplog.text
+
+    else:
+        mock_exit.assert_called_once_with(1)